@@ -0,0 +1,58 @@
+"""
+Benchmark of the vectorized backtest against the reference TradeStrategy run on
+synthetic slots, checking that both give the same profit. Needs numpy.
+
+Run with: PYTHONPATH=src python benchmarks/backtest_bench.py
+"""
+
+import random
+import time
+
+from bot.backtest import ParameterGrid, RecordedSlot, evaluate_grid, run_reference
+from bot.book_recorder import BookSnapshot
+
+SLOTS = 200
+REFERENCE_SLOTS = 5
+SLOT_SECONDS = 900
+
+
+def make_slot(rng: random.Random, start: int) -> RecordedSlot:
+    snapshots = []
+    mid = 0.5
+    ts = start - 1.0
+    while ts < start + SLOT_SECONDS:
+        ts += rng.expovariate(1 / 0.7)
+        mid = min(0.97, max(0.03, mid + rng.gauss(0, 0.02)))
+        for token, price in ((0, mid), (1, 1 - mid)):
+            spread = rng.choice([0.01, 0.02, 0.03])
+            bids = [(round(price - spread - i * 0.01, 2), rng.uniform(1, 30)) for i in range(8)]
+            asks = [(round(price + spread + i * 0.01, 2), rng.uniform(1, 30)) for i in range(8)]
+            snapshots.append(BookSnapshot(
+                ts, token, [level for level in bids if level[0] > 0], [level for level in asks if level[0] < 1],
+            ))
+    slot = RecordedSlot(start, f"0x{start:x}", snapshots, 0)
+    slot.winner = slot.infer_winner()
+    return slot
+
+
+if __name__ == "__main__":
+    rng = random.Random(1)
+    slots = [make_slot(rng, 1_700_000_000 + i * SLOT_SECONDS) for i in range(SLOTS)]
+    grid = ParameterGrid([5, 10, 20], [0.98, 1.0, 1.02, 1.05], [1.5, 2.5], [0.5, 2.0], [1, 2], [1, 5])
+    params = grid.combinations()
+
+    started = time.perf_counter()
+    result = evaluate_grid(slots, grid, SLOT_SECONDS)
+    elapsed = time.perf_counter() - started
+    runs = len(slots) * len(params)
+    print(f"vectorized: {len(slots)} slots x {len(params)} params in {elapsed:.2f}s ({runs / elapsed:,.0f} runs/s)")
+
+    started = time.perf_counter()
+    mismatches = 0
+    for slot_idx, slot in enumerate(slots[:REFERENCE_SLOTS]):
+        for param_idx, p in enumerate(params):
+            profit, _ = run_reference(slot, p, SLOT_SECONDS)
+            mismatches += profit != result.profit[slot_idx, param_idx]
+    elapsed = time.perf_counter() - started
+    runs = REFERENCE_SLOTS * len(params)
+    print(f"reference:  {runs / elapsed:,.0f} runs/s, {mismatches} mismatches in {runs} runs")
@@ -0,0 +1,283 @@
+"""
+End-to-end benchmark of main() against local stand-ins of the CLOB REST and market
+websocket APIs, the Gamma API, the subgraph and a Polygon node (see fake_servers.py).
+
+The real ClobSession, Market, MarketFinder, MarketQL, AccountManager and settlement
+code run over HTTP against servers backed by a SimExchange, while a SimClock lets
+slots pass as fast as the bot can trade them. Every scenario reports tick, order and
+book latency percentiles, orders per second of wall time, requests per slot to each
+service and the round trip of a market channel update into the book, and the results
+are written as JSON so two runs can be diffed.
+
+Run with: PYTHONPATH=src:. python benchmarks/e2e_bench.py [--slots N] [--out e2e.json] [scenario ...]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional
+
+from fake_servers import FakeServices
+
+from bot.account_manager import AccountManager
+from bot.book_recorder import BookSnapshot
+from bot.clob_session import ClobSession
+from bot.config import Config
+from bot.market_finder import MarketFinder
+from bot.market_ql import MarketQL
+from bot.market_stream import MarketStream
+from bot.metrics import Histogram, metrics
+from bot.rate_limit import limits
+from bot.settlement import SettlementWorker
+from bot.simulator import SimClock, SimExchange, SimSlot, synthetic_slots
+from main import main
+
+PK = "0x" + "11" * 32
+SLOT_MINUTES = 15
+SLOT_SECONDS = SLOT_MINUTES * 60
+USDC = 1000.0
+# The slot open rush: a book update every RUSH_INTERVAL seconds for the first RUSH_SECONDS of a slot
+RUSH_SECONDS = 30
+RUSH_INTERVAL = 0.05
+# Thin books keep this fraction of the synthetic sizes, mostly below ORDER_SIZE per level
+THIN_FACTOR = 0.1
+STREAM_UPDATES = 2000
+# Histogram buckets 10% apart from 50 us to 10 s, fine enough for percentiles worth diffing
+BUCKETS = tuple(50e-6 * 1.1 ** i for i in range(129))
+TIMERS = (("tick", ()), ("order_sign", ()), ("order_post", (("side", "up"),)), ("order_post", (("side", "down"),)),
+          ("book_fetch", (("source", "rest"),)))
+
+ENV = {
+    "CHAIN_ID": "137",
+    "ORDER_SIZE": "5",
+    "INIT_INTERVAL": "0.5",
+    "TRADE_INTERVAL": "0.5",
+    "TAKE_PROFIT_THRESHOLD": "0.5",
+    "PAIR_DIFFERENCE_THRESHOLD": "2.5",
+    "MAX_INIT_COMBINED_PRICE": "1.05",
+    "MIN_USDC_BALANCE": "20",
+    "DRY_MODE": "0",
+    "USDC_ADDRESS": "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174",
+    "CTF_ADDRESS": "0x4D97DCd97eC945f40cF65F87097ACe5EA0476045",
+    "FEE_MODULE_ADDRESS": "0x56C79347e95530c01A2FC76E732f9566dA16E113",
+    "CTF_EXCHANGE_ADDRESS": "0x4bFb41d5B3570DeFd03C39a9A4D8dE6Bd8B8982E",
+    "SLOT_MINUTES": str(SLOT_MINUTES),
+    "FILL_CONFIRM_TIMEOUT": "10",
+}
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    # (first_start, count, seed) -> slots
+    slots: Callable[[int, int, int], List[SimSlot]]
+    resolution_delay: float = 60.0
+
+
+def plain_slots(first_start: int, count: int, seed: int) -> List[SimSlot]:
+    return synthetic_slots(first_start, count, SLOT_SECONDS, seed)
+
+
+def rush_slots(first_start: int, count: int, seed: int) -> List[SimSlot]:
+    """
+    Synthetic slots whose first RUSH_SECONDS bring deep, tight books changing every
+    RUSH_INTERVAL, so the bot opens both legs and keeps averaging down at once.
+    """
+    rng = random.Random(seed)
+    slots = []
+    for slot in plain_slots(first_start, count, seed):
+        rush_end = slot.start + RUSH_SECONDS
+        snapshots = []
+        mid = 0.5
+        ts = slot.start - 1.0
+        while ts < rush_end:
+            ts += RUSH_INTERVAL
+            mid = min(0.9, max(0.1, mid + rng.gauss(0, 0.01)))
+            for token, price in ((0, mid), (1, 1 - mid)):
+                bids = [(round(price - 0.01 * (i + 1), 2), round(rng.uniform(20, 200), 2)) for i in range(8)]
+                asks = [(round(price + 0.01 * i, 2), round(rng.uniform(20, 200), 2)) for i in range(8)]
+                snapshots.append(BookSnapshot(ts, token, bids, asks))
+        snapshots += [snapshot for snapshot in slot.snapshots if snapshot.ts >= rush_end]
+        slots.append(replace(slot, snapshots=snapshots))
+    return slots
+
+
+def thin_slots(first_start: int, count: int, seed: int) -> List[SimSlot]:
+    """
+    Synthetic slots with every level cut to THIN_FACTOR of its size, so orders have
+    to sweep several levels and many cannot be filled at all.
+    """
+    return [replace(slot, snapshots=[
+        BookSnapshot(snapshot.ts, snapshot.token,
+                     [(price, round(size * THIN_FACTOR, 2)) for price, size in snapshot.bids],
+                     [(price, round(size * THIN_FACTOR, 2)) for price, size in snapshot.asks])
+        for snapshot in slot.snapshots
+    ]) for slot in plain_slots(first_start, count, seed)]
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("baseline", "synthetic random walk books", plain_slots),
+    Scenario("slot_open_rush", f"an update every {RUSH_INTERVAL}s in the first {RUSH_SECONDS}s of each slot",
+             rush_slots),
+    Scenario("thin_books", f"book sizes cut to {THIN_FACTOR:.0%}", thin_slots),
+    Scenario("delayed_resolution", "conditions resolve two slots after they end", plain_slots,
+             resolution_delay=2 * SLOT_SECONDS),
+)}
+
+
+def reset_metrics() -> None:
+    metrics.counters.clear()
+    metrics.histograms.clear()
+    for key in TIMERS:
+        metrics.histograms[key] = Histogram(BUCKETS)
+
+
+def percentiles(histogram: Optional[Histogram]) -> Dict[str, float]:
+    """
+    Count, mean and percentiles of a histogram in milliseconds, up to 10% above the true value.
+    """
+    if histogram is None or not histogram.count:
+        return {"count": 0}
+    return {
+        "count": histogram.count,
+        "mean_ms": round(histogram.sum / histogram.count * 1000, 3),
+        "p50_ms": round(histogram.quantile(0.5) * 1000, 3),
+        "p90_ms": round(histogram.quantile(0.9) * 1000, 3),
+        "p99_ms": round(histogram.quantile(0.99) * 1000, 3),
+        "max_ms": round(histogram.max * 1000, 3),
+    }
+
+
+def seed_creds(path: str) -> None:
+    """
+    Cache API credentials where ClobSession looks first, so it does not derive them from the fake CLOB.
+    """
+    with open(path, "w") as f:
+        json.dump({
+            "api_key": "00000000-0000-0000-0000-000000000000",
+            "api_secret": base64.urlsafe_b64encode(b"e2e-bench-secret").decode(),
+            "api_passphrase": "e2e",
+            "expires_at": time.time() + 24 * 3600,
+        }, f)
+
+
+def stream_latency(services: FakeServices, token_ids: List[str], updates: int) -> Dict[str, float]:
+    """
+    Publish book messages on the fake market channel and time each until MarketStream has applied it.
+    """
+    stream = MarketStream(services.market_channel.url, token_ids, lambda token_id: None)
+    stream.start()
+    try:
+        deadline = time.perf_counter() + 10
+        while not all(stream.is_synced(token_id) for token_id in token_ids):
+            if time.perf_counter() > deadline:
+                return {"count": 0}
+            time.sleep(0.01)
+        histogram = Histogram(BUCKETS)
+        version = stream.version
+        started = time.perf_counter()
+        for i in range(updates):
+            sent = time.perf_counter()
+            services.market_channel.publish([token_ids[i % len(token_ids)]])
+            version = stream.wait_for_update(version, 1.0)
+            histogram.observe(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - started
+    finally:
+        stream.stop()
+    return {**percentiles(histogram), "updates_per_sec": round(updates / elapsed, 1)}
+
+
+def run_scenario(scenario: Scenario, slot_count: int, seed: int) -> dict:
+    slots = scenario.slots(int(time.time()) // SLOT_SECONDS * SLOT_SECONDS, slot_count, seed)
+    clock = SimClock(slots[0].start - 5)
+    # Orders are matched on the server threads while the driver waits for the answer, so
+    # the exchange must not sleep on the virtual clock; the network latency is real here
+    exchange = SimExchange(slots, clock, SLOT_SECONDS, USDC, latency=0.0, latency_jitter=0.0,
+                           resolution_delay=scenario.resolution_delay, seed=seed)
+    reset_metrics()
+    with FakeServices(exchange) as services, tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(ENV, PK=PK, CLOB_URL=services.clob.url, GAMMA_URL=services.gamma.url,
+                          GRAPHQL_URL=services.subgraph.url, WEB3_PROVIDER=services.node.url)
+        config = Config.from_env()
+        creds_path = os.path.join(tmp, "creds.json")
+        seed_creds(creds_path)
+        with clock.install():
+            # Fresh budgets on the virtual clock for every scenario
+            limits.configure(config.rate_limits)
+            session = ClobSession(config.clob_url, config.pk, config.chain_id, creds_path=creds_path)
+            account = AccountManager(config.chain_id, config.pk, config.web3_provider, config.usdc_address,
+                                     config.ctf_address, config.dry_mode, config.account_refresh_interval)
+            resolver = MarketQL(config.graphql_url)
+            settlement = SettlementWorker(account, resolver)
+            clock.add_listener(settlement.wake)
+            finder = MarketFinder(config.gamma_url, slot_minutes=config.slot_minutes)
+            started = time.perf_counter()
+            pnl = main(config, account, resolver, finder, session, settlement, max_slots=len(slots))
+            traded = time.perf_counter() - started
+            clock.run_until(lambda: not settlement.pending, exchange.resolution_delay + 4 * SettlementWorker.MAX_INTERVAL)
+            elapsed = time.perf_counter() - started
+            settlement.stop()
+            session.close()
+        stream = stream_latency(services, [slots[-1].up_token, slots[-1].down_token], STREAM_UPDATES)
+        node, clob = services.node, services.clob
+        return {
+            "description": scenario.description,
+            "slots": len(slots),
+            "trading_seconds": round(traded, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "profit": round(pnl.profit, 4),
+            "unsettled_slots": len(pnl.pending),
+            "orders": exchange.submitted,
+            "rejected_orders": exchange.rejected,
+            "fills": len(exchange.fills),
+            "orders_per_sec": round(exchange.submitted / traded, 3),
+            "tick": percentiles(metrics.histograms.get(("tick", ()))),
+            "order_sign": percentiles(metrics.histograms.get(("order_sign", ()))),
+            "order_post": {side: percentiles(metrics.histograms.get(("order_post", (("side", side),))))
+                           for side in ("up", "down")},
+            "book_fetch": percentiles(metrics.histograms.get(("book_fetch", (("source", "rest"),)))),
+            "rpc_calls_per_slot": round(sum(node.calls.values()) / len(slots), 2),
+            "rpc_requests_per_slot": round(sum(node.requests.values()) / len(slots), 2),
+            "rpc_calls": dict(node.calls),
+            "clob_requests_per_slot": round(sum(clob.requests.values()) / len(slots), 2),
+            "clob_requests": dict(clob.requests),
+            "gamma_requests": sum(services.gamma.requests.values()),
+            "subgraph_requests": dict(services.subgraph.requests),
+            "market_stream": stream,
+        }
+
+
+def main_bench() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, all by default: {', '.join(SCENARIOS)}")
+    parser.add_argument("--slots", type=int, default=3, help="slots per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="e2e_bench.json", help="where to write the JSON results")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    metrics.enable()
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        results[name] = run_scenario(SCENARIOS[name], args.slots, args.seed)
+    for name, result in results.items():
+        print(f"{name}: {result['orders']} orders ({result['orders_per_sec']:.1f}/s), "
+              f"tick p50 {result['tick'].get('p50_ms', 0):.2f} ms p99 {result['tick'].get('p99_ms', 0):.2f} ms, "
+              f"book p50 {result['book_fetch'].get('p50_ms', 0):.2f} ms, "
+              f"{result['rpc_calls_per_slot']:.1f} RPC calls/slot, {result['clob_requests_per_slot']:.0f} CLOB requests/slot, "
+              f"stream p50 {result['market_stream'].get('p50_ms', 0):.2f} ms, profit {result['profit']:.4f}")
+    with open(args.out, "w") as f:
+        json.dump({"slots": args.slots, "seed": args.seed, "scenarios": results}, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,465 @@
+"""
+Local stand-ins for the services the bot talks to, all backed by one SimExchange.
+
+FakeClob serves the CLOB REST endpoints ClobClient uses, FakeMarketChannel the CLOB
+market websocket, FakeGamma the Gamma /markets lookup, FakeSubgraph the condition
+queries of MarketQL and FakeNode the JSON-RPC methods of AccountManager. Each one
+listens on a free localhost port and counts the requests it answered, so a benchmark
+can point the real clients at them and see what a run cost on the wire.
+"""
+
+import json
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from eth_account import Account
+from eth_utils import keccak
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+from bot.simulator import SimClobClient, SimExchange, SimOrder
+
+# Cursor ClobClient stops paginating at
+END_CURSOR = "LTE="
+
+
+class FakeServer:
+    """
+    ThreadingHTTPServer on a free localhost port whose answers come from handle().
+    Connections are kept alive like those of the real APIs.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # route -> requests answered
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes, which Nagle would hold back for a delayed ACK
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _respond(self, method: str) -> None:
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                    status, payload = server.handle(method, url.path, parse_qs(url.query), body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_DELETE(self):
+                self._respond("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] += 1
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+
+class FakeClob(FakeServer):
+    """
+    The CLOB REST API: markets, books, order options, server time, posting and
+    canceling orders and the order and trade history. Signed orders are matched by the
+    exchange as limit orders of takerAmount shares at makerAmount / takerAmount.
+    """
+
+    def __init__(self, exchange: SimExchange):
+        super().__init__("clob")
+        self.exchange = exchange
+        self.client = SimClobClient(exchange)
+        # perf_counter() when the first order came in
+        self.first_order_at: Optional[float] = None
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        token_id = query.get("token_id", [None])[0]
+        if path.startswith("/markets/"):
+            self.count("market")
+            try:
+                return 200, self.client.get_market(path.rsplit("/", 1)[1])
+            except KeyError:
+                return 404, {"error": "market not found"}
+        route = {
+            ("GET", "/"): "ok",
+            ("GET", "/time"): "time",
+            ("GET", "/book"): "book",
+            ("GET", "/tick-size"): "tick_size",
+            ("GET", "/neg-risk"): "neg_risk",
+            ("GET", "/fee-rate"): "fee_rate",
+            ("POST", "/order"): "post_order",
+            ("DELETE", "/order"): "cancel",
+            ("GET", "/data/orders"): "orders",
+            ("GET", "/data/trades"): "trades",
+        }.get((method, path))
+        if route is None:
+            return 404, {"error": f"no route for {method} {path}"}
+        self.count(route)
+        if route == "ok":
+            return 200, "OK"
+        if route == "time":
+            return 200, self.client.get_server_time()
+        if route == "book":
+            summary = self.client.get_order_book(token_id)
+            return 200, {
+                "market": summary.market,
+                "asset_id": summary.asset_id,
+                "timestamp": summary.timestamp,
+                "bids": [{"price": level.price, "size": level.size} for level in summary.bids],
+                "asks": [{"price": level.price, "size": level.size} for level in summary.asks],
+                "min_order_size": "5",
+                "neg_risk": summary.neg_risk,
+                "tick_size": summary.tick_size,
+                "hash": "",
+            }
+        if route == "tick_size":
+            return 200, {"minimum_tick_size": float(self.client.get_tick_size(token_id))}
+        if route == "neg_risk":
+            return 200, {"neg_risk": self.client.get_neg_risk(token_id)}
+        if route == "fee_rate":
+            return 200, {"base_fee": self.client.get_fee_rate_bps(token_id)}
+        if route == "post_order":
+            if self.first_order_at is None:
+                self.first_order_at = time.perf_counter()
+            order = body["order"]
+            maker, taker = int(order["makerAmount"]), int(order["takerAmount"])
+            sim_order = SimOrder(order["tokenId"], order["side"], round(maker / taker, 4), size=taker / 10**6,
+                                 expiration=int(order["expiration"]))
+            return 200, self.client.post_order(sim_order, body["orderType"])
+        if route == "cancel":
+            return 200, self.client.cancel(body["orderID"])
+        if route == "orders":
+            return 200, {"data": self.client.get_orders(), "next_cursor": END_CURSOR}
+        market = query.get("market", [None])[0]
+        trades = self.client.get_trades()
+        if market is not None:
+            tokens = {token["token_id"] for token in self.client.get_market(market)["tokens"]}
+            trades = [trade for trade in trades if trade["asset_id"] in tokens]
+        return 200, {"data": trades, "next_cursor": END_CURSOR}
+
+
+class FakeMarketChannel:
+    """
+    The CLOB market websocket. A subscription gets a book message for each of its
+    tokens, later "subscribe" and "unsubscribe" operations change the tokens of the
+    connection, publish() sends the current books of tokens to every subscriber of
+    them, and PING is answered with PONG.
+    """
+
+    def __init__(self, exchange: SimExchange):
+        self.exchange = exchange
+        self.messages = 0
+        # Initial subscriptions and subscribe operations received
+        self.subscriptions = 0
+        # connection -> subscribed token ids
+        self.subscribers: Dict[Any, List[str]] = {}
+        self._lock = threading.Lock()
+        self.server = serve(self._serve, "127.0.0.1", 0)
+        self.url = f"ws://127.0.0.1:{self.server.socket.getsockname()[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-market-ws", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def book_message(self, token_id: str) -> dict:
+        summary = self.exchange.summary(token_id)
+        return {
+            "event_type": "book",
+            "asset_id": token_id,
+            "market": summary.market,
+            "timestamp": summary.timestamp,
+            "bids": [{"price": level.price, "size": level.size} for level in summary.bids],
+            "asks": [{"price": level.price, "size": level.size} for level in summary.asks],
+        }
+
+    def publish(self, token_ids: List[str]) -> None:
+        with self._lock:
+            subscribers = list(self.subscribers.items())
+        for connection, subscribed in subscribers:
+            books = [self.book_message(token_id) for token_id in token_ids if token_id in subscribed]
+            if not books:
+                continue
+            try:
+                connection.send(json.dumps(books))
+                self.messages += 1
+            except ConnectionClosed:
+                pass
+
+    def send(self, message: Any) -> None:
+        """
+        Send message as it is, a str or anything JSON encodable, to every subscriber.
+        """
+        raw = message if isinstance(message, str) else json.dumps(message)
+        with self._lock:
+            connections = list(self.subscribers)
+        for connection in connections:
+            try:
+                connection.send(raw)
+            except ConnectionClosed:
+                pass
+
+    def _serve(self, connection) -> None:
+        try:
+            for raw in connection:
+                if raw == "PING":
+                    connection.send("PONG")
+                    continue
+                message = json.loads(raw)
+                token_ids = message.get("assets_ids") or []
+                operation = message.get("operation")
+                with self._lock:
+                    subscribed = self.subscribers.get(connection, [])
+                    if operation == "unsubscribe":
+                        self.subscribers[connection] = [token_id for token_id in subscribed if token_id not in token_ids]
+                        continue
+                    if operation == "subscribe":
+                        token_ids = [token_id for token_id in token_ids if token_id not in subscribed]
+                        self.subscribers[connection] = subscribed + token_ids
+                    else:
+                        self.subscribers[connection] = token_ids
+                    self.subscriptions += 1
+                connection.send(json.dumps([self.book_message(token_id) for token_id in token_ids]))
+        except ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                self.subscribers.pop(connection, None)
+
+
+class FakeGamma(FakeServer):
+    """The Gamma /markets endpoint, listing the exchange's slots by slug."""
+
+    def __init__(self, exchange: SimExchange):
+        super().__init__("gamma")
+        self.exchange = exchange
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        if (method, path) != ("GET", "/markets"):
+            return 404, {"error": f"no route for {method} {path}"}
+        self.count("markets")
+        found = []
+        for slug in query.get("slug", []):
+            try:
+                condition_id = self.exchange.condition_id_at(int(slug.rsplit("-", 1)[1]))
+            except ValueError:
+                continue
+            if condition_id is not None:
+                found.append({"slug": slug, "conditionId": condition_id})
+        offset = int(query.get("offset", ["0"])[0])
+        limit = int(query.get("limit", [str(len(found))])[0])
+        return 200, found[offset:offset + limit]
+
+
+class FakeSubgraph(FakeServer):
+    """The subgraph's condition and conditions queries, answered from the exchange's resolutions."""
+
+    def __init__(self, exchange: SimExchange):
+        super().__init__("subgraph")
+        self.exchange = exchange
+
+    def condition(self, condition_id: str) -> dict:
+        resolved, winner = self.exchange.resolution(condition_id)
+        numerators = [] if not resolved else ["1", "0"] if winner == 0 else ["0", "1"]
+        return {"id": condition_id, "positionIds": [], "payoutNumerators": numerators, "payoutDenominator": "1"}
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        if method != "POST":
+            return 404, {"error": f"no route for {method} {path}"}
+        variables = body.get("variables") or {}
+        if "conditions(" in body["query"]:
+            self.count("conditions")
+            ids = set(variables["ids"])
+            conditions = [self.condition(slot.condition_id) for slot in self.exchange.slots.values()
+                          if slot.condition_id.lower() in ids]
+            return 200, {"data": {"conditions": conditions}}
+        self.count("condition")
+        condition_id = variables["id"]
+        known = any(slot.condition_id.lower() == condition_id.lower() for slot in self.exchange.slots.values())
+        return 200, {"data": {"condition": self.condition(condition_id) if known else None}}
+
+
+class FakeNode(FakeServer):
+    """
+    A Polygon node for one account. Balances come from the exchange, allowances and
+    approvals are always granted, and every transaction is mined into a block of its
+    own the moment it is sent. A redemption pays out every condition its calldata names.
+    """
+
+    POL_WEI = 10 * 10**18
+    BASE_FEE = 30 * 10**9
+    GAS = 200000
+    # eth_call selectors of the reads AccountState batches
+    BALANCE_OF = "0x70a08231"
+    ALLOWANCE = "0xdd62ed3e"
+    IS_APPROVED_FOR_ALL = "0xe985e9c5"
+
+    def __init__(self, exchange: SimExchange, chain_id: int = 137):
+        super().__init__("rpc")
+        self.exchange = exchange
+        self.chain_id = chain_id
+        self.block = 1000
+        self.nonce = 0
+        # method -> calls, a batch counts each call in it
+        self.calls: Counter = Counter()
+        self.receipts: Dict[str, dict] = {}
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Tuple[int, Any]:
+        if method != "POST":
+            return 404, {"error": f"no route for {method} {path}"}
+        if isinstance(body, list):
+            self.count("batch")
+            return 200, [self._call(request) for request in body]
+        self.count("single")
+        return 200, self._call(body)
+
+    def _call(self, request: dict) -> dict:
+        name, params = request["method"], request.get("params") or []
+        with self._lock:
+            self.calls[name] += 1
+            handler = getattr(self, f"_{name}", None)
+            if handler is None:
+                return {"jsonrpc": "2.0", "id": request.get("id"),
+                        "error": {"code": -32601, "message": f"method {name} not supported"}}
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": handler(*params)}
+
+    @staticmethod
+    def _word(value: int) -> str:
+        return "0x" + f"{value:064x}"
+
+    def _eth_chainId(self) -> str:
+        return hex(self.chain_id)
+
+    def _eth_blockNumber(self) -> str:
+        return hex(self.block)
+
+    def _eth_getBalance(self, address: str, block: str = "latest") -> str:
+        return hex(self.POL_WEI)
+
+    def _eth_call(self, tx: dict, block: str = "latest") -> str:
+        data = tx.get("data") or tx.get("input") or ""
+        selector = data[:10]
+        if selector == self.BALANCE_OF:
+            return self._word(int(self.exchange.usdc * 10**6))
+        if selector == self.ALLOWANCE:
+            return self._word(2**255)
+        if selector == self.IS_APPROVED_FOR_ALL:
+            return self._word(1)
+        return self._word(0)
+
+    def _eth_estimateGas(self, tx: dict, block: str = "latest") -> str:
+        return hex(self.GAS)
+
+    def _eth_gasPrice(self) -> str:
+        return hex(2 * self.BASE_FEE)
+
+    def _eth_maxPriorityFeePerGas(self) -> str:
+        return hex(self.BASE_FEE)
+
+    def _eth_feeHistory(self, count, newest: str, percentiles: List[float]) -> dict:
+        count = int(count, 16) if isinstance(count, str) else int(count)
+        return {
+            "oldestBlock": hex(self.block - count + 1),
+            "baseFeePerGas": [hex(self.BASE_FEE)] * (count + 1),
+            "gasUsedRatio": [0.5] * count,
+            "reward": [[hex(self.BASE_FEE)] * len(percentiles)] * count,
+        }
+
+    def _eth_getTransactionCount(self, address: str, block: str = "latest") -> str:
+        return hex(self.nonce)
+
+    def _eth_sendRawTransaction(self, raw: str) -> str:
+        txid = "0x" + keccak(hexstr=raw).hex()
+        calldata = raw.lower()
+        for slot in list(self.exchange.slots.values()):
+            if slot.condition_id[2:].lower() in calldata:
+                self.exchange.redeem(slot.condition_id)
+        self.block += 1
+        self.nonce += 1
+        self.receipts[txid] = {
+            "transactionHash": txid,
+            "transactionIndex": "0x0",
+            "blockHash": self._word(self.block),
+            "blockNumber": hex(self.block),
+            "from": Account.recover_transaction(raw),
+            "to": None,
+            "cumulativeGasUsed": hex(self.GAS),
+            "gasUsed": hex(self.GAS),
+            "effectiveGasPrice": hex(2 * self.BASE_FEE),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": "0x1",
+            "type": "0x2",
+        }
+        return txid
+
+    def _eth_getTransactionReceipt(self, txid: str) -> Optional[dict]:
+        return self.receipts.get(txid)
+
+
+class FakeServices:
+    """Every stand-in for one exchange, started and stopped together."""
+
+    def __init__(self, exchange: SimExchange, chain_id: int = 137):
+        self.clob = FakeClob(exchange)
+        self.market_channel = FakeMarketChannel(exchange)
+        self.gamma = FakeGamma(exchange)
+        self.subgraph = FakeSubgraph(exchange)
+        self.node = FakeNode(exchange, chain_id)
+        self.http_servers = [self.clob, self.gamma, self.subgraph, self.node]
+
+    def __enter__(self) -> "FakeServices":
+        for server in self.http_servers:
+            server.start()
+        self.market_channel.start()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.market_channel.stop()
+        for server in self.http_servers:
+            server.stop()
+        return False
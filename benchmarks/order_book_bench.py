@@ -0,0 +1,58 @@
+"""
+Micro-benchmarks for OrderBook update and query throughput.
+
+Run with: PYTHONPATH=src python benchmarks/order_book_bench.py
+"""
+
+import random
+import timeit
+
+from bot.market import OrderBook
+
+LEVELS = [100, 1000, 5000]
+OPS = 100_000
+
+
+def make_book(levels: int) -> OrderBook:
+    book = OrderBook()
+    book.reset(
+        [(round(0.0001 * i, 4), 100.0) for i in range(1, levels + 1)],
+        [(round(0.5 + 0.0001 * i, 4), 100.0) for i in range(1, levels + 1)],
+    )
+    return book
+
+
+def bench(levels: int) -> None:
+    book = make_book(levels)
+    rng = random.Random(levels)
+    # Mix of level updates, removals and re-insertions spread across the whole book
+    deltas = [
+        ("SELL", round(0.5 + 0.0001 * rng.randint(1, levels), 4), rng.choice([0.0, 50.0, 150.0]))
+        for _ in range(OPS)
+    ]
+
+    def updates():
+        for side, price, size in deltas:
+            book.apply_delta(side, price, size)
+
+    def best():
+        for _ in range(OPS):
+            book.best_ask()
+
+    def vwap():
+        for _ in range(OPS // 10):
+            book.buy_vwap(500.0)
+
+    def depth():
+        for _ in range(OPS // 10):
+            book.ask_depth(0.5 + 0.0001 * levels / 2)
+
+    for name, fn, ops in [("apply_delta", updates, OPS), ("best_ask", best, OPS),
+                          ("buy_vwap(500)", vwap, OPS // 10), ("ask_depth(mid)", depth, OPS // 10)]:
+        elapsed = timeit.timeit(fn, number=1)
+        print(f"levels={levels:>5} {name:<15} {ops / elapsed:>12,.0f} ops/s {elapsed / ops * 1e6:>8.2f} us/op")
+
+
+if __name__ == "__main__":
+    for levels in LEVELS:
+        bench(levels)
@@ -0,0 +1,78 @@
+"""
+Compares order latency at trigger time: signing the order then vs taking a presigned one.
+
+Tick size, neg risk and fee rate are read once from the fake CLOB of fake_servers.py
+into the client's caches, so the timed signing makes no request.
+Run with: PYTHONPATH=src python benchmarks/presign_bench.py
+"""
+
+import statistics
+import time
+
+from fake_servers import FakeClob
+from py_clob_client.client import ClobClient
+from py_clob_client.clob_types import MarketOrderArgs, PartialCreateOrderOptions
+from py_clob_client.order_builder.constants import BUY
+
+from bot.order_cache import PresignedOrders
+from bot.simulator import SimClock, SimExchange
+
+PK = "0x" + "11" * 32
+TOKEN_ID = "71321045679252212594626385532706912750332728571942532289631379312455583992563"
+ORDER_SIZE = 5.0
+SAMPLES = 200
+
+
+def make_client(clob_url: str) -> ClobClient:
+    client = ClobClient(clob_url, key=PK, chain_id=137)
+    # The client caches these per token, as a session's prepare_market() leaves them
+    client.get_tick_size(TOKEN_ID)
+    client.get_neg_risk(TOKEN_ID)
+    client.get_fee_rate_bps(TOKEN_ID)
+    return client
+
+
+def percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    return f"mean {statistics.mean(samples) * 1e6:9.1f} us  p50 {p50:9.1f} us  p99 {p99:9.1f} us"
+
+
+def bench_sign_at_trigger(client: ClobClient, options: PartialCreateOrderOptions) -> list[float]:
+    samples = []
+    for i in range(SAMPLES):
+        price = 0.40 + (i % 10) * 0.01
+        start = time.perf_counter()
+        client.create_market_order(
+            MarketOrderArgs(token_id=TOKEN_ID, amount=ORDER_SIZE * price, side=BUY, price=price), options,
+        )
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_presigned(client: ClobClient, options: PartialCreateOrderOptions) -> list[float]:
+    presigned = PresignedOrders(client, {TOKEN_ID: options}, ORDER_SIZE)
+    presigned.track(TOKEN_ID, 0.45)
+    # Let the background signer fill the grid, then refill after every take
+    samples = []
+    for i in range(SAMPLES):
+        price = 0.43 + (i % 8) * 0.01
+        while (TOKEN_ID, round(price, 6)) not in presigned.orders:
+            time.sleep(0.001)
+        start = time.perf_counter()
+        order = presigned.take(TOKEN_ID, price, ORDER_SIZE)
+        samples.append(time.perf_counter() - start)
+        assert order is not None
+    presigned.close()
+    return samples
+
+
+if __name__ == "__main__":
+    clob = FakeClob(SimExchange([], SimClock(time.time())))
+    clob.start()
+    client = make_client(clob.url)
+    clob.stop()
+    options = PartialCreateOrderOptions(tick_size="0.01", neg_risk=False)
+    print(f"sign at trigger  {percentiles(bench_sign_at_trigger(client, options))}")
+    print(f"presigned take   {percentiles(bench_presigned(client, options))}")
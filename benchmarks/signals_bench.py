@@ -0,0 +1,51 @@
+"""
+Throughput of PairSignals book updates with both PairCostPolicy decisions after each.
+
+Run with: PYTHONPATH=src python benchmarks/signals_bench.py
+"""
+
+import random
+import time
+
+from bot.market import OrderBook
+from bot.signals import PairCostPolicy, PairSignals
+
+LEVELS = 50
+UPDATES = 200_000
+ORDER_SIZE = 5.0
+
+
+def make_book(best_ask: float) -> OrderBook:
+    book = OrderBook()
+    book.tick_size = "0.01"
+    book.reset(
+        [(round(best_ask - 0.01 * i, 2), 100.0) for i in range(1, LEVELS + 1) if best_ask - 0.01 * i > 0],
+        [(round(best_ask + 0.01 * i, 2), 100.0) for i in range(LEVELS) if best_ask + 0.01 * i < 1],
+    )
+    return book
+
+
+def main() -> None:
+    rng = random.Random(1)
+    up, down = make_book(0.48), make_book(0.50)
+    deltas = [("up" if rng.random() < 0.5 else "down", rng.choice([0.48, 0.49, 0.50, 0.51]), rng.choice([0.0, 50.0, 150.0]))
+              for _ in range(UPDATES)]
+    policy = PairCostPolicy(2.5)
+    signals = PairSignals(ORDER_SIZE)
+    signals.set_position(5 * 0.5, 5 * 0.49, 5.0, 5.0)
+
+    started = time.perf_counter()
+    buys = 0
+    for i, (leg, price, size) in enumerate(deltas):
+        book = up if leg == "up" else down
+        book.apply_delta("SELL", price, size)
+        signals.on_book(leg, book, i * 0.001)
+        buys += policy.buy_up(signals) + policy.buy_down(signals)
+    elapsed = time.perf_counter() - started
+
+    print(f"book updates: {UPDATES / elapsed:,.0f}/s with both decisions ({buys} buy signals), "
+          f"combined ask min {signals.combined_ask_min:.2f}, ewma {signals.combined_ask_ewma:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Startup benchmark: import time of the bot and time from process start to its first order.
+
+Every run is a fresh interpreter. Imports are profiled with python -X importtime,
+reporting the total and the slowest modules for each entry point. The first order is
+timed by a child process that runs main() against the stand-ins of fake_servers.py on
+a SimClock, letting main() build its own AccountManager and ClobSession as it does on a
+restart; the stand-ins start after the bot's own imports are timed and are not counted.
+The time to first order is then interpreter start + importing main + the client
+libraries main() loads + main() until the fake CLOB got the first order.
+
+With --compare REV the runs are repeated on a git worktree of REV for a before/after
+report, e.g. --compare HEAD~1.
+
+Run with: python benchmarks/startup_bench.py [--runs N] [--compare REV] [--out startup.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+# Entry points: main.py for every run mode, bot.backtest for the backtester
+ENTRY_POINTS = ("main", "bot.backtest")
+TOP_MODULES = 8
+
+
+def tree_env(tree: Path, **extra: str) -> Dict[str, str]:
+    return {**os.environ, "PYTHONPATH": f"{tree / 'src'}{os.pathsep}{tree}", **extra}
+
+
+def import_profile(tree: Path, module: str, runs: int) -> dict:
+    """
+    Median import time of module in a fresh interpreter and the slowest top level imports of one run.
+    """
+    totals = []
+    top = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=tree,
+                                env=tree_env(tree), capture_output=True, text=True, check=True)
+        total = 0
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            total += int(self_us)
+            # Imports made by the entry point itself are indented by one level
+            if name.startswith("   ") and not name.startswith("     "):
+                imports.append((int(cumulative_us), name.strip()))
+        totals.append(total / 1e6)
+        top = sorted(imports, reverse=True)[:TOP_MODULES]
+    return {
+        "seconds": round(statistics.median(totals), 3),
+        "slowest": {name: round(us / 1e6, 3) for us, name in top},
+    }
+
+
+def first_order(tree: Path, runs: int) -> dict:
+    """
+    Median phases of the first order over runs child processes, see first_order_child().
+    """
+    samples: List[dict] = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as home:
+            # HOME is where ClobSession caches its API credentials
+            env = tree_env(tree, HOME=home, STARTUP_BENCH_SPAWNED=repr(time.time()))
+            result = subprocess.run([sys.executable, __file__, "--child"], cwd=home, env=env,
+                                    capture_output=True, text=True, timeout=600)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if result.returncode or not lines:
+            raise RuntimeError(f"first order run failed:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+        samples.append(json.loads(lines[-1]))
+    return {key: round(statistics.median(sample[key] for sample in samples), 3) for key in samples[0]}
+
+
+def first_order_child() -> None:
+    """
+    Child process: time the imports, start the stand-ins, run main() for one slot and
+    print the phases in seconds as one JSON line.
+    """
+    wall, started = time.time(), time.perf_counter()
+    import main as bot_main
+    imported = time.perf_counter()
+    # The client libraries main() imports for a live run, nothing left to load if main imports them eagerly
+    import bot.account_manager
+    import bot.clob_session
+    libraries = time.perf_counter()
+
+    from e2e_bench import ENV, PK, SLOT_SECONDS, USDC, rush_slots, seed_creds
+    from eth_account import Account
+    from fake_servers import FakeServices
+
+    from bot.config import Config
+    from bot.simulator import SimClock, SimExchange
+
+    slots = rush_slots(int(wall) // SLOT_SECONDS * SLOT_SECONDS, 1, 1)
+    clock = SimClock(slots[0].start - 5)
+    exchange = SimExchange(slots, clock, SLOT_SECONDS, USDC, latency=0.0, latency_jitter=0.0, seed=1)
+    address = Account.from_key(PK).address
+    creds_path = Path.home() / ".cache" / "polymarket_bot" / f"clob-creds-{address}.json"
+    creds_path.parent.mkdir(parents=True)
+    seed_creds(str(creds_path))
+    with FakeServices(exchange) as services:
+        os.environ.update(ENV, PK=PK, CLOB_URL=services.clob.url, GAMMA_URL=services.gamma.url,
+                          GRAPHQL_URL=services.subgraph.url, WEB3_PROVIDER=services.node.url)
+        config = Config.from_env()
+        with clock.install():
+            main_started = time.perf_counter()
+            bot_main.main(config, max_slots=1)
+        if services.clob.first_order_at is None:
+            raise RuntimeError("the bot placed no order")
+    phases = {
+        "interpreter": wall - float(os.environ["STARTUP_BENCH_SPAWNED"]),
+        "import_main": imported - started,
+        "import_libraries": libraries - imported,
+        # Virtual waits on the SimClock take next to no wall time
+        "main_to_first_order": services.clob.first_order_at - main_started,
+    }
+    phases["total"] = sum(phases.values())
+    print(json.dumps(phases))
+    sys.stdout.flush()
+    # Skip joining the bot's background threads
+    os._exit(0)
+
+
+def measure(tree: Path, runs: int) -> dict:
+    return {
+        "imports": {module: import_profile(tree, module, runs) for module in ENTRY_POINTS},
+        "first_order": first_order(tree, runs),
+    }
+
+
+def main_bench() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement, the median is reported")
+    parser.add_argument("--compare", help="git revision to measure too, as the before of the report")
+    parser.add_argument("--out", default="startup_bench.json", help="where to write the JSON results")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        first_order_child()
+        return
+
+    results = {"current": measure(ROOT, args.runs)}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            worktree = Path(tmp) / "tree"
+            subprocess.run(["git", "worktree", "add", "--detach", str(worktree), args.compare], cwd=ROOT,
+                           check=True, capture_output=True)
+            try:
+                results[args.compare] = measure(worktree, args.runs)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT, check=True)
+    for name, result in results.items():
+        imports = ", ".join(f"{module} {profile['seconds']:.3f}s" for module, profile in result["imports"].items())
+        phases = result["first_order"]
+        print(f"{name}: import {imports}; first order after {phases['total']:.3f}s "
+              f"(interpreter {phases['interpreter']:.3f}s, main {phases['import_main']:.3f}s, "
+              f"libraries {phases['import_libraries']:.3f}s, startup {phases['main_to_first_order']:.3f}s)")
+    with open(args.out, "w") as f:
+        json.dump({"runs": args.runs, "results": results}, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main_bench()
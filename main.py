@@ -1,128 +1,489 @@
+import asyncio
 import os
 import time
+import zlib
+from dataclasses import replace
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Tuple
 
 from dotenv import load_dotenv
 
 from bot import MarketQL
-from bot.account_manager import AccountManager
+from bot.async_engine import AsyncMarket, AsyncTradeStrategy, run_slot
+from bot.book_recorder import BookRecorder
+from bot.config import Config
 from bot.market import Market
 from bot.market_finder import MarketFinder
+from bot.market_scheduler import MarketScheduler, MarketSpec
+from bot.market_stream import MarketStream
+from bot.metrics import metrics
+from bot.order_tracker import OrderTracker
+from bot.pnl import PnL
+from bot.prefetch import MarketPrefetcher
+from bot.quoting import RestingQuotes
+from bot.rate_limit import limits
+from bot.settlement import SettlementWorker
+from bot.sharding import Shard, ShardReporter, assign_shards, run_shards
+from bot.state_store import StateStore
 from bot.trade_strategy import TradeStrategy
 
+if TYPE_CHECKING:
+    from bot.clob_session import ClobSession
+
 load_dotenv()
 
-def main():
-    PK = os.getenv("PK")
-    GAMMA_URL = os.getenv("GAMMA_URL")
-    CLOB_URL = os.getenv("CLOB_URL")
-    CHAIN_ID = int(os.getenv("CHAIN_ID"))
-    ORDER_SIZE = float(os.getenv("ORDER_SIZE"))
-    INIT_INTERVAL = int(os.getenv("INIT_INTERVAL"))
-    TRADE_INTERVAL = int(os.getenv("TRADE_INTERVAL"))
-    TAKE_PROFIT_THRESHOLD = float(os.getenv("TAKE_PROFIT_THRESHOLD"))
-    PAIR_DIFFERENCE_THRESHOLD = float(os.getenv("PAIR_DIFFERENCE_THRESHOLD"))
-    MAX_INIT_COMBINED_PRICE = float(os.getenv("MAX_INIT_COMBINED_PRICE"))
-    MIN_USDC_BALANCE = float(os.getenv("MIN_USDC_BALANCE"))
-    DRY_MODE = True if int(os.getenv("DRY_MODE")) else False
-    USDC_ADDRESS = os.getenv("USDC_ADDRESS")
-    CTF_ADDRESS = os.getenv("CTF_ADDRESS")
-    FEE_MODULE_ADDRESS = os.getenv("FEE_MODULE_ADDRESS")
-    CTF_EXCHANGE_ADDRESS = os.getenv("CTF_EXCHANGE_ADDRESS")
-    WEB3_PROVIDER = os.getenv("WEB3_PROVIDER")
-    GRAPHQL_URL = os.getenv("GRAPHQL_URL")
-
-    account = AccountManager(CHAIN_ID, PK, WEB3_PROVIDER, USDC_ADDRESS, CTF_ADDRESS,  DRY_MODE)
-    print(f"Account: {account.addr}")
-    resolver = MarketQL(GRAPHQL_URL)
-    initial_balance = account.balance()
-    print(f"Initial balance: {initial_balance} POL")
-    initial_usdc_balance = account.usdc_balance()
-    print(f"Initial USDC balance: {initial_usdc_balance} USDC")
-    finder = MarketFinder(GAMMA_URL)
-    account.ensure_ctf_allowance(FEE_MODULE_ADDRESS)
-    account.ensure_ctf_allowance(CTF_EXCHANGE_ADDRESS)
-    print("Wait for the next slot")
-    start = finder.get_current_slot_start()
-    if not DRY_MODE:
-        finder.wait_until_next_slot_start(start)
+def make_recorder(config: Config) -> Optional[BookRecorder]:
+    if not config.record_dir:
+        return None
+    return BookRecorder(config.record_dir, config.record_depth, int(config.record_max_mb * 2**20))
 
-    profit = 0.0
-    prev_up_profit = 0.0
-    prev_down_profit = 0.0
-    max_spent = 0.0
-    min_profit = 0.0
-    max_profit = 0.0
 
-    while True:
-        start = finder.get_current_slot_start()
+def main(config: Config, account=None, resolver=None, finder: Optional[MarketFinder] = None,
+         session: Optional["ClobSession"] = None, settlement: Optional[SettlementWorker] = None,
+         store: Optional[StateStore] = None, max_slots: Optional[int] = None,
+         reporter: Optional[ShardReporter] = None):
+    """
+    Trade the BTC up/down market slot after slot. The simulator passes its own account,
+    resolver, finder, session, settlement worker and state store and stops after
+    max_slots slots. A shard worker passes the reporter its positions go to.
+    """
+    # The CLOB client loads and gets its API credentials on a thread while the account
+    # is set up, and the CTF approvals are checked in the batch of the first balance read
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup") as pool:
+        opening = None
+        if session is None:
+            from bot.clob_session import ClobSession
+            opening = pool.submit(ClobSession, config.clob_url, config.pk, config.chain_id)
+        if account is None:
+            from bot.account_manager import AccountManager
+            account = AccountManager(config.chain_id, config.pk, config.web3_provider, config.usdc_address, config.ctf_address,  config.dry_mode,
+                                     config.account_refresh_interval)
+        print(f"Account: {account.addr}")
+        if resolver is None:
+            resolver = MarketQL(config.graphql_url)
+        account.ensure_ctf_allowances([config.fee_module_address, config.ctf_exchange_address])
+        initial_balance = account.balance()
+        print(f"Initial balance: {initial_balance} POL")
+        initial_usdc_balance = account.usdc_balance()
+        print(f"Initial USDC balance: {initial_usdc_balance} USDC")
+        if finder is None:
+            finder = MarketFinder(config.gamma_url, slot_minutes=config.slot_minutes)
+        if opening is not None:
+            session = opening.result()
+    session.start_keepalive()
+    tracker = None
+    if not config.dry_mode:
+        session.enable_presigning(config.order_size)
+        tracker = OrderTracker(session.client, config.clob_user_ws_url)
+        tracker.start()
+    prefetcher = MarketPrefetcher(finder, session)
+    recorder = make_recorder(config)
+
+    pnl = PnL()
+    if settlement is None:
+        settlement = SettlementWorker(account, resolver)
+    settlement.start()
+    if store is None and config.state_dir:
+        store = StateStore(config.state_dir)
+
+    def settle(condition_id: str, winnig_idx: Optional[int]) -> None:
+        payout = pnl.settle(condition_id, winnig_idx)
+        if store is not None:
+            store.settled(condition_id, payout)
+        if reporter is not None:
+            reporter.settled(condition_id, payout)
+        account.on_redeemed(payout)
+
+    clock = finder.clock
+    if config.calibrate_clock:
+        print(f"Server clock offset: {clock.calibrate(session.client.get_server_time):.3f}s")
+
+    def has_funds() -> bool:
         balance = account.balance()
         print(f"Current balance: {balance} POL")
         if balance < 0.01:
             print("Not enough funds")
-            finder.wait_until_next_slot_start(start)
-            continue
+            return False
         balance_usdc = account.usdc_balance()
         print(f"Current USDC balance: {balance_usdc} USDC")
-        if balance_usdc < MIN_USDC_BALANCE:
+        if balance_usdc < config.min_usdc_balance:
             print("Not enough funds")
-            finder.wait_until_next_slot_start(start)
-            continue
+            return False
+        account.ensure_usdc_allowances(2 * config.min_usdc_balance, [config.fee_module_address, config.ctf_exchange_address])
+        return True
+
+    def open_market(slot_start: datetime) -> Market:
+        market_id = finder.get_market_id_by_start(slot_start)
+        print(f"{finder.name} market: {market_id}")
+        return Market(session, market_id, config.dry_mode, config.clob_ws_url, tracker=tracker)
 
-        account.ensure_usdc_allowance(2 * MIN_USDC_BALANCE, FEE_MODULE_ADDRESS)
-        account.ensure_usdc_allowance(2 * MIN_USDC_BALANCE, CTF_EXCHANGE_ADDRESS)
+    def prepare(slot_start: datetime) -> Tuple[datetime, bool, Optional[Market]]:
+        """
+        Check the funds and load the market of a slot before it opens. A market that
+        cannot be loaded yet is loaded again once the slot is open.
+        """
+        if not has_funds():
+            return slot_start, False, None
+        try:
+            return slot_start, True, open_market(slot_start)
+        except Exception as e:
+            print(f"Preparing {finder.get_market_slug_by_start(slot_start)} failed: {e}")
+            return slot_start, True, None
 
-        prev_market_id = finder.get_prev_market_id()
-        print(f"Prev 15 min BTC market: {prev_market_id}")
-        market_id = finder.get_current_market_id()
-        print(f"Current 15 min BTC market: {market_id}")
-        market = Market(CLOB_URL, PK, CHAIN_ID, market_id, DRY_MODE)
+    def wait_for_next_slot(start: datetime) -> Tuple[datetime, bool, Optional[Market]]:
+        """
+        Sleep until the slot after start opens, preparing it PREOPEN_LEAD seconds before.
+        """
+        next_start = finder.get_next_slot_start(start)
+        return finder.wait_until_next_slot_start(start, lambda: prepare(next_start), config.preopen_lead)
 
-        strategy = TradeStrategy(market, ORDER_SIZE, MAX_INIT_COMBINED_PRICE, PAIR_DIFFERENCE_THRESHOLD)
-        while finder.slot_is_active(start):
+    start = finder.get_current_slot_start()
+    resumed = None
+    if store is not None:
+        resumed = store.resume(pnl, int(start.timestamp()))
+        for condition_id in list(pnl.pending):
+            settlement.add(condition_id, settle)
+        print(f"Restored state: profit {pnl.profit} USDC, {len(pnl.pending)} slots to settle"
+              + (f", resuming {resumed.condition_id}" if resumed is not None else ""))
+    # prepare() result for the slot about to open
+    prepared = None
+    if resumed is None:
+        print("Wait for the next slot")
+        if not config.dry_mode:
+            prepared = wait_for_next_slot(start)
+
+    slots = 0
+    while max_slots is None or slots < max_slots:
+        slots += 1
+        start = finder.get_current_slot_start()
+        if prepared is not None and prepared[0] == start:
+            _, funded, market = prepared
+        else:
+            funded, market = has_funds(), None
+        prepared = None
+        if not funded:
+            prepared = wait_for_next_slot(start)
+            continue
+        if market is None:
+            market = open_market(start)
+        market_id = market.condition_id
+        if recorder is not None:
+            market.start_recording(recorder, finder.name, int(start.timestamp()))
+        print(f"Market ready {clock.now() - start.timestamp():.3f}s after slot open")
+        prefetcher.prefetch_in_background(finder.get_next_slot_start(start))
+
+        strategy = TradeStrategy(market, config.order_size, config.max_init_combined_price, config.pair_difference_threshold)
+        market.add_fill_listener(strategy.reconcile)
+        market.add_book_listener(strategy.on_book)
+        if store is not None:
+            store.track(market_id, int(start.timestamp()), strategy, resumed)
+            resumed = None
+        if reporter is not None:
+            reporter.slot_opened(market_id, int(start.timestamp()))
+            for leg, size, cost in (("up", strategy.up_amount, strategy.up_spent),
+                                    ("down", strategy.down_amount, strategy.down_spent)):
+                if size:
+                    reporter.fill(market_id, leg, size, cost)
+            strategy.position_listeners.append(
+                lambda leg, size, cost, market_id=market_id: reporter.fill(market_id, leg, size, cost))
+        quotes = None
+        if config.resting_orders and tracker is not None:
+            # GTD expirations need a minute of margin on top of the wanted lifetime
+            quotes = RestingQuotes(strategy, market, config.resting_pair_cost,
+                                   int(finder.get_next_slot_start(start).timestamp()) + 60)
+        slot_end = finder.slot_end(start)
+        pace = market.poll.interval if config.adaptive_poll else None
+        for _ in clock.ticks(slot_end, config.init_interval, pace=pace):
             if strategy.init():
                 break
-            time.sleep(INIT_INTERVAL)
-        # main loop
-        while finder.slot_is_active(start):
+        # main loop, with a stream a book change starts the next tick early
+        for _ in clock.ticks(slot_end, config.trade_interval, market.wait_for_update, pace=pace):
             res = strategy.trade()
-            if strategy.current_profit() > TAKE_PROFIT_THRESHOLD:
-                print("Take profit")
-                break
-            time.sleep(TRADE_INTERVAL)
             if res:
                 print(f"Current Pair Cost: {strategy.average_pair_cost()}")
+            if strategy.current_profit() > config.take_profit_threshold:
+                print("Take profit")
+                break
+            if quotes is not None:
+                quotes.update(strategy.books["up"], strategy.books["down"])
+        if quotes is not None:
+            quotes.cancel_all()
+        # Backtests need the whole slot, not just the part we traded
+        market.record_until(finder.get_next_slot_start(start).timestamp(), config.trade_interval)
+        if tracker is not None and not tracker.wait(market_id, config.fill_confirm_timeout):
+            print("Some fills are still unconfirmed, booking them as requested")
+        strategy.apply_fill_updates()
+        market.close()
+        print(f"Tick to order latency: {strategy.latency_report()}")
+        if strategy.first_order_time is not None:
+            print(f"Slot open to first order: {strategy.first_order_time - start.timestamp():.3f}s")
 
-        resolved = False
-        winnig_idx = 0
-        while not resolved:
-            resolved, winnig_idx = resolver.resolved(prev_market_id)
-            time.sleep(1)
-        account.redeem_market(prev_market_id)
-        if winnig_idx == 0:
-            print(f"UP wins {prev_market_id}")
-            profit += prev_up_profit
-        else:
-            print(f"DOWN wins {prev_market_id}")
-            profit += prev_down_profit
-        if profit > max_profit:
-            max_profit = profit
-        if profit < min_profit:
-            min_profit = profit
-        print(f"Profit: {profit} USDC (Max Profit: {max_profit}, Min Profit: {min_profit})")
-
-        spent = strategy.spent()
-        if spent > max_spent:
-            max_spent = spent
-        profit -= spent
-        print(f"Spent: {spent} USDC (Max Spent: {max_spent})")
-        prev_up_profit = strategy.up_amount
-        prev_down_profit = strategy.down_amount
-        print(f"Profit for Up: {prev_up_profit}")
-        print(f"Profit for Down: {prev_down_profit}")
+        # Resolution and redemption happen on the settlement thread
+        pnl.close_slot(market_id, strategy)
+        if store is not None:
+            store.slot_closed(market_id, strategy)
+        if reporter is not None:
+            reporter.slot_closed(market_id, strategy)
+        account.on_spent(strategy.spent())
+        if strategy.spent() > 0:
+            settlement.add(market_id, settle)
+        if finder.slot_is_active(start):
+            print("Wait for the next slot")
+            prepared = wait_for_next_slot(start)
+    return pnl
+
+
+def simulate(config: Config, reporter: Optional[ShardReporter] = None, seed: int = 0, asset: str = "btc"):
+    """
+    Run main() offline against a SimExchange for the asset's slots, on replayed slots if
+    SIM_REPLAY_DIR is set and on synthetic ones drawn from seed otherwise, with the
+    clock jumping ahead on every sleep.
+    """
+    from bot.clob_session import ClobSession
+    from bot.simulator import (SimAccount, SimClobClient, SimClock, SimExchange, SimFinder, SimResolver,
+                               replay_slots, synthetic_slots)
+
+    slot_seconds = config.slot_minutes * 60
+    if config.sim_replay_dir:
+        slots = replay_slots(config.sim_replay_dir)[:config.sim_slots]
+    else:
+        slots = synthetic_slots(int(time.time()) // slot_seconds * slot_seconds, config.sim_slots, slot_seconds, seed)
+    if not slots:
+        print("No slots to simulate")
+        return
+    # Start just before the first slot, main() waits for the next slot boundary
+    clock = SimClock(slots[0].start - 5, config.sim_speed)
+    exchange = SimExchange(slots, clock, slot_seconds, config.sim_usdc, config.sim_latency_ms / 1000)
+    account = SimAccount(exchange)
+    settlement = SettlementWorker(account, SimResolver(exchange))
+    clock.add_listener(settlement.wake)
+    session = ClobSession(config.clob_url, config.pk, config.chain_id, client=SimClobClient(exchange))
+    sim_config = replace(config, dry_mode=False, clob_ws_url=None, clob_user_ws_url=None)
+    store = StateStore(config.state_dir) if config.state_dir else None
+    started = time.perf_counter()
+    with clock.install():
+        finder = SimFinder(exchange, asset, config.slot_minutes)
+        pnl = main(sim_config, account, SimResolver(exchange), finder, session, settlement, store, len(slots), reporter)
+        # Let the last slots resolve and get redeemed
+        clock.run_until(lambda: not settlement.pending, exchange.resolution_delay + 2 * SettlementWorker.MAX_INTERVAL)
+    elapsed = time.perf_counter() - started
+    settlement.stop()
+    session.close()
+    if store is not None:
+        store.close()
+    print(f"Simulated {len(slots)} slots in {elapsed:.2f}s ({len(slots) / elapsed:.1f} slots/s)")
+    print(f"Exchange: {exchange.report()}")
+    print(f"PnL: {pnl.profit:.4f} USDC booked, {len(pnl.pending)} slots unsettled")
+
+
+async def async_main(config: Config):
+    from bot.account_manager import AccountManager
+    from bot.clob_session import ClobSession
+
+    account, session = await asyncio.gather(
+        asyncio.to_thread(AccountManager, config.chain_id, config.pk, config.web3_provider,
+                          config.usdc_address, config.ctf_address, config.dry_mode,
+                          config.account_refresh_interval),
+        asyncio.to_thread(ClobSession, config.clob_url, config.pk, config.chain_id),
+    )
+    print(f"Account: {account.addr}")
+    resolver = MarketQL(config.graphql_url)
+    finder = MarketFinder(config.gamma_url, slot_minutes=config.slot_minutes)
+    session.start_keepalive()
+    if config.calibrate_clock:
+        offset = await asyncio.to_thread(finder.clock.calibrate, session.client.get_server_time)
+        print(f"Server clock offset: {offset:.3f}s")
+    tracker = None
+    if not config.dry_mode:
+        session.enable_presigning(config.order_size)
+        tracker = OrderTracker(session.client, config.clob_user_ws_url)
+        tracker.start()
+    prefetcher = MarketPrefetcher(finder, session)
+    recorder = make_recorder(config)
+    # The approval check puts the CTF operators in the batch the balances are read with
+    await asyncio.to_thread(account.ensure_ctf_allowances, [config.fee_module_address, config.ctf_exchange_address])
+    initial_balance, initial_usdc_balance = await asyncio.gather(
+        asyncio.to_thread(account.balance),
+        asyncio.to_thread(account.usdc_balance),
+    )
+    print(f"Initial balance: {initial_balance} POL")
+    print(f"Initial USDC balance: {initial_usdc_balance} USDC")
+
+    pnl = PnL()
+    settlement = SettlementWorker(account, resolver)
+    settlement.start()
+    store = StateStore(config.state_dir) if config.state_dir else None
+
+    def settle(condition_id: str, winnig_idx: Optional[int]) -> None:
+        payout = pnl.settle(condition_id, winnig_idx)
+        if store is not None:
+            store.settled(condition_id, payout)
+        account.on_redeemed(payout)
+
+    start = finder.get_current_slot_start()
+    resumed = None
+    if store is not None:
+        resumed = store.resume(pnl, int(start.timestamp()))
+        for condition_id in list(pnl.pending):
+            settlement.add(condition_id, settle)
+        print(f"Restored state: profit {pnl.profit} USDC, {len(pnl.pending)} slots to settle"
+              + (f", resuming {resumed.condition_id}" if resumed is not None else ""))
+    if resumed is None:
+        print("Wait for the next slot")
+        if not config.dry_mode:
+            await asyncio.to_thread(finder.wait_until_next_slot_start, start)
+
+    while True:
+        start = finder.get_current_slot_start()
+        balance, balance_usdc, market_id = await asyncio.gather(
+            asyncio.to_thread(account.balance),
+            asyncio.to_thread(account.usdc_balance),
+            asyncio.to_thread(finder.get_current_market_id),
+        )
+        print(f"Current balance: {balance} POL")
+        print(f"Current USDC balance: {balance_usdc} USDC")
+        if balance < 0.01 or balance_usdc < config.min_usdc_balance:
+            print("Not enough funds")
+            await asyncio.to_thread(finder.wait_until_next_slot_start, start)
+            continue
+        print(f"Current {finder.name} market: {market_id}")
+
+        async def prepare_account():
+            await asyncio.to_thread(account.ensure_usdc_allowances, 2 * config.min_usdc_balance,
+                                    [config.fee_module_address, config.ctf_exchange_address])
+
+        _, market = await asyncio.gather(
+            prepare_account(),
+            asyncio.to_thread(Market, session, market_id, config.dry_mode, config.clob_ws_url, tracker=tracker),
+        )
+        print(f"Market ready {time.time() - start.timestamp():.3f}s after slot open")
+        if recorder is not None:
+            market.start_recording(recorder, finder.name, int(start.timestamp()))
+        market = AsyncMarket(market)
+        prefetch = asyncio.create_task(prefetcher.prefetch_until_open(finder.get_next_slot_start(start)))
+        strategy = AsyncTradeStrategy(market, config.order_size, config.max_init_combined_price, config.pair_difference_threshold)
+        market.market.add_fill_listener(strategy.reconcile)
+        market.market.add_book_listener(strategy.on_book)
+        if store is not None:
+            store.track(market_id, int(start.timestamp()), strategy, resumed)
+            resumed = None
+        await run_slot(strategy, finder, start, config.init_interval, config.trade_interval, config.take_profit_threshold,
+                       config.adaptive_poll)
+        await market.record_until(finder.get_next_slot_start(start).timestamp(), config.trade_interval)
+        if tracker is not None:
+            await asyncio.to_thread(tracker.wait, market_id, config.fill_confirm_timeout)
+        strategy.apply_fill_updates()
+        market.close()
+        print(f"Tick to order latency: {strategy.latency_report()}")
+        if strategy.first_order_time is not None:
+            print(f"Slot open to first order: {strategy.first_order_time - start.timestamp():.3f}s")
+
+        await prefetch
+        pnl.close_slot(market_id, strategy)
+        if store is not None:
+            store.slot_closed(market_id, strategy)
+        account.on_spent(strategy.spent())
+        if strategy.spent() > 0:
+            settlement.add(market_id, settle)
         if finder.slot_is_active(start):
             print("Wait for the next slot")
-            finder.wait_until_next_slot_start(start)
+            await asyncio.to_thread(finder.wait_until_next_slot_start, start)
+
+
+async def multi_main(config: Config, reporter: Optional[ShardReporter] = None):
+    from bot.account_manager import AccountManager
+    from bot.clob_session import ClobSession
+
+    async def open_account() -> AccountManager:
+        account = await asyncio.to_thread(AccountManager, config.chain_id, config.pk, config.web3_provider,
+                                          config.usdc_address, config.ctf_address, config.dry_mode,
+                                          config.account_refresh_interval)
+        print(f"Account: {account.addr}")
+        await asyncio.to_thread(account.ensure_ctf_allowances, [config.fee_module_address, config.ctf_exchange_address])
+        return account
+
+    # One CLOB session and one book stream for every market, opened while the account is checked
+    account, session = await asyncio.gather(
+        open_account(),
+        asyncio.to_thread(ClobSession, config.clob_url, config.pk, config.chain_id),
+    )
+    session.start_keepalive()
+    tracker = None
+    if not config.dry_mode:
+        session.enable_presigning(config.order_size)
+        tracker = OrderTracker(session.client, config.clob_user_ws_url)
+        tracker.start()
+    stream = None
+    if config.clob_ws_url:
+        stream = MarketStream(config.clob_ws_url, [], session.client.get_order_book)
+        stream.start()
+    specs = MarketSpec.parse_list(config.markets)
+    print(f"Markets: {', '.join(spec.name for spec in specs)}")
+    settlement = SettlementWorker(account, MarketQL(config.graphql_url))
+    settlement.start()
+    scheduler = MarketScheduler(config, specs, account, settlement, session, stream, make_recorder(config), tracker,
+                                reporter)
+    if config.calibrate_clock:
+        offset = await asyncio.to_thread(scheduler.clock.calibrate, session.client.get_server_time)
+        print(f"Server clock offset: {offset:.3f}s")
+    await scheduler.run()
+
+
+def run_shard(shard: Shard, reporter: ShardReporter) -> None:
+    """
+    Worker process of one shard: trade its markets with its own wallet, or simulate
+    them one after the other with SIMULATE set, reporting positions to the coordinator.
+    A simulated market gets its own exchange with slots seeded by its name, or replays
+    the directory next to SIM_REPLAY_DIR named after it. The worker's metrics are served
+    on METRICS_PORT + 1 + the shard index and logged to METRICS_LOG with -shard-<index>
+    before the extension.
+    """
+    config = Config.from_env()
+    limits.configure(config.rate_limits)
+    metrics_log = None
+    if config.metrics_log:
+        root, ext = os.path.splitext(config.metrics_log)
+        metrics_log = f"{root}-shard-{shard.index}{ext}"
+    config = replace(config, pk=shard.pk, markets=shard.markets,
+                     state_dir=os.path.join(config.state_dir, f"shard-{shard.index}") if config.state_dir else None,
+                     metrics_port=config.metrics_port + 1 + shard.index if config.metrics_port else 0,
+                     metrics_log=metrics_log)
+    if config.metrics_port or config.metrics_log:
+        metrics.enable(config.metrics_port, config.metrics_log)
+    try:
+        if int(os.getenv("SIMULATE", "0")):
+            for spec in MarketSpec.parse_list(shard.markets):
+                replay_dir = None
+                if config.sim_replay_dir:
+                    replay_dir = os.path.join(os.path.dirname(os.path.normpath(config.sim_replay_dir)), spec.name)
+                market_config = replace(config, slot_minutes=spec.slot_minutes, sim_replay_dir=replay_dir,
+                                        state_dir=os.path.join(config.state_dir, spec.name) if config.state_dir else None)
+                simulate(market_config, reporter, seed=zlib.crc32(spec.name.encode()), asset=spec.asset)
+        else:
+            asyncio.run(multi_main(config, reporter))
+    finally:
+        metrics.close()
 
 
 if __name__ == "__main__":
-    main()
+    config = Config.from_env()
+    limits.configure(config.rate_limits)
+    if config.metrics_port or config.metrics_log:
+        metrics.enable(config.metrics_port, config.metrics_log)
+    try:
+        if config.shard_pks:
+            markets = (config.markets or f"btc:{config.slot_minutes}").split(",")
+            run_shards(assign_shards(config.shard_pks.split(","), [market.strip() for market in markets]), run_shard,
+                       config.shard_report_interval)
+        elif int(os.getenv("SIMULATE", "0")):
+            simulate(config)
+        elif config.markets:
+            asyncio.run(multi_main(config))
+        elif int(os.getenv("ASYNC_MODE", "0")):
+            asyncio.run(async_main(config))
+        else:
+            main(config)
+    finally:
+        # Stop the exporter and write the last snapshot to the metrics log
+        metrics.close()
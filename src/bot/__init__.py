@@ -1,9 +1,21 @@
 """Bot package for Polymarket trading."""
 
-from .market import Market
-from .market_finder import MarketFinder
-from .trade_strategy import TradeStrategy
-from .market_ql import MarketQL
+import importlib
 
 __all__ = ["Market", "MarketFinder", "TradeStrategy", "MarketQL"]
 
+# Exported name -> module, imported on first access so that importing any bot module
+# does not load every client library
+_EXPORTS = {
+    "Market": "bot.market",
+    "MarketFinder": "bot.market_finder",
+    "TradeStrategy": "bot.trade_strategy",
+    "MarketQL": "bot.market_ql",
+}
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
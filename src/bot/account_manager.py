@@ -1,13 +1,59 @@
-import json
-from pathlib import Path
+from typing import Callable, List, Optional
 
 from web3 import Web3
 from web3.constants import HASH_ZERO
-from web3.middleware import ExtraDataToPOAMiddleware
+from web3.contract.contract import ContractFunction
+from web3.middleware import ExtraDataToPOAMiddleware, Web3Middleware
+
+from bot.abi import CTF_ABI, USDC_ABI
+from bot.account_state import AccountState
+from bot.fee_oracle import FeeOracle
+from bot.metrics import metrics
+from bot.nonce_manager import NonceManager, PendingTx
+from bot.rate_limit import limits
+
+
+class RpcMetricsMiddleware(Web3Middleware):
+    """Times every JSON-RPC request, a batch counts as one request."""
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with metrics.timer("rpc", method=method):
+                return make_request(method, params)
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            with metrics.timer("rpc", method="batch"):
+                return make_batch_request(requests_info)
+
+        return middleware
+
+
+class RpcLimitMiddleware(Web3Middleware):
+    """Spends the "rpc" budget of limits on every JSON-RPC request, a batch counts as one request."""
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with limits.call("rpc"):
+                return make_request(method, params)
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            with limits.call("rpc"):
+                return make_batch_request(requests_info)
+
+        return middleware
 
 
 class AccountManager:
-    def __init__(self, chain_id: int, pk: str, web3_url:str, usdc_address: str, ctf_address: str, dry_mode: bool):
+    RECEIPT_TIMEOUT = 20
+
+    def __init__(self, chain_id: int, pk: str, web3_url:str, usdc_address: str, ctf_address: str, dry_mode: bool,
+                 state_refresh_interval: float = 60.0):
         self.pk =pk
         self.chainId = chain_id
         self.dry_mode = dry_mode
@@ -16,116 +62,130 @@ class AccountManager:
         self.usdc_address = Web3.to_checksum_address(usdc_address)
         self.web3.eth.default_account = self.addr
         self.web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        self.web3.middleware_onion.add(RpcLimitMiddleware, "rate_limit")
+        if metrics.enabled:
+            self.web3.middleware_onion.add(RpcMetricsMiddleware, "metrics")
         #self.web3.eth.set_gas_price_strategy(fast_gas_price_strategy)
+        self.fees = FeeOracle(self.web3, self.addr)
+        self.nonces = NonceManager(self.web3, self.addr, self.pk, self.chainId, self.fees)
 
-        # Load ABI from file
-        usdc_abi_path = Path(__file__).parent.parent / "abi" / "usdc.abi"
-        with open(usdc_abi_path, "r") as f:
-            usdc_abi = json.load(f)
-        ctf_abi_path = Path(__file__).parent.parent / "abi" / "ctf.abi"
-        with open(ctf_abi_path, "r") as f:
-            ctf_abi = json.load(f)
-
-        self.usdc = self.web3.eth.contract(address=self.usdc_address, abi=usdc_abi)
-        self.ctf = self.web3.eth.contract(address=Web3.to_checksum_address(ctf_address), abi=ctf_abi)
+        # Only the fragments of the functions we call, far cheaper to build than the full ABIs
+        self.usdc = self.web3.eth.contract(address=self.usdc_address, abi=USDC_ABI)
+        self.ctf = self.web3.eth.contract(address=Web3.to_checksum_address(ctf_address), abi=CTF_ABI)
+        self.state = AccountState(self.web3, self.addr, self.usdc, self.ctf, state_refresh_interval)
+        self.state.start()
 
     def usdc_balance(self) -> float:
-        return self.usdc.functions.balanceOf(self.addr).call() / 10**6
+        return self.state.usdc_balance()
 
     def balance(self) -> float:
-        return self.web3.eth.get_balance(self.addr) / 10**18
+        return self.state.balance()
+
+    def on_spent(self, amount: float) -> None:
+        """
+        Book USDC spent on fills in the cached state, there is nothing to book in dry mode.
+        """
+        if not self.dry_mode:
+            self.state.on_spent(amount)
+
+    def on_redeemed(self, amount: float) -> None:
+        if not self.dry_mode:
+            self.state.on_redeemed(amount)
+
+    def redeem_market(self, condition_id: str, on_confirmed: Optional[Callable[[bool], None]] = None) -> bool:
+        """
+        Redeem both outcome positions of a resolved condition.
+
+        Without on_confirmed it waits for the receipt and returns whether the redemption
+        succeeded. With on_confirmed it returns as soon as the transaction is sent and the
+        callback gets the outcome, so several redemptions can go out back to back.
+        """
+        def redeemed(ok: bool) -> None:
+            try:
+                if on_confirmed is not None:
+                    on_confirmed(ok)
+            finally:
+                if ok and not self.dry_mode:
+                    # Read the balance only after on_confirmed booked the payout, so a read that
+                    # already held the payout cannot leave it counted twice: this one replaces it
+                    self.state.request_refresh()
 
-    def redeem_market(self, condition_id: str) -> None:
         try:
-            nonce = self.web3.eth.get_transaction_count(self.addr)
-            tx = self.ctf.functions.redeemPositions(
+            ptx = self._submit(self.ctf.functions.redeemPositions(
                 self.usdc_address,  # The collateral token address
                 HASH_ZERO,  # The parent collectionId, always bytes32(0) for Polymarket markets
                 condition_id,
                 [1, 2],
-            ).build_transaction({
-                "from": self.addr,
-                "chainId": self.chainId,
-                "gas": 500000,
-                "maxFeePerGas": self.web3.to_wei(3, 'gwei'),
-                "maxPriorityFeePerGas": self.web3.to_wei(2, 'gwei'),
-                "nonce": nonce,
-            })
-            signed = self.web3.eth.account.sign_transaction(tx, self.pk)
-            
-            if self.dry_mode:
-                return
-            
-            txid = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed.raw_transaction))
-            self.web3.eth.wait_for_transaction_receipt(txid, 20, 1.0)
-            print("Redeem complete!")
+            ), f"Redeem {condition_id}", redeemed, urgency="fast")
+            if on_confirmed is not None:
+                return True
+            return self._wait([ptx])
         except Exception as e:
             print(f"Error redeeming Outcome Tokens : {e}")
+            return False
 
     def ensure_usdc_allowance(self, required_amount: float, addr: str) -> bool:
-        required = int(required_amount * 10**6)
-        current_allowance = self.usdc.functions.allowance(self.addr,
-                                                         addr).call()
-        print(f"current_allowance for {addr}: {current_allowance}")
+        return self.ensure_usdc_allowances(required_amount, [addr])
 
-        if current_allowance >= required:
-            return True
-
-        nonce = self.web3.eth.get_transaction_count(self.addr)
-        tx = self.usdc.functions.approve(addr, required).build_transaction({
-            "from": self.addr,
-            "gas": 500000,
-            "maxFeePerGas": self.web3.to_wei(3, 'gwei'),
-            "maxPriorityFeePerGas": self.web3.to_wei(2, 'gwei'),
-            "nonce": nonce,
-            "chainId": self.chainId
-        })
-
-        signed = self.web3.eth.account.sign_transaction(tx, self.pk)
-        
-        if self.dry_mode:
-            return True  # Simulate success in dry mode
-
-        txid = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed.raw_transaction))
-        receipt = self.web3.eth.wait_for_transaction_receipt(txid, 20,  1)
-
-        if receipt.status == 1:
-            print(f"USDC allowance for {addr} updated: {txid}")
-            return True
-        else:
-            print(f"USDC allowance update for {addr} failed: {txid}")
-        return False
+    def ensure_usdc_allowances(self, required_amount: float, addrs: List[str]) -> bool:
+        """
+        Approve every spender in addrs whose allowance is below required_amount.
+        Approvals are sent back to back and then waited for together.
+        """
+        required = int(required_amount * 10**6)
+        # One batch read for all spenders instead of an eth_call each
+        self.state.track(spenders=addrs)
+        pending = []
+        for addr in addrs:
+            current_allowance = self.state.allowance(addr)
+            print(f"current_allowance for {addr}: {current_allowance}")
+            if current_allowance < required:
+                pending.append(self._submit(
+                    self.usdc.functions.approve(addr, required), f"USDC allowance for {addr}",
+                    lambda ok, addr=addr: ok and self.state.on_allowance(addr, required),
+                ))
+        return self._wait(pending)
 
     def ensure_ctf_allowance(self, addr: str) -> bool:
-        nonce = self.web3.eth.get_transaction_count(self.addr)
-        tx = self.ctf.functions.setApprovalForAll(addr, True).build_transaction({
+        return self.ensure_ctf_allowances([addr])
+
+    def ensure_ctf_allowances(self, addrs: List[str]) -> bool:
+        """
+        Approve the CTF operators in addrs, skipping the ones already approved.
+        """
+        self.state.track(operators=addrs)
+        pending = []
+        for addr in addrs:
+            if self.state.approved(addr):
+                print(f"CTF allowance for {addr} already set")
+                continue
+            pending.append(self._submit(
+                self.ctf.functions.setApprovalForAll(addr, True), f"CTF allowance for {addr}",
+                lambda ok, addr=addr: ok and self.state.on_approval(addr),
+            ))
+        return self._wait(pending)
+
+    def _submit(self, fn: ContractFunction, description: str,
+                on_confirmed: Optional[Callable[[bool], None]] = None, urgency: str = "normal") -> Optional[PendingTx]:
+        max_fee, priority_fee = self.fees.fees(urgency)
+        # The nonce is a placeholder, the nonce manager assigns the real one when sending
+        tx = fn.build_transaction({
             "from": self.addr,
-            "gas": 500000,
-            "maxFeePerGas": self.web3.to_wei(3, 'gwei'),
-            "maxPriorityFeePerGas": self.web3.to_wei(2, 'gwei'),
-            "nonce": nonce,
-            "chainId": self.chainId
+            "chainId": self.chainId,
+            "gas": self.fees.gas(fn),
+            "maxFeePerGas": max_fee,
+            "maxPriorityFeePerGas": priority_fee,
+            "nonce": 0,
         })
 
-        signed = self.web3.eth.account.sign_transaction(tx, self.pk)
-        
         if self.dry_mode:
-            return True  # Simulate success in dry mode
-
-        txid = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed.raw_transaction))
-        receipt = self.web3.eth.wait_for_transaction_receipt(txid, 20,  1)
-
-        if receipt.status == 1:
-            print(f"CTF allowance for {addr} updated: {txid}")
-            return True
-        else:
-            print(f"CTF allowance update for {addr} failed: {txid}")
-        return False
-
-
-
-
-
-
+            # Simulate success in dry mode
+            self.web3.eth.account.sign_transaction(tx, self.pk)
+            if on_confirmed is not None:
+                on_confirmed(True)
+            return None
 
+        return self.nonces.send(tx, description, on_confirmed)
 
+    def _wait(self, pending: List[Optional[PendingTx]]) -> bool:
+        return self.nonces.wait_all(self.RECEIPT_TIMEOUT, [ptx for ptx in pending if ptx is not None])
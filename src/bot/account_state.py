@@ -0,0 +1,164 @@
+"""AccountState caches balances, allowances and approvals of the bot account."""
+
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from web3 import Web3
+from web3.contract import Contract
+
+from bot.rate_limit import RateLimited
+
+
+class AccountState:
+    """
+    Cached on-chain state of one account.
+
+    POL and USDC balances, USDC allowances of the tracked spenders and CTF approvals of
+    the tracked operators are read in a single JSON-RPC batch. Between refreshes the
+    cache is updated locally from our own spends, redemptions and confirmed approvals,
+    so reads at slot boundaries normally do not touch the node at all. A background
+    thread keeps the cache younger than max_age and refreshes at once when
+    request_refresh() is called, e.g. after one of our transactions was mined.
+    """
+
+    def __init__(self, web3: Web3, addr: str, usdc: Contract, ctf: Contract, max_age: float = 60.0):
+        self.web3 = web3
+        self.addr = addr
+        self.usdc = usdc
+        self.ctf = ctf
+        self.max_age = max_age
+        self.pol_wei = 0
+        self.usdc_units = 0
+        # spender -> allowance in USDC units, operator -> approved
+        self.allowances: Dict[str, int] = {}
+        self.approvals: Dict[str, bool] = {}
+        self.updated_at: Optional[float] = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, spenders: Iterable[str] = (), operators: Iterable[str] = ()) -> None:
+        """
+        Add spenders and operators to the batch, the next read refreshes if any is new.
+        """
+        with self._lock:
+            for spender in spenders:
+                if spender not in self.allowances:
+                    self.allowances[spender] = 0
+                    self.updated_at = None
+            for operator in operators:
+                if operator not in self.approvals:
+                    self.approvals[operator] = False
+                    self.updated_at = None
+
+    def refresh(self) -> None:
+        """
+        Read everything in one batch request, falling back to single calls if the
+        provider does not support batches.
+        """
+        with self._lock:
+            spenders = list(self.allowances)
+            operators = list(self.approvals)
+        calls = [self.usdc.functions.balanceOf(self.addr)]
+        calls += [self.usdc.functions.allowance(self.addr, spender) for spender in spenders]
+        calls += [self.ctf.functions.isApprovedForAll(self.addr, operator) for operator in operators]
+        try:
+            with self.web3.batch_requests() as batch:
+                batch.add(self.web3.eth.get_balance(self.addr))
+                for call in calls:
+                    batch.add(call)
+                results = batch.execute()
+        except RateLimited:
+            raise
+        except Exception as e:
+            print(f"Batch request failed, reading account state call by call: {e}")
+            results = [self.web3.eth.get_balance(self.addr)] + [call.call() for call in calls]
+        with self._lock:
+            self.pol_wei, self.usdc_units = results[0], results[1]
+            allowances = results[2:2 + len(spenders)]
+            approvals = results[2 + len(spenders):]
+            self.allowances.update(zip(spenders, allowances))
+            self.approvals.update(zip(operators, approvals))
+            # A spender or operator tracked meanwhile still needs a read
+            if len(self.allowances) == len(spenders) and len(self.approvals) == len(operators):
+                self.updated_at = time.monotonic()
+            self.refreshes += 1
+
+    def ensure_fresh(self) -> None:
+        """
+        Refresh a stale cache. While the node is rate limited a cache that was read
+        before is served as it is.
+        """
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.max_age:
+            try:
+                self.refresh()
+            except RateLimited as e:
+                if not self.refreshes:
+                    raise
+                print(f"Using cached account state: {e}")
+
+    def balance(self) -> float:
+        self.ensure_fresh()
+        return self.pol_wei / 10**18
+
+    def usdc_balance(self) -> float:
+        self.ensure_fresh()
+        return self.usdc_units / 10**6
+
+    def allowance(self, spender: str) -> int:
+        self.track(spenders=[spender])
+        self.ensure_fresh()
+        return self.allowances[spender]
+
+    def approved(self, operator: str) -> bool:
+        self.track(operators=[operator])
+        self.ensure_fresh()
+        return bool(self.approvals[operator])
+
+    def on_spent(self, amount: float) -> None:
+        """
+        Book USDC paid for our own fills. The exchange pulls it through an allowance,
+        so every tracked allowance is lowered too, which errs towards approving early.
+        """
+        raw = int(amount * 10**6)
+        with self._lock:
+            self.usdc_units = max(0, self.usdc_units - raw)
+            for spender, allowance in self.allowances.items():
+                self.allowances[spender] = max(0, allowance - raw)
+
+    def on_redeemed(self, amount: float) -> None:
+        """
+        Book a redemption payout until the next read replaces it with the balance on chain.
+        """
+        with self._lock:
+            self.usdc_units += int(amount * 10**6)
+
+    def on_allowance(self, spender: str, amount: int) -> None:
+        with self._lock:
+            self.allowances[spender] = amount
+
+    def on_approval(self, operator: str) -> None:
+        with self._lock:
+            self.approvals[operator] = True
+
+    def request_refresh(self) -> None:
+        with self._lock:
+            self.updated_at = None
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="account-state", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing account state: {e}")
+            # Refresh before readers would find the cache stale
+            self._wake.wait(self.max_age / 2)
+            self._wake.clear()
@@ -0,0 +1,167 @@
+"""Asyncio versions of Market and TradeStrategy that work both legs of a pair concurrently."""
+
+import asyncio
+import time
+from datetime import datetime
+
+from bot.market import Market, OrderBook
+from bot.market_finder import MarketFinder
+from bot.metrics import metrics
+from bot.trade_strategy import TradeStrategy
+
+
+class AsyncMarket:
+    """
+    Async view over a Market.
+
+    ClobClient is blocking, so each call runs in the default executor; this lets the
+    UP and DOWN requests be in flight at the same time.
+    """
+
+    def __init__(self, market: Market):
+        self.market = market
+        self.condition_id = market.condition_id
+
+    async def books(self) -> tuple[OrderBook, OrderBook]:
+        return await asyncio.gather(
+            asyncio.to_thread(self.market.up_book),
+            asyncio.to_thread(self.market.down_book),
+        )
+
+    async def fills(self, size: float) -> tuple[tuple[float, float], tuple[float, float]]:
+        """
+        Returns the (vwap, worst_price) of buying size of UP and of DOWN, priced from books fetched together.
+        """
+        up_book, down_book = await self.books()
+        return up_book.buy_vwap(size), down_book.buy_vwap(size)
+
+    async def buy_up(self, price: float, size: float, limit_price: float = None) -> bool:
+        return await asyncio.to_thread(self.market.buy_up, price, size, limit_price)
+
+    async def buy_down(self, price: float, size: float, limit_price: float = None) -> bool:
+        return await asyncio.to_thread(self.market.buy_down, price, size, limit_price)
+
+    async def record_until(self, deadline: float, interval: float) -> None:
+        await asyncio.to_thread(self.market.record_until, deadline, interval)
+
+    async def wait_for_update(self, timeout: float) -> None:
+        """
+        Wait for a change of this market's books without holding an executor thread.
+        The stream may be shared by many markets, so changes of other tokens are ignored.
+        """
+        stream = self.market.stream
+        if stream is None:
+            await asyncio.sleep(timeout)
+            return
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        token_ids = (self.market.upTokenId, self.market.downTokenId)
+
+        def listener(token_id: str, book: OrderBook) -> None:
+            if token_id in token_ids:
+                loop.call_soon_threadsafe(changed.set)
+
+        stream.add_book_listener(listener)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except TimeoutError:
+            pass
+        finally:
+            stream.remove_book_listener(listener)
+
+    def close(self) -> None:
+        self.market.close()
+
+
+class AsyncTradeStrategy(TradeStrategy):
+    """
+    TradeStrategy whose ticks price both legs from one concurrent book fetch and post
+    the qualifying legs at the same time.
+    """
+
+    market: AsyncMarket
+
+    async def init(self) -> bool:
+        self.apply_fill_updates()
+        if self.up_inited and self.down_inited:
+            return True
+
+        tick_start = time.perf_counter()
+        self.ticks += 1
+        (up_price, up_limit), (down_price, down_limit) = await self.market.fills(self.order_size)
+        if not self.should_init(up_price, up_limit, down_price, down_limit):
+            return False
+        up_ok, down_ok = await asyncio.gather(
+            self._buy_up(up_price, up_limit, not self.up_inited),
+            self._buy_down(down_price, down_limit, not self.down_inited),
+        )
+        if up_ok:
+            self.on_up_fill(up_price, self.order_size)
+            self.up_inited = True
+        elif not self.up_inited:
+            metrics.inc("missed", leg="up")
+        if down_ok:
+            self.on_down_fill(down_price, self.order_size)
+            self.down_inited = True
+        elif not self.down_inited:
+            metrics.inc("missed", leg="down")
+        self.on_tick(tick_start)
+        return self.up_inited and self.down_inited
+
+    async def trade(self) -> bool:
+        self.apply_fill_updates()
+        if not self.up_inited or not self.down_inited:
+            # A leg emptied by a fill correction is opened again before trading on
+            return await self.init()
+
+        tick_start = time.perf_counter()
+        self.ticks += 1
+        self.signals.start_tick()
+        (up_price, up_limit), (down_price, down_limit) = await self.market.fills(self.order_size)
+        # Both legs are judged against the same position so they can go out together
+        want_up = self.should_buy_up(up_price, up_limit)
+        want_down = self.should_buy_down(down_price, down_limit)
+        if not want_up and not want_down:
+            return False
+        up_ok, down_ok = await asyncio.gather(
+            self._buy_up(up_price, up_limit, want_up),
+            self._buy_down(down_price, down_limit, want_down),
+        )
+        if up_ok:
+            self.on_up_fill(up_price, self.order_size)
+        elif want_up:
+            metrics.inc("missed", leg="up")
+        if down_ok:
+            self.on_down_fill(down_price, self.order_size)
+        elif want_down:
+            metrics.inc("missed", leg="down")
+        self.on_tick(tick_start)
+        return up_ok or down_ok
+
+    async def _buy_up(self, price: float, limit: float, wanted: bool) -> bool:
+        return wanted and await self.market.buy_up(price, self.order_size, limit)
+
+    async def _buy_down(self, price: float, limit: float, wanted: bool) -> bool:
+        return wanted and await self.market.buy_down(price, self.order_size, limit)
+
+
+async def run_slot(strategy: AsyncTradeStrategy, finder: MarketFinder, start: datetime, init_interval: float,
+                   trade_interval: float, take_profit_threshold: float, adaptive_poll: bool = False) -> None:
+    """
+    Opens the position and trades it until the slot ends or the profit target is hit,
+    ticking on the finder's clock, paced by the market's AdaptivePoll if adaptive_poll is set.
+    """
+    slot_end = finder.slot_end(start)
+    pace = strategy.market.market.poll.interval if adaptive_poll else None
+    async for _ in finder.clock.ticks(slot_end, init_interval, pace=pace):
+        if await strategy.init():
+            break
+    # main loop, with a stream a book change starts the next tick early
+    async for _ in finder.clock.ticks(slot_end, trade_interval, strategy.market.wait_for_update, pace=pace):
+        res = await strategy.trade()
+        if res:
+            print(f"Current Pair Cost: {strategy.average_pair_cost()}")
+        if strategy.current_profit() > take_profit_threshold:
+            print("Take profit")
+            break
+
@@ -0,0 +1,391 @@
+"""
+Backtest of TradeStrategy on order books recorded by BookRecorder.
+
+run_reference drives the real TradeStrategy over a ReplayMarket one slot and
+parameter set at a time. evaluate_grid and sweep evaluate whole parameter grids with
+NumPy, which is only imported when they are used.
+
+Run with: PYTHONPATH=src python -m bot.backtest recordings/btc-15m --order-size 5,10 --verify 3
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bot.book_recorder import BookSnapshot, load_index, read_slot
+from bot.market import OrderBook
+from bot.trade_strategy import TradeStrategy
+
+
+@dataclass(frozen=True)
+class Params:
+    order_size: float
+    max_combined_price: float
+    pair_difference_threshold: float
+    take_profit_threshold: float
+    init_interval: int
+    trade_interval: int
+
+
+@dataclass
+class ParameterGrid:
+    """
+    Values to sweep for each strategy parameter, every combination is evaluated.
+    """
+
+    order_size: List[float]
+    max_combined_price: List[float]
+    pair_difference_threshold: List[float]
+    take_profit_threshold: List[float]
+    init_interval: List[int] = field(default_factory=lambda: [1])
+    trade_interval: List[int] = field(default_factory=lambda: [5])
+
+    def combinations(self) -> List[Params]:
+        return [Params(*values) for values in itertools.product(
+            self.order_size, self.max_combined_price, self.pair_difference_threshold,
+            self.take_profit_threshold, self.init_interval, self.trade_interval,
+        )]
+
+
+@dataclass
+class RecordedSlot:
+    start: int
+    condition_id: str
+    snapshots: List[BookSnapshot]
+    # 0 if UP won, 1 if DOWN won
+    winner: int
+
+    @classmethod
+    def load(cls, market_dir: str, entry: dict, winner: Optional[int] = None) -> "RecordedSlot":
+        snapshots = list(read_slot(str(Path(market_dir) / entry["file"])))
+        slot = cls(entry["start"], entry["condition_id"], snapshots, 0)
+        slot.winner = winner if winner is not None else slot.infer_winner()
+        return slot
+
+    def infer_winner(self) -> int:
+        """
+        Without a resolution the side priced above 0.5 in the last recorded book is taken as the winner.
+        """
+        for snapshot in reversed(self.snapshots):
+            if snapshot.token == 0 and snapshot.bids and snapshot.asks:
+                return 0 if snapshot.bids[0][0] + snapshot.asks[0][0] >= 1 else 1
+        return 0
+
+    def books(self, steps: int, resolution: float) -> Iterator[Tuple[OrderBook, OrderBook]]:
+        """
+        Yields the (up, down) books as they were at each step of resolution seconds from the slot start.
+        """
+        books = (OrderBook(), OrderBook())
+        previous = (None, None)
+        for snapshots in self.snapshots_at(steps, resolution):
+            for token, snapshot in enumerate(snapshots):
+                if snapshot is not previous[token]:
+                    books[token].reset(snapshot.bids, snapshot.asks)
+            previous = snapshots
+            yield books
+
+    def snapshots_at(self, steps: int, resolution: float) -> Iterator[Tuple[BookSnapshot, BookSnapshot]]:
+        """
+        Yields the latest (up, down) snapshots at each step, empty ones before the first was recorded.
+        """
+        latest = [BookSnapshot(0.0, 0, [], []), BookSnapshot(0.0, 1, [], [])]
+        position = 0
+        for step in range(steps):
+            now = self.start + step * resolution
+            while position < len(self.snapshots) and self.snapshots[position].ts <= now:
+                latest[self.snapshots[position].token] = self.snapshots[position]
+                position += 1
+            yield latest[0], latest[1]
+
+
+def _buy_vwap(asks: List[Tuple[float, float]], size: float) -> float:
+    # Same arithmetic as OrderBook.buy_vwap on the best-first ask levels of a snapshot
+    remaining = size
+    cost = 0.0
+    for price, level_size in asks:
+        take = min(remaining, level_size)
+        cost += take * price
+        remaining -= take
+        if remaining <= 0:
+            return cost / size
+    return 0
+
+
+class ReplayMarket:
+    """
+    Stand-in for Market serving recorded books at a simulated time. Orders fill like
+    in dry mode: whenever the book can fill the size within the limit price.
+    """
+
+    def __init__(self, slot: RecordedSlot, steps: int, resolution: float):
+        self.condition_id = slot.condition_id
+        self._books = slot.books(steps, resolution)
+        self.step = -1
+        self.up, self.down = OrderBook(), OrderBook()
+
+    def seek(self, step: int) -> None:
+        while self.step < step:
+            self.up, self.down = next(self._books)
+            self.step += 1
+
+    def up_book(self) -> OrderBook:
+        return self.up
+
+    def down_book(self) -> OrderBook:
+        return self.down
+
+    def up_fill(self, size: float) -> Tuple[float, float]:
+        return self.up.buy_vwap(size)
+
+    def down_fill(self, size: float) -> Tuple[float, float]:
+        return self.down.buy_vwap(size)
+
+    def buy_up(self, price: float, size: float, limit_price: float = None) -> bool:
+        _, worst_price = self.up_fill(size)
+        return bool(worst_price) and worst_price <= (limit_price or price)
+
+    def buy_down(self, price: float, size: float, limit_price: float = None) -> bool:
+        _, worst_price = self.down_fill(size)
+        return bool(worst_price) and worst_price <= (limit_price or price)
+
+    def wait_for_update(self, timeout: float) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def run_reference(slot: RecordedSlot, params: Params, slot_seconds: int = 900,
+                  resolution: float = 1.0) -> Tuple[float, float]:
+    """
+    Run the real TradeStrategy through one recorded slot the way main() drives it,
+    polling every init_interval and then every trade_interval seconds.
+
+    Returns:
+        A tuple of (profit, spent) for the slot, profit including the winner payout
+    """
+    steps = int(slot_seconds / resolution)
+    market = ReplayMarket(slot, steps, resolution)
+    strategy = TradeStrategy(market, params.order_size, params.max_combined_price, params.pair_difference_threshold)
+    step = 0
+    while step < steps:
+        market.seek(step)
+        if strategy.init():
+            break
+        step += round(params.init_interval / resolution)
+    while step < steps:
+        market.seek(step)
+        strategy.trade()
+        if strategy.current_profit() > params.take_profit_threshold:
+            break
+        step += round(params.trade_interval / resolution)
+    payout = strategy.up_amount if slot.winner == 0 else strategy.down_amount
+    return payout - strategy.spent(), strategy.spent()
+
+
+@dataclass
+class GridResult:
+    params: List[Params]
+    # NumPy arrays of shape (slots, params)
+    profit: Any
+    spent: Any
+
+    def summary(self, top: int = 10) -> str:
+        profit = self.profit.sum(axis=0)
+        lines = []
+        for idx in profit.argsort()[::-1][:top]:
+            p = self.params[idx]
+            lines.append(
+                f"profit {profit[idx]:10.2f}  max spent {self.spent[:, idx].max(initial=0.0):8.2f}  "
+                f"size {p.order_size} max combined {p.max_combined_price} pair difference "
+                f"{p.pair_difference_threshold} take profit {p.take_profit_threshold} "
+                f"intervals {p.init_interval}/{p.trade_interval}"
+            )
+        return "\n".join(lines)
+
+
+def evaluate_grid(slots: List[RecordedSlot], grid: ParameterGrid, slot_seconds: int = 900,
+                  resolution: float = 1.0) -> GridResult:
+    """
+    Evaluate every parameter combination on every slot at once with NumPy.
+
+    The recorded asks of each slot are priced once per order size and step. Then all
+    (combination, slot) strategy states advance together step by step, each one only
+    on the steps its own init or trade interval would poll at, with the same
+    arithmetic as TradeStrategy so results match run_reference.
+    """
+    import numpy as np
+
+    params = grid.combinations()
+    sizes = sorted(set(grid.order_size))
+    steps = int(slot_seconds / resolution)
+    # (steps, sizes, slots) fill prices, 0 where the book cannot fill the size
+    up_fill = np.zeros((steps, len(sizes), len(slots)))
+    down_fill = np.zeros((steps, len(sizes), len(slots)))
+    for slot_idx, slot in enumerate(slots):
+        previous = (None, None)
+        for step, (up, down) in enumerate(slot.snapshots_at(steps, resolution)):
+            if up is previous[0] and down is previous[1]:
+                up_fill[step, :, slot_idx] = up_fill[step - 1, :, slot_idx]
+                down_fill[step, :, slot_idx] = down_fill[step - 1, :, slot_idx]
+                continue
+            previous = (up, down)
+            for size_idx, size in enumerate(sizes):
+                up_fill[step, size_idx, slot_idx] = _buy_vwap(up.asks, size)
+                down_fill[step, size_idx, slot_idx] = _buy_vwap(down.asks, size)
+
+    def column(values):
+        return np.array(values, dtype=float)[:, None]
+
+    size_idx = np.array([sizes.index(p.order_size) for p in params])
+    size = column([p.order_size for p in params])
+    max_combined = column([p.max_combined_price for p in params])
+    pair_difference = column([p.pair_difference_threshold for p in params])
+    take_profit = column([p.take_profit_threshold for p in params])
+    init_steps = np.array([[round(p.init_interval / resolution)] for p in params])
+    trade_steps = np.array([[round(p.trade_interval / resolution)] for p in params])
+
+    shape = (len(params), len(slots))
+    up_spent, down_spent = np.zeros(shape), np.zeros(shape)
+    up_amount, down_amount = np.zeros(shape), np.zeros(shape)
+    trading = np.zeros(shape, dtype=bool)
+    done = np.zeros(shape, dtype=bool)
+    next_step = np.zeros(shape, dtype=int)
+    # Divisions by a zero amount only happen in lanes that are masked out
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for step in range(steps):
+            due = (next_step == step) & ~done
+            if not due.any():
+                continue
+            up_price = up_fill[step][size_idx]
+            down_price = down_fill[step][size_idx]
+
+            opening = due & ~trading & (up_price > 0) & (down_price > 0) & (up_price + down_price < max_combined)
+            up_spent = np.where(opening, up_spent + up_price * size, up_spent)
+            up_amount = np.where(opening, up_amount + size, up_amount)
+            down_spent = np.where(opening, down_spent + down_price * size, down_spent)
+            down_amount = np.where(opening, down_amount + size, down_amount)
+            next_step = np.where(due & ~trading & ~opening, step + init_steps, next_step)
+            trading |= opening
+
+            ticking = due & trading
+            tick_pair_cost = up_spent / up_amount + down_spent / down_amount
+            # A leg bought below its average price lowers the pair cost, as in PairCostPolicy
+            buy_up = ticking & (up_price > 0) & (up_price < up_spent / up_amount) & (up_amount < pair_difference * down_amount)
+            up_spent = np.where(buy_up, up_spent + up_price * size, up_spent)
+            up_amount = np.where(buy_up, up_amount + size, up_amount)
+
+            # DOWN has to beat the pair cost from before this tick's UP buy
+            down_cost = up_spent / up_amount + (down_spent + down_price * size) / (down_amount + size)
+            buy_down = ticking & (down_price > 0) & (down_cost < tick_pair_cost) & (down_amount < pair_difference * up_amount)
+            down_spent = np.where(buy_down, down_spent + down_price * size, down_spent)
+            down_amount = np.where(buy_down, down_amount + size, down_amount)
+
+            current_profit = np.minimum(up_amount, down_amount) - (up_spent + down_spent)
+            done |= ticking & (current_profit > take_profit)
+            next_step = np.where(ticking, step + trade_steps, next_step)
+
+    winners = np.array([slot.winner for slot in slots])
+    spent = up_spent + down_spent
+    profit = np.where(winners == 0, up_amount, down_amount) - spent
+    return GridResult(params, profit.T, spent.T)
+
+
+def load_slots(market_dir: str, winners: Optional[Dict[str, int]] = None) -> List[RecordedSlot]:
+    """
+    Load every recorded slot of a market. winners maps condition ids to resolved
+    winning indexes, slots missing from it get their winner inferred from the books.
+    """
+    winners = winners or {}
+    index = load_index(market_dir)
+    return [RecordedSlot.load(market_dir, entry, winners.get(entry["condition_id"]))
+            for _, entry in sorted(index.items())]
+
+
+def _evaluate_chunk(market_dir: str, entries: List[dict], winners: Dict[str, int], grid: ParameterGrid,
+                    slot_seconds: int, resolution: float) -> GridResult:
+    slots = [RecordedSlot.load(market_dir, entry, winners.get(entry["condition_id"])) for entry in entries]
+    return evaluate_grid(slots, grid, slot_seconds, resolution)
+
+
+def sweep(market_dir: str, grid: ParameterGrid, processes: Optional[int] = None, slot_seconds: int = 900,
+          resolution: float = 1.0, winners: Optional[Dict[str, int]] = None) -> GridResult:
+    """
+    evaluate_grid over all recorded slots of a market, split across a process pool.
+    """
+    import numpy as np
+
+    winners = winners or {}
+    entries = [entry for _, entry in sorted(load_index(market_dir).items())]
+    workers = processes or os.cpu_count() or 1
+    chunk = max(1, -(-len(entries) // workers))
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(_evaluate_chunk, market_dir, entries[offset:offset + chunk], winners, grid,
+                        slot_seconds, resolution)
+            for offset in range(0, len(entries), chunk)
+        ]
+        results = [future.result() for future in futures]
+    if not results:
+        return evaluate_grid([], grid, slot_seconds, resolution)
+    return GridResult(
+        results[0].params,
+        np.concatenate([result.profit for result in results]),
+        np.concatenate([result.spent for result in results]),
+    )
+
+
+def _floats(text: str) -> List[float]:
+    return [float(value) for value in text.split(",")]
+
+
+def _ints(text: str) -> List[int]:
+    return [int(value) for value in text.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep TradeStrategy parameters over recorded slots")
+    parser.add_argument("market_dir", help="Recording directory of one market, e.g. recordings/btc-15m")
+    parser.add_argument("--order-size", type=_floats, default=[5.0])
+    parser.add_argument("--max-combined-price", type=_floats, default=[1.05])
+    parser.add_argument("--pair-difference-threshold", type=_floats, default=[2.5])
+    parser.add_argument("--take-profit-threshold", type=_floats, default=[0.5])
+    parser.add_argument("--init-interval", type=_ints, default=[1])
+    parser.add_argument("--trade-interval", type=_ints, default=[5])
+    parser.add_argument("--slot-minutes", type=int, default=15)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--graphql-url", help="Take winners from the subgraph instead of the last recorded books")
+    parser.add_argument("--verify", type=int, default=0, help="Check this many slots against run_reference")
+    args = parser.parse_args()
+
+    grid = ParameterGrid(args.order_size, args.max_combined_price, args.pair_difference_threshold,
+                         args.take_profit_threshold, args.init_interval, args.trade_interval)
+    winners = {}
+    if args.graphql_url:
+        from bot.market_ql import MarketQL
+        condition_ids = [entry["condition_id"] for entry in load_index(args.market_dir).values()]
+        for condition_id, (resolved, winnig_idx) in MarketQL(args.graphql_url).resolved_many(condition_ids).items():
+            if resolved and winnig_idx is not None:
+                winners[condition_id] = winnig_idx
+    slot_seconds = args.slot_minutes * 60
+    result = sweep(args.market_dir, grid, args.processes, slot_seconds, winners=winners)
+    print(f"{result.profit.shape[0]} slots, {len(result.params)} parameter sets")
+    print(result.summary())
+
+    if args.verify:
+        slots = load_slots(args.market_dir, winners)[:args.verify]
+        mismatches = 0
+        for slot_idx, slot in enumerate(slots):
+            for param_idx, params in enumerate(result.params):
+                profit, _ = run_reference(slot, params, slot_seconds)
+                if abs(profit - result.profit[slot_idx, param_idx]) > 1e-9:
+                    mismatches += 1
+        print(f"Reference check: {mismatches} mismatches in {len(slots) * len(result.params)} runs")
+
+
+if __name__ == "__main__":
+    main()
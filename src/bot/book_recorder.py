@@ -0,0 +1,215 @@
+"""BookRecorder persists the order books a Market sees for offline replay."""
+
+import json
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bot.market import OrderBook
+
+MAGIC = b"PMBK"
+VERSION = 1
+# magic, version, depth, slot start
+HEADER = struct.Struct("<4sHHq")
+PRICE_SCALE = 10000
+
+
+def record_struct(depth: int) -> struct.Struct:
+    """
+    One fixed-width little endian record per book snapshot of one token:
+    timestamp, token index (0 up, 1 down), bid and ask level counts, 5 pad bytes,
+    then bid prices, bid sizes, ask prices and ask sizes of depth levels each.
+    Prices are stored in 1/PRICE_SCALE units, best level first.
+    """
+    return struct.Struct(f"<dBBB5x{depth}H{depth}f{depth}H{depth}f")
+
+
+def record_dtype(depth: int) -> list:
+    """
+    The record layout as a numpy dtype description, so a slot file can be mapped with
+    np.memmap(path, dtype=np.dtype(record_dtype(depth)), mode="r", offset=HEADER.size).
+    """
+    return [
+        ("ts", "<f8"), ("token", "u1"), ("bids", "u1"), ("asks", "u1"), ("pad", "V5"),
+        ("bid_price", "<u2", (depth,)), ("bid_size", "<f4", (depth,)),
+        ("ask_price", "<u2", (depth,)), ("ask_size", "<f4", (depth,)),
+    ]
+
+
+@dataclass
+class BookSnapshot:
+    ts: float
+    token: int
+    # (price, size) levels, best first
+    bids: List[Tuple[float, float]]
+    asks: List[Tuple[float, float]]
+
+
+class SlotRecorder:
+    """
+    Appends snapshots of the two books of one slot market to the slot's file.
+
+    Snapshots go to an in-memory buffer flushed every FLUSH_BYTES or FLUSH_INTERVAL
+    seconds, and a snapshot whose top levels did not change is not written at all.
+    """
+
+    FLUSH_BYTES = 64 * 1024
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self, recorder: "BookRecorder", path: Path, entry: dict, depth: int):
+        self.recorder = recorder
+        self.path = path
+        self.entry = entry
+        self.depth = depth
+        self.record = record_struct(depth)
+        self.tokens = {entry["up_token"]: 0, entry["down_token"]: 1}
+        self.last: Dict[int, tuple] = {}
+        self.records = 0
+        self._buffer = bytearray()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, depth, entry["start"]))
+
+    def on_book(self, token_id: str, book: OrderBook) -> None:
+        token = self.tokens.get(token_id)
+        if token is None:
+            return
+        depth = self.depth
+        bid_prices = book.bid_prices[:-depth - 1:-1]
+        ask_prices = book.ask_prices[:depth]
+        levels = (
+            tuple(round(price * PRICE_SCALE) for price in bid_prices),
+            tuple(book.bid_sizes[price] for price in bid_prices),
+            tuple(round(price * PRICE_SCALE) for price in ask_prices),
+            tuple(book.ask_sizes[price] for price in ask_prices),
+        )
+        with self._lock:
+            if self._file is None or self.last.get(token) == levels:
+                return
+            self.last[token] = levels
+            pad_bids = (0,) * (depth - len(bid_prices))
+            pad_asks = (0,) * (depth - len(ask_prices))
+            self._buffer += self.record.pack(
+                time.time(), token, len(bid_prices), len(ask_prices),
+                *levels[0], *pad_bids, *levels[1], *pad_bids,
+                *levels[2], *pad_asks, *levels[3], *pad_asks,
+            )
+            self.records += 1
+            if len(self._buffer) >= self.FLUSH_BYTES or time.monotonic() - self._flushed_at > self.FLUSH_INTERVAL:
+                self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+        self.entry["records"] = self.records
+        self.recorder.add_to_index(self.path.parent, self.entry)
+
+    def _flush(self) -> None:
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+        self._flushed_at = time.monotonic()
+
+
+class BookRecorder:
+    """
+    Writes one file of fixed-width book records per market and slot under
+    directory/<market>/<slot start>.book, and appends the slot to
+    directory/<market>/index.jsonl when it is closed.
+
+    Disk use is bounded by max_bytes: when a slot is opened the oldest slot files of
+    all markets are deleted until the total fits. Their index entries stay, readers
+    skip slots whose file is gone.
+    """
+
+    DEFAULT_DEPTH = 20
+
+    def __init__(self, directory: str, depth: int = DEFAULT_DEPTH, max_bytes: Optional[int] = None):
+        if not 0 < depth <= 255:
+            raise ValueError("depth must be between 1 and 255 levels")
+        self.directory = Path(directory)
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def open_slot(self, market: str, start: int, condition_id: str, up_token: str, down_token: str) -> SlotRecorder:
+        market_dir = self.directory / market
+        market_dir.mkdir(exist_ok=True)
+        self.enforce_limit()
+        entry = {
+            "start": start,
+            "condition_id": condition_id,
+            "up_token": up_token,
+            "down_token": down_token,
+            "depth": self.depth,
+            "file": f"{start}.book",
+        }
+        return SlotRecorder(self, market_dir / entry["file"], entry, self.depth)
+
+    def add_to_index(self, market_dir: Path, entry: dict) -> None:
+        with self._lock:
+            with open(market_dir / "index.jsonl", "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def enforce_limit(self) -> None:
+        if self.max_bytes is None:
+            return
+        files = sorted(self.directory.glob("*/*.book"), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+
+
+def load_index(market_dir: str) -> Dict[int, dict]:
+    """
+    Returns slot start -> index entry for the recorded slots of one market whose file still exists.
+    """
+    market_dir = Path(market_dir)
+    index = {}
+    path = market_dir / "index.jsonl"
+    if not path.exists():
+        return index
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if (market_dir / entry["file"]).exists():
+                index[entry["start"]] = entry
+    return index
+
+
+def read_slot(path: str) -> Iterator[BookSnapshot]:
+    """
+    Yields the snapshots of a slot file in the order they were recorded. A record cut
+    short by a crash at the end of the file is ignored.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, depth, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} book file")
+    record = record_struct(depth)
+    end = HEADER.size + (len(data) - HEADER.size) // record.size * record.size
+    for values in record.iter_unpack(memoryview(data)[HEADER.size:end]):
+        ts, token, bids, asks = values[:4]
+        bid_prices = values[4:4 + bids]
+        bid_sizes = values[4 + depth:4 + depth + bids]
+        ask_prices = values[4 + 2 * depth:4 + 2 * depth + asks]
+        ask_sizes = values[4 + 3 * depth:4 + 3 * depth + asks]
+        yield BookSnapshot(
+            ts, token,
+            [(price / PRICE_SCALE, size) for price, size in zip(bid_prices, bid_sizes)],
+            [(price / PRICE_SCALE, size) for price, size in zip(ask_prices, ask_sizes)],
+        )
@@ -0,0 +1,153 @@
+"""ClobSession is a long-lived CLOB client shared by every Market."""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from py_clob_client.client import ClobClient
+from py_clob_client.clob_types import ApiCreds, PartialCreateOrderOptions
+from py_clob_client.exceptions import PolyApiException
+
+from bot.order_cache import PresignedOrders
+from bot.rate_limit import limits
+
+
+class ClobSession:
+    """
+    Owns one ClobClient for the whole run.
+
+    API credentials are derived once and cached on disk until they expire or the CLOB
+    rejects them, market
+    metadata is cached per condition, and a background ping keeps the pooled HTTP
+    connection warm so the first request of a slot does not pay for a handshake.
+    """
+
+    CREDS_TTL = 7 * 24 * 3600
+    KEEPALIVE_INTERVAL = 20
+    MAX_CACHED_MARKETS = 256
+
+    def __init__(self, host: str, pk: str, chain_id: int, creds_path: Optional[str] = None, client: Any = None):
+        """
+        Initialize ClobSession.
+
+        Args:
+            host: The CLOB REST URL
+            pk: The wallet private key
+            chain_id: The chain id
+            creds_path: Where to cache API credentials, defaults to ~/.cache/polymarket_bot
+            client: An already authenticated client to use instead, e.g. a SimClobClient
+        """
+        self.client = client
+        if client is None:
+            self.client = ClobClient(host, key=pk, chain_id=chain_id)
+        if creds_path is None:
+            creds_path = Path.home() / ".cache" / "polymarket_bot" / f"clob-creds-{self.client.get_address()}.json"
+        self.creds_path = Path(creds_path)
+        if client is None:
+            self.client.set_api_creds(self._load_creds())
+        self.markets: Dict[str, Any] = {}
+        # token_id -> tick size and neg risk flag, so signing needs no lookups
+        self.order_options: Dict[str, PartialCreateOrderOptions] = {}
+        self.presigned: Optional[PresignedOrders] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_creds(self) -> ApiCreds:
+        try:
+            with open(self.creds_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("expires_at", 0) > time.time():
+                return ApiCreds(cached["api_key"], cached["api_secret"], cached["api_passphrase"])
+        except (OSError, ValueError, KeyError):
+            pass
+        creds = self.client.create_or_derive_api_creds()
+        try:
+            self.creds_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.creds_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({
+                    "api_key": creds.api_key,
+                    "api_secret": creds.api_secret,
+                    "api_passphrase": creds.api_passphrase,
+                    "expires_at": time.time() + self.CREDS_TTL,
+                }, f)
+        except OSError as e:
+            print(f"Error caching CLOB credentials: {e}")
+        return creds
+
+    def invalidate_creds(self) -> None:
+        """
+        Drop the cached credentials and derive them again, e.g. after an auth error.
+        """
+        try:
+            self.creds_path.unlink()
+        except OSError:
+            pass
+        self.client.set_api_creds(self._load_creds())
+
+    def authed(self, request: Callable[..., Any], *args) -> Any:
+        """
+        Run an authenticated client request. If the CLOB rejects the credentials with a
+        401 or 403 they are derived again and the request is retried once.
+        """
+        try:
+            return request(*args)
+        except PolyApiException as e:
+            if e.status_code not in (401, 403):
+                raise
+            print(f"CLOB rejected the API credentials ({e.status_code}), deriving them again")
+        self.invalidate_creds()
+        return request(*args)
+
+    def get_market(self, condition_id: str) -> Any:
+        if condition_id not in self.markets:
+            if len(self.markets) >= self.MAX_CACHED_MARKETS:
+                self.markets.pop(next(iter(self.markets)))
+            with limits.call("clob_market"):
+                self.markets[condition_id] = self.client.get_market(condition_id)
+        return self.markets[condition_id]
+
+    def prepare_market(self, condition_id: str) -> Any:
+        """
+        Fetch and cache everything needed to trade a condition: market metadata plus
+        tick size, neg risk and fee rate of each token.
+        """
+        info = self.get_market(condition_id)
+        for token in info["tokens"]:
+            token_id = token["token_id"]
+            with limits.call("clob_market"):
+                tick_size = self.client.get_tick_size(token_id)
+            with limits.call("clob_market"):
+                neg_risk = self.client.get_neg_risk(token_id)
+            with limits.call("clob_market"):
+                self.client.get_fee_rate_bps(token_id)
+            self.order_options[token_id] = PartialCreateOrderOptions(tick_size=tick_size, neg_risk=neg_risk)
+        return info
+
+    def enable_presigning(self, size: float) -> None:
+        """
+        Keep FOK buy orders of the given size signed ahead of time for every traded token.
+        """
+        self.presigned = PresignedOrders(self.client, self.order_options, size)
+
+    def start_keepalive(self) -> None:
+        self._thread = threading.Thread(target=self._keepalive, name="clob-keepalive", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self.presigned is not None:
+            self.presigned.close()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _keepalive(self) -> None:
+        while not self._stop.wait(self.KEEPALIVE_INTERVAL):
+            try:
+                self.client.get_ok()
+            except Exception as e:
+                print(f"CLOB keepalive failed: {e}")
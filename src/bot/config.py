@@ -0,0 +1,100 @@
+"""Bot settings read from the environment."""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class Config:
+    pk: str
+    gamma_url: str
+    clob_url: str
+    chain_id: int
+    order_size: float
+    init_interval: float
+    trade_interval: float
+    take_profit_threshold: float
+    pair_difference_threshold: float
+    max_init_combined_price: float
+    min_usdc_balance: float
+    dry_mode: bool
+    usdc_address: str
+    ctf_address: str
+    fee_module_address: str
+    ctf_exchange_address: str
+    web3_provider: str
+    graphql_url: str
+    clob_ws_url: Optional[str]
+    markets: Optional[str]
+    account_refresh_interval: float
+    record_dir: Optional[str]
+    record_depth: int
+    record_max_mb: float
+    sim_replay_dir: Optional[str]
+    sim_slots: int
+    sim_latency_ms: float
+    sim_speed: float
+    sim_usdc: float
+    metrics_port: int
+    metrics_log: Optional[str]
+    clob_user_ws_url: Optional[str]
+    resting_orders: bool
+    resting_pair_cost: float
+    fill_confirm_timeout: float
+    state_dir: Optional[str]
+    slot_minutes: int
+    preopen_lead: float
+    calibrate_clock: bool
+    shard_pks: Optional[str]
+    shard_report_interval: float
+    rate_limits: Optional[str]
+    adaptive_poll: bool
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        return cls(
+            pk=os.getenv("PK"),
+            gamma_url=os.getenv("GAMMA_URL"),
+            clob_url=os.getenv("CLOB_URL"),
+            chain_id=int(os.getenv("CHAIN_ID")),
+            order_size=float(os.getenv("ORDER_SIZE")),
+            init_interval=float(os.getenv("INIT_INTERVAL")),
+            trade_interval=float(os.getenv("TRADE_INTERVAL")),
+            take_profit_threshold=float(os.getenv("TAKE_PROFIT_THRESHOLD")),
+            pair_difference_threshold=float(os.getenv("PAIR_DIFFERENCE_THRESHOLD")),
+            max_init_combined_price=float(os.getenv("MAX_INIT_COMBINED_PRICE")),
+            min_usdc_balance=float(os.getenv("MIN_USDC_BALANCE")),
+            dry_mode=True if int(os.getenv("DRY_MODE")) else False,
+            usdc_address=os.getenv("USDC_ADDRESS"),
+            ctf_address=os.getenv("CTF_ADDRESS"),
+            fee_module_address=os.getenv("FEE_MODULE_ADDRESS"),
+            ctf_exchange_address=os.getenv("CTF_EXCHANGE_ADDRESS"),
+            web3_provider=os.getenv("WEB3_PROVIDER"),
+            graphql_url=os.getenv("GRAPHQL_URL"),
+            clob_ws_url=os.getenv("CLOB_WS_URL"),
+            markets=os.getenv("MARKETS"),
+            account_refresh_interval=float(os.getenv("ACCOUNT_REFRESH_INTERVAL", "60")),
+            record_dir=os.getenv("RECORD_DIR"),
+            record_depth=int(os.getenv("RECORD_DEPTH", "20")),
+            record_max_mb=float(os.getenv("RECORD_MAX_MB", "10240")),
+            sim_replay_dir=os.getenv("SIM_REPLAY_DIR"),
+            sim_slots=int(os.getenv("SIM_SLOTS", "96")),
+            sim_latency_ms=float(os.getenv("SIM_LATENCY_MS", "50")),
+            sim_speed=float(os.getenv("SIM_SPEED", "0")),
+            sim_usdc=float(os.getenv("SIM_USDC", "1000")),
+            metrics_port=int(os.getenv("METRICS_PORT", "0")),
+            metrics_log=os.getenv("METRICS_LOG"),
+            clob_user_ws_url=os.getenv("CLOB_USER_WS_URL"),
+            resting_orders=bool(int(os.getenv("RESTING_ORDERS", "0"))),
+            resting_pair_cost=float(os.getenv("RESTING_PAIR_COST", "1.0")),
+            fill_confirm_timeout=float(os.getenv("FILL_CONFIRM_TIMEOUT", "30")),
+            state_dir=os.getenv("STATE_DIR"),
+            slot_minutes=int(os.getenv("SLOT_MINUTES", "15")),
+            preopen_lead=float(os.getenv("PREOPEN_LEAD", "5")),
+            calibrate_clock=bool(int(os.getenv("CALIBRATE_CLOCK", "1"))),
+            shard_pks=os.getenv("SHARD_PKS"),
+            shard_report_interval=float(os.getenv("SHARD_REPORT_INTERVAL", "60")),
+            rate_limits=os.getenv("RATE_LIMITS"),
+            adaptive_poll=bool(int(os.getenv("ADAPTIVE_POLL", "1"))),
+        )
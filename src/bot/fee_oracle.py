@@ -0,0 +1,117 @@
+"""FeeOracle prices transactions from recent blocks instead of fixed fees."""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from web3 import Web3
+from web3.contract.contract import ContractFunction
+
+
+class FeeOracle:
+    """
+    Suggests EIP-1559 fees and gas limits.
+
+    Base fees and priority fee percentiles of the last WINDOW blocks are kept in a
+    rolling window fed by eth_feeHistory; a refresh only asks for the blocks produced
+    since the previous one. The priority fee of an urgency level is the median of its
+    percentile over the window, never below MIN_PRIORITY_FEE (Polygon rejects lower
+    tips). Gas is estimated once per contract function and cached with a margin.
+    """
+
+    WINDOW = 20
+    BLOCK_TIME = 2.0
+    MAX_AGE = 10.0
+    # Reward percentiles asked from eth_feeHistory, one per urgency level
+    PERCENTILES = (25, 50, 90)
+    URGENCY = {"slow": 0, "normal": 1, "fast": 2}
+    MIN_PRIORITY_FEE = Web3.to_wei(30, "gwei")
+    MAX_FEE = Web3.to_wei(1000, "gwei")
+    BASE_FEE_MULTIPLIER = 2
+    FEE_BUMP = 1.125
+    GAS_MARGIN = 1.25
+    DEFAULT_GAS = 500000
+
+    def __init__(self, web3: Web3, addr: str):
+        self.web3 = web3
+        self.addr = addr
+        # block number -> (base fee, rewards at PERCENTILES)
+        self.blocks: "OrderedDict[int, Tuple[int, Tuple[int, ...]]]" = OrderedDict()
+        self.next_base_fee = 0
+        self.updated_at: Optional[float] = None
+        # function name -> gas limit
+        self.gas_limits: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if self.updated_at is None:
+            count = self.WINDOW
+        else:
+            count = min(self.WINDOW, math.ceil((now - self.updated_at) / self.BLOCK_TIME) + 1)
+        history = self.web3.eth.fee_history(count, "latest", list(self.PERCENTILES))
+        oldest = history["oldestBlock"]
+        rewards = history.get("reward") or []
+        with self._lock:
+            for offset, base_fee in enumerate(history["baseFeePerGas"][:-1]):
+                reward = tuple(rewards[offset]) if offset < len(rewards) else (0,) * len(self.PERCENTILES)
+                self.blocks[oldest + offset] = (base_fee, reward)
+                self.blocks.move_to_end(oldest + offset)
+            while len(self.blocks) > self.WINDOW:
+                self.blocks.popitem(last=False)
+            # The last base fee is the one of the next block
+            self.next_base_fee = history["baseFeePerGas"][-1]
+            self.updated_at = now
+
+    def fees(self, urgency: str = "normal") -> Tuple[int, int]:
+        """
+        Returns (maxFeePerGas, maxPriorityFeePerGas) in wei for an urgency level.
+        """
+        if self.updated_at is None or time.monotonic() - self.updated_at > self.MAX_AGE:
+            self.refresh()
+        level = self.URGENCY[urgency]
+        with self._lock:
+            tips = sorted(reward[level] for _, reward in self.blocks.values())
+            next_base_fee = self.next_base_fee
+        priority_fee = max(self.MIN_PRIORITY_FEE, tips[len(tips) // 2] if tips else 0)
+        max_fee = min(self.MAX_FEE, self.BASE_FEE_MULTIPLIER * next_base_fee + priority_fee)
+        return int(max_fee), int(min(priority_fee, max_fee))
+
+    def gas(self, fn: ContractFunction) -> int:
+        """
+        Gas limit for a contract call, estimated the first time the function is used.
+        """
+        key = fn.fn_name
+        with self._lock:
+            if key in self.gas_limits:
+                return self.gas_limits[key]
+        try:
+            limit = int(fn.estimate_gas({"from": self.addr}) * self.GAS_MARGIN)
+        except Exception as e:
+            # A call that would revert now may still be fine later, so nothing is cached
+            print(f"Error estimating gas for {key}: {e}")
+            return self.DEFAULT_GAS
+        with self._lock:
+            self.gas_limits[key] = limit
+        return limit
+
+    def bump(self, tx: dict) -> bool:
+        """
+        Raise the fees of a stuck transaction for a same nonce replacement: at least
+        FEE_BUMP over the previous fees (nodes require 10%) and at least the current
+        "fast" fees. Returns False if MAX_FEE does not leave room for a valid bump.
+        """
+        try:
+            fast_max_fee, fast_priority_fee = self.fees("fast")
+        except Exception as e:
+            print(f"Error reading fee history: {e}")
+            fast_max_fee, fast_priority_fee = 0, 0
+        max_fee = max(math.ceil(tx["maxFeePerGas"] * self.FEE_BUMP), fast_max_fee)
+        priority_fee = max(math.ceil(tx["maxPriorityFeePerGas"] * self.FEE_BUMP), fast_priority_fee)
+        if max_fee > self.MAX_FEE or priority_fee > max_fee:
+            return False
+        tx["maxFeePerGas"] = max_fee
+        tx["maxPriorityFeePerGas"] = priority_fee
+        return True
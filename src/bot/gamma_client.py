@@ -0,0 +1,112 @@
+"""GammaClient looks up market metadata in the Gamma API over a pooled, retrying session."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bot.metrics import metrics
+from bot.rate_limit import limits
+
+
+class GammaClient:
+    """
+    Gamma /markets lookups by slug.
+
+    One requests.Session keeps connections alive, every request has a connect and read
+    timeout, and connection errors, 429 and 5xx answers are retried up to RETRIES times
+    with exponential backoff. Markets found are cached by slug for TTL seconds, the
+    least recently used dropped beyond MAX_CACHED; slugs not found are not cached, since
+    upcoming markets are listed some time before they open. Requests spend the "gamma"
+    budget of limits and fail fast while its circuit is open.
+    """
+
+    # (connect, read) seconds
+    TIMEOUT = (3.05, 10)
+    RETRIES = 3
+    BACKOFF = 0.2
+    TTL = 3600
+    MAX_CACHED = 256
+    # Slugs per bulk request and markets per page of its answer
+    PAGE_SIZE = 50
+
+    def __init__(self, base_url: str):
+        """
+        Initialize GammaClient.
+
+        Args:
+            base_url: The Gamma API URL
+        """
+        self.base_url = base_url
+        self.session = requests.Session()
+        retry = Retry(total=self.RETRIES, backoff_factor=self.BACKOFF, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry))
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+        # slug -> (expiry time, market), least recently used first
+        self.cache: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def market(self, slug: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the Gamma market object of a slug, None if there is no such market yet.
+        """
+        return self.markets([slug]).get(slug)
+
+    def markets(self, slugs: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the market objects of many slugs, e.g. a series of upcoming slots.
+
+        Cached slugs are answered from the cache, the rest are requested PAGE_SIZE slugs
+        at a time, following the offset of each request until a short page.
+
+        Returns:
+            A dict mapping each slug found to its market, slugs not listed yet are left out
+        """
+        results = {}
+        missing = []
+        now = time.monotonic()
+        with self.cache_lock:
+            for slug in slugs:
+                cached = self.cache.get(slug)
+                if cached is not None and cached[0] > now:
+                    self.cache.move_to_end(slug)
+                    results[slug] = cached[1]
+                else:
+                    missing.append(slug)
+        for page_start in range(0, len(missing), self.PAGE_SIZE):
+            for market in self._fetch(missing[page_start:page_start + self.PAGE_SIZE]):
+                slug = market.get("slug")
+                if slug in missing:
+                    results[slug] = market
+                    self._remember(slug, market)
+        return results
+
+    def _fetch(self, slugs: List[str]) -> List[Dict[str, Any]]:
+        found = []
+        offset = 0
+        while True:
+            params = [("slug", slug) for slug in slugs] + [("limit", self.PAGE_SIZE), ("offset", offset)]
+            with limits.call("gamma"), metrics.timer("gamma"):
+                response = self.session.get(f"{self.base_url}/markets", params=params, timeout=self.TIMEOUT)
+            response.raise_for_status()
+            page = response.json()
+            found.extend(page)
+            # A slug names one market, so a full set needs no further page
+            if len(page) < self.PAGE_SIZE or len(found) >= len(slugs):
+                return found
+            offset += len(page)
+
+    def _remember(self, slug: str, market: Dict[str, Any]) -> None:
+        with self.cache_lock:
+            self.cache[slug] = (time.monotonic() + self.TTL, market)
+            self.cache.move_to_end(slug)
+            while len(self.cache) > self.MAX_CACHED:
+                self.cache.popitem(last=False)
+
+    def close(self) -> None:
+        self.session.close()
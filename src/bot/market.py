@@ -1,92 +1,466 @@
-from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import MarketOrderArgs, OrderType
-from py_clob_client.order_builder.constants import BUY
+import threading
+import time
+from bisect import bisect_left, insort
+
+from typing import TYPE_CHECKING, Callable, Optional
+
+from bot.metrics import metrics
+from bot.order_tracker import OrderTracker, TrackedOrder
+from bot.rate_limit import AdaptivePoll, RateLimited, limits
+
+if TYPE_CHECKING:
+    from py_clob_client.clob_types import OrderBookSummary
+
+    from bot.clob_session import ClobSession
+
+# py_clob_client's BUY side. The client's types are imported where orders are built, so
+# that books, strategies and backtests load without pulling in the signing stack.
+BUY = "BUY"
+
+
+class OrderBook:
+    """
+    Local order book of one token.
+
+    Prices of each side are kept in an ascending list located by binary search, with
+    sizes in a dict keyed by price, so the best level is an index lookup and depth
+    and fill queries walk levels in price order without sorting. Adding or removing a
+    level finds it in O(log n) but shifts the list in O(n), a memmove that stays cheap
+    for the few hundred levels a CLOB book has.
+
+    A stream thread may update the book while other threads read it, so reads look
+    sizes up with get() and treat a level removed meanwhile as empty.
+    """
+
+    def __init__(self) -> None:
+        self.tick_size: str = None
+        self.bid_prices: list[float] = []
+        self.ask_prices: list[float] = []
+        self.bid_sizes: dict[float, float] = {}
+        self.ask_sizes: dict[float, float] = {}
+
+    @classmethod
+    def from_summary(cls, summary: "OrderBookSummary") -> "OrderBook":
+        book = cls()
+        book.tick_size = summary.tick_size
+        book.reset(
+            [(level.price, level.size) for level in summary.bids or []],
+            [(level.price, level.size) for level in summary.asks or []],
+        )
+        return book
+
+    def reset(self, bids, asks) -> None:
+        """
+        Replace the book with a snapshot of (price, size) levels in any order.
+        """
+        self.bid_sizes = {float(price): float(size) for price, size in bids if float(size) > 0}
+        self.ask_sizes = {float(price): float(size) for price, size in asks if float(size) > 0}
+        self.bid_prices = sorted(self.bid_sizes)
+        self.ask_prices = sorted(self.ask_sizes)
+
+    def apply_delta(self, side: str, price: float, size: float) -> None:
+        """
+        Set the size of a level, removing it when size is zero. Changing the size of a
+        level is O(1), adding or removing one O(n), see the class docstring.
+
+        Args:
+            side: BUY for bids, SELL for asks
+            price: Level price
+            size: New total size at the level
+        """
+        prices, sizes = (self.bid_prices, self.bid_sizes) if side == BUY else (self.ask_prices, self.ask_sizes)
+        if size > 0:
+            if price not in sizes:
+                insort(prices, price)
+            sizes[price] = size
+        elif price in sizes:
+            del sizes[price]
+            del prices[bisect_left(prices, price)]
+
+    def best_bid(self) -> tuple[float, float]:
+        if not self.bid_prices:
+            return 0, 0
+        price = self.bid_prices[-1]
+        return price, self.bid_sizes.get(price, 0)
+
+    def best_ask(self) -> tuple[float, float]:
+        if not self.ask_prices:
+            return 0, 0
+        price = self.ask_prices[0]
+        return price, self.ask_sizes.get(price, 0)
+
+    def ask_depth(self, max_price: float) -> float:
+        """
+        Total size offered at or below max_price.
+        """
+        end = bisect_left(self.ask_prices, max_price)
+        if end < len(self.ask_prices) and self.ask_prices[end] == max_price:
+            end += 1
+        return sum(self.ask_sizes.get(price, 0) for price in self.ask_prices[:end])
+
+    def bid_depth(self, min_price: float) -> float:
+        """
+        Total size bid at or above min_price.
+        """
+        start = bisect_left(self.bid_prices, min_price)
+        return sum(self.bid_sizes.get(price, 0) for price in self.bid_prices[start:])
+
+    def buy_vwap(self, size: float) -> tuple[float, float]:
+        """
+        Price a buy of the given size by walking the asks from the best level.
+
+        Returns:
+            A tuple of (vwap, worst_price), or (0, 0) if the asks cannot fill the size
+        """
+        return self._vwap(self.ask_prices, self.ask_sizes, size)
+
+    def sell_vwap(self, size: float) -> tuple[float, float]:
+        """
+        Price a sell of the given size by walking the bids from the best level.
+
+        Returns:
+            A tuple of (vwap, worst_price), or (0, 0) if the bids cannot fill the size
+        """
+        return self._vwap(reversed(self.bid_prices), self.bid_sizes, size)
+
+    @staticmethod
+    def _vwap(prices, sizes: dict[float, float], size: float) -> tuple[float, float]:
+        remaining = size
+        cost = 0.0
+        for price in prices:
+            take = min(remaining, sizes.get(price, 0))
+            cost += take * price
+            remaining -= take
+            if remaining <= 0:
+                return cost / size, price
+        return 0, 0
+
 
 class Market:
-    def __init__(self, host: str, pk: str, chain_id: int, condition_id: str, dry: bool) -> None:
+    def __init__(self, session: "ClobSession", condition_id: str, dry: bool, stream_url: str = None, stream=None,
+                 tracker: Optional[OrderTracker] = None) -> None:
+        """
+        Lightweight view of one condition over a shared ClobSession. Books come from REST,
+        from a MarketStream shared with other markets, or from an own stream when stream_url is set.
+        Accepted orders are followed by the tracker, if any, until their fills are confirmed.
+        Every CLOB call spends the budget of its endpoint in limits, and poll paces REST
+        book polling by how often the books change.
+        """
         self.dry = dry
         self.condition_id = condition_id
-        self.client = ClobClient(host, key=pk, chain_id=chain_id)
-        self.client.set_api_creds(self.client.create_or_derive_api_creds())
-        self.info = self.client.get_market(self.condition_id)
+        self.session = session
+        self.client = session.client
+        self.info = session.get_market(self.condition_id)
         self.upTokenId = self.info['tokens'][0]['token_id']
         self.downTokenId = self.info['tokens'][1]['token_id']
+        self.stream = stream
+        self.owns_stream = False
+        self.stream_version = 0
+        self.recorder = None
+        self.tracker = tracker
+        self._fill_listeners: list[Callable[[str, float, float], None]] = []
+        self._book_listeners: list[Callable[[str, OrderBook], None]] = []
+        # The async engine reads both books at once, listeners still get them one at a time
+        self._book_lock = threading.Lock()
+        self.poll = AdaptivePoll(limits.upstream("clob_book"))
+        # token_id -> last REST book, to tell whether a poll found anything new
+        self._polled: dict[str, OrderBook] = {}
+        if self.stream is not None:
+            self.stream.add_tokens([self.upTokenId, self.downTokenId])
+        elif stream_url:
+            from bot.market_stream import MarketStream
+            self.stream = MarketStream(stream_url, [self.upTokenId, self.downTokenId], self.client.get_order_book)
+            self.owns_stream = True
+            self.stream.start()
+
+    def start_recording(self, recorder, market: str, start: int) -> None:
+        """
+        Record every book of this slot seen from now on with a BookRecorder.
+        """
+        self.recorder = recorder.open_slot(market, start, self.condition_id, self.upTokenId, self.downTokenId)
+        if self.stream is not None:
+            self.stream.add_book_listener(self.recorder.on_book)
+
+    def record_until(self, deadline: float, interval: float) -> None:
+        """
+        Keep recording after trading stopped, until the unix time deadline. Stream books
+        are recorded as they change, REST books are polled every interval seconds.
+        """
+        while self.recorder is not None and time.time() < deadline:
+            timeout = min(interval, deadline - time.time())
+            if self.stream is not None:
+                self.wait_for_update(timeout)
+            else:
+                self.up_book()
+                self.down_book()
+                time.sleep(max(0.0, timeout))
+
+    def add_fill_listener(self, listener: Callable[[str, float, float], None]) -> None:
+        """
+        Register a callback run with (leg, shares, cost) whenever confirmed fills change
+        what was counted for an order, on the tracker's thread.
+        """
+        self._fill_listeners = self._fill_listeners + [listener]
+
+    def remove_fill_listener(self, listener: Callable[[str, float, float], None]) -> None:
+        self._fill_listeners = [item for item in self._fill_listeners if item is not listener]
+
+    def add_book_listener(self, listener: Callable[[str, OrderBook], None]) -> None:
+        """
+        Register a callback run with (leg, book) for every book of either leg read from
+        the stream or REST, on the thread that read it.
+        """
+        self._book_listeners = self._book_listeners + [listener]
+
+    def remove_book_listener(self, listener: Callable[[str, OrderBook], None]) -> None:
+        self._book_listeners = [item for item in self._book_listeners if item is not listener]
+
+    def place_limit_buy(self, leg: str, price: float, size: float, expiration: int = 0) -> Optional[TrackedOrder]:
+        """
+        Rest a BUY of size shares of the "up" or "down" leg at price, as GTD when an
+        expiration is given and GTC otherwise. Fills only reach the fill listeners, so
+        this needs a tracker and is never done in dry mode.
+        """
+        if self.dry or self.tracker is None:
+            return None
+        from py_clob_client.clob_types import OrderArgs, OrderType
+
+        token_id = self.upTokenId if leg == "up" else self.downTokenId
+        order_type = OrderType.GTD if expiration else OrderType.GTC
+        try:
+            with metrics.timer("order_sign"):
+                order_args = OrderArgs(token_id=token_id, price=price, size=size, side=BUY, expiration=expiration)
+                signed_order = self.client.create_order(order_args, self.session.order_options.get(token_id))
+            with limits.call("clob_order"), metrics.timer("order_post", side=leg):
+                response = self.session.authed(self.client.post_order, signed_order, order_type)
+        except RateLimited as e:
+            print(f"Skipped resting BUY order: {e}")
+            metrics.inc("orders", side=leg, result="rate_limited")
+            return None
+        except Exception as e:
+            print(f"Error placing resting BUY order: {str(e)}")
+            metrics.inc("orders", side=leg, result="error")
+            return None
+        if not response.get("success"):
+            print(f"Failed to place resting BUY order: {response.get('error', 'Unknown error')}")
+            metrics.inc("orders", side=leg, result="rejected")
+            return None
+        print(f"Resting BUY {size} {leg.upper()} at ${price:.4f}")
+        metrics.inc("orders", side=leg, result="resting")
+        return self._track(response, token_id, leg, price, size, order_type)
+
+    def cancel_order(self, order_id: str) -> bool:
+        try:
+            with limits.call("clob_order"):
+                canceled = order_id in (self.session.authed(self.client.cancel, order_id).get("canceled") or [])
+        except Exception as e:
+            print(f"Error canceling order {order_id}: {str(e)}")
+            return False
+        if canceled and self.tracker is not None:
+            self.tracker.on_canceled(order_id)
+        return canceled
+
+    def _track(self, response: dict, token_id: str, leg: str, price: float, size: float, order_type: str,
+               booked: tuple[float, float] = (0.0, 0.0)) -> Optional[TrackedOrder]:
+        order_id = response.get("orderID")
+        if self.tracker is None or not order_id:
+            return None
+        return self.tracker.track(order_id, self.condition_id, token_id, leg, price, size, order_type, booked,
+                                  self._on_fill_update)
+
+    def _on_fill_update(self, order: TrackedOrder, size: float, cost: float) -> None:
+        for listener in self._fill_listeners:
+            listener(order.leg, size, cost)
+
+    def close(self) -> None:
+        if self.tracker is not None:
+            for order in self.tracker.open_orders(self.condition_id):
+                if order.resting:
+                    self.cancel_order(order.order_id)
+        if self.recorder is not None:
+            if self.stream is not None:
+                self.stream.remove_book_listener(self.recorder.on_book)
+            self.recorder.close()
+            self.recorder = None
+        if self.session.presigned is not None:
+            self.session.presigned.untrack(self.upTokenId)
+            self.session.presigned.untrack(self.downTokenId)
+        if self.stream is not None:
+            if self.owns_stream:
+                self.stream.stop()
+            else:
+                self.stream.remove_tokens([self.upTokenId, self.downTokenId])
+            self.stream = None
+
+    def wait_for_update(self, timeout: float) -> None:
+        """
+        Wait until one of the books changes, or just sleep for the timeout without a stream.
+        """
+        if self.stream is None:
+            time.sleep(timeout)
+            return
+        self.stream_version = self.stream.wait_for_update(self.stream_version, timeout)
 
     def market_info(self) -> str:
-        return self.client.get_market(self.condition_id)
+        with limits.call("clob_market"):
+            return self.client.get_market(self.condition_id)
+
+    def order_book(self, token_id: str) -> OrderBook:
+        if self.stream is not None and self.stream.is_synced(token_id):
+            with metrics.timer("book_fetch", source="stream"):
+                book = self.stream.book(token_id)
+        else:
+            try:
+                with limits.call("clob_book"), metrics.timer("book_fetch", source="rest"):
+                    summary = self.client.get_order_book(token_id)
+            except RateLimited:
+                # No asks, so nothing is bought until the endpoint takes requests again
+                return OrderBook()
+            book = OrderBook.from_summary(summary)
+            previous = self._polled.get(token_id)
+            self.poll.observe(previous is None or previous.ask_sizes != book.ask_sizes
+                              or previous.bid_sizes != book.bid_sizes)
+            self._polled[token_id] = book
+            if self.recorder is not None:
+                self.recorder.on_book(token_id, book)
+        if self.session.presigned is not None:
+            self.session.presigned.track(token_id, book.best_ask()[0], book.tick_size)
+        if self._book_listeners:
+            leg = "up" if token_id == self.upTokenId else "down"
+            with self._book_lock:
+                for listener in self._book_listeners:
+                    listener(leg, book)
+        return book
+
+    def up_book(self) -> OrderBook:
+        return self.order_book(self.upTokenId)
+
+    def down_book(self) -> OrderBook:
+        return self.order_book(self.downTokenId)
 
     def best_up_ask(self) -> tuple[float, float]:
-        order_book = self.client.get_order_book(self.upTokenId)
-        if not order_book.asks:
-            return 0, 0
-        return float(order_book.asks[-1].price), float(order_book.asks[-1].size)
+        return self.up_book().best_ask()
 
     def best_down_ask(self) -> tuple[float, float]:
-        order_book = self.client.get_order_book(self.downTokenId)
-        if not order_book.asks:
-            return 0, 0
-        return float(order_book.asks[-1].price), float(order_book.asks[-1].size)
+        return self.down_book().best_ask()
+
+    def up_fill(self, size: float) -> tuple[float, float]:
+        """
+        Returns (vwap, worst_price) of buying size UP across the ask levels, (0, 0) if the book is too thin.
+        """
+        return self.up_book().buy_vwap(size)
+
+    def down_fill(self, size: float) -> tuple[float, float]:
+        """
+        Returns (vwap, worst_price) of buying size DOWN across the ask levels, (0, 0) if the book is too thin.
+        """
+        return self.down_book().buy_vwap(size)
+
+    def sign_buy(self, token_id: str, price: float, size: float, limit_price: float):
+        """
+        Returns a presigned FOK order for size shares at limit_price when one is cached,
+        otherwise signs a market order for size * price dollars now.
+        """
+        if self.session.presigned is not None:
+            signed_order = self.session.presigned.take(token_id, limit_price, size)
+            if signed_order is not None:
+                return signed_order
+        from py_clob_client.clob_types import MarketOrderArgs
 
-    def buy_up(self, price: float, size: float) -> bool:
+        order_args = MarketOrderArgs(
+            token_id=str(token_id),
+            amount=float(size * price),
+            side=BUY,
+            price=float(limit_price),
+        )
+        return self.client.create_market_order(order_args, self.session.order_options.get(order_args.token_id))
+
+    def buy_up(self, price: float, size: float, limit_price: float = None) -> bool:
+        """
+        Buy size UP for about price per share, sweeping asks up to limit_price (defaults to price).
+        """
+        limit_price = limit_price or price
         if self.dry:
-            cur_price,  cur_size = self.best_up_ask()
-            if cur_price > price or size > cur_size:
+            _, worst_price = self.up_fill(size)
+            if not worst_price or worst_price > limit_price:
                 return False
             print(f"Buying {size} UP at {price}")
             return True
         else:
+            from py_clob_client.clob_types import OrderType
+
             # Real order posting
             try:
-                amount_in_dollars = size * price
-                
-                order_args = MarketOrderArgs(
-                    token_id=str(self.upTokenId),
-                    amount=float(amount_in_dollars),
-                    side=BUY,
-                )
-                signed_order = self.client.create_market_order(order_args)
-                response = self.client.post_order(signed_order, OrderType.FOK)
+                with metrics.timer("order_sign"):
+                    signed_order = self.sign_buy(self.upTokenId, price, size, limit_price)
+                with limits.call("clob_order"), metrics.timer("order_post", side="up"):
+                    response = self.session.authed(self.client.post_order, signed_order, OrderType.FOK)
                 
                 if response.get("success"):
-                    filled = response.get("data", {}).get("filledAmount", amount_in_dollars)
+                    filled = response.get("data", {}).get("filledAmount", size * price)
                     print(f"Order placed: BUY {filled:.4f} shares of UP token at ${price:.4f}")
+                    metrics.inc("orders", side="up", result="filled")
+                    metrics.event("fill", market=self.condition_id, side="up", price=price, size=size)
+                    # The strategy books size at price, confirmed fills correct that later
+                    self._track(response, self.upTokenId, "up", limit_price, size, OrderType.FOK, (size, size * price))
                     return True
                 else:
                     error_msg = response.get("error", "Unknown error")
                     print(f"Failed to place BUY order: {error_msg}")
+                    metrics.inc("orders", side="up", result="rejected")
+                    metrics.event("rejection", market=self.condition_id, side="up", price=price, error=error_msg)
                     return False
+            except RateLimited as e:
+                print(f"Skipped BUY order: {e}")
+                metrics.inc("orders", side="up", result="rate_limited")
+                return False
             except Exception as e:
                 print(f"Error placing BUY order: {str(e)}")
+                metrics.inc("orders", side="up", result="error")
+                metrics.event("order_error", market=self.condition_id, side="up", error=str(e))
                 return False
 
-    def buy_down(self, price: float, size: float) -> bool:
+    def buy_down(self, price: float, size: float, limit_price: float = None) -> bool:
+        """
+        Buy size DOWN for about price per share, sweeping asks up to limit_price (defaults to price).
+        """
+        limit_price = limit_price or price
         if self.dry:
-            cur_price,  cur_size = self.best_down_ask()
-            if cur_price > price or size > cur_size:
+            _, worst_price = self.down_fill(size)
+            if not worst_price or worst_price > limit_price:
                 return False
             print(f"Buying {size} DOWN at {price}")
             return True
         else:
+            from py_clob_client.clob_types import OrderType
+
             # Real order posting
             try:
-                amount_in_dollars = size * price
-                
-                order_args = MarketOrderArgs(
-                    token_id=str(self.downTokenId),
-                    amount=float(amount_in_dollars),
-                    side=BUY,
-                )
-                signed_order = self.client.create_market_order(order_args)
-                response = self.client.post_order(signed_order, OrderType.FOK)
+                with metrics.timer("order_sign"):
+                    signed_order = self.sign_buy(self.downTokenId, price, size, limit_price)
+                with limits.call("clob_order"), metrics.timer("order_post", side="down"):
+                    response = self.session.authed(self.client.post_order, signed_order, OrderType.FOK)
                 
                 if response.get("success"):
-                    filled = response.get("data", {}).get("filledAmount", amount_in_dollars)
+                    filled = response.get("data", {}).get("filledAmount", size * price)
                     print(f"Order placed: BUY {filled:.4f} shares of DOWN token at ${price:.4f}")
+                    metrics.inc("orders", side="down", result="filled")
+                    metrics.event("fill", market=self.condition_id, side="down", price=price, size=size)
+                    # The strategy books size at price, confirmed fills correct that later
+                    self._track(response, self.downTokenId, "down", limit_price, size, OrderType.FOK, (size, size * price))
                     return True
                 else:
                     error_msg = response.get("error", "Unknown error")
                     print(f"Failed to place BUY order: {error_msg}")
+                    metrics.inc("orders", side="down", result="rejected")
+                    metrics.event("rejection", market=self.condition_id, side="down", price=price, error=error_msg)
                     return False
+            except RateLimited as e:
+                print(f"Skipped BUY order: {e}")
+                metrics.inc("orders", side="down", result="rate_limited")
+                return False
             except Exception as e:
                 print(f"Error placing BUY order: {str(e)}")
+                metrics.inc("orders", side="down", result="error")
+                metrics.event("order_error", market=self.condition_id, side="down", error=str(e))
                 return False
@@ -1,58 +1,78 @@
-import time
 from datetime import datetime, timezone, timedelta
-import json
-import requests
+from typing import Any, Callable, Dict, List, Optional
+
+from bot.gamma_client import GammaClient
+from bot.slot_clock import SlotClock
 
 
 class MarketFinder:
-    def __init__(self, base_url: str) -> None:
+    def __init__(self, base_url: str, asset: str = "btc", slot_minutes: int = 15,
+                 clock: Optional[SlotClock] = None, gamma: Optional[GammaClient] = None) -> None:
+        """
+        Finds the up/down markets of one asset and slot duration, e.g. btc-updown-15m-<start>.
+        Slot boundaries come from clock and markets from gamma, both of which finders of
+        several markets can share.
+        """
         self.base_url = base_url
+        self.asset = asset
+        self.slot_minutes = slot_minutes
+        self.slot_seconds = slot_minutes * 60
+        self.clock = clock if clock is not None else SlotClock()
+        self.gamma = gamma if gamma is not None else GammaClient(base_url)
+
+    @property
+    def slot_label(self) -> str:
+        if self.slot_minutes % 60 == 0:
+            return f"{self.slot_minutes // 60}h"
+        return f"{self.slot_minutes}m"
+
+    @property
+    def name(self) -> str:
+        return f"{self.asset}-{self.slot_label}"
 
-    @staticmethod
-    def get_current_slot_start() -> datetime:
+    def get_current_slot_start(self) -> datetime:
         """
         Returns the start timestamp of the current time slot.
         For 15-minute slots, this returns the start of the current 15-minute interval.
         """
-        now = datetime.now(timezone.utc)
-        # Round down to the nearest 15-minute mark (0, 15, 30, or 45)
-        slot_minute = (now.minute // 15) * 15
-        slot_start = now.replace(minute=slot_minute, second=0, microsecond=0)
-        return slot_start
+        # Round down to the nearest slot boundary (0, 15, 30, or 45 for 15-minute slots)
+        slot_start = int(self.clock.now()) // self.slot_seconds * self.slot_seconds
+        return datetime.fromtimestamp(slot_start, timezone.utc)
 
-    @staticmethod
-    def get_prev_slot_start(start: datetime) -> datetime:
+    def get_prev_slot_start(self, start: datetime) -> datetime:
         """
-        Returns the start timestamp of the previous slot (15 minutes before the given start).
+        Returns the start timestamp of the previous slot (one slot before the given start).
         """
-        return start - timedelta(minutes=15)
+        return start - timedelta(minutes=self.slot_minutes)
 
-    @staticmethod
-    def get_next_slot_start(start: datetime) -> datetime:
+    def get_next_slot_start(self, start: datetime) -> datetime:
         """
-        Returns the start timestamp of the next slot (15 minutes after the given start).
+        Returns the start timestamp of the next slot (one slot after the given start).
         """
-        return start + timedelta(minutes=15)
+        return start + timedelta(minutes=self.slot_minutes)
 
-    @staticmethod
-    def slot_is_active(start: datetime) -> bool:
-        dt = datetime.now(timezone.utc) - start
-        return int(dt.total_seconds()) < 60 * 15
+    def slot_end(self, start: datetime) -> float:
+        """
+        Returns the unix time the slot starting at start ends.
+        """
+        return start.timestamp() + self.slot_seconds
 
-    @staticmethod
-    def wait_until_next_slot_start(start: datetime) -> None:
-        now = datetime.now(timezone.utc)
-        if now >= start + timedelta(minutes=15):
-            return
-        dt = now - start
-        time.sleep(60 * 15 - dt.total_seconds())
+    def slot_is_active(self, start: datetime) -> bool:
+        return self.clock.now() < self.slot_end(start)
+
+    def wait_until_next_slot_start(self, start: datetime, warmup: Optional[Callable[[], Any]] = None,
+                                   lead: float = 0.0) -> Any:
+        """
+        Sleeps until the slot after start opens, calling warmup lead seconds before
+        that if given, and returns what warmup returned.
+        """
+        return self.clock.wait_until(self.slot_end(start), warmup, lead)
 
-    @staticmethod
-    def get_market_slug_by_start(start: datetime) -> str:
+    def get_market_slug_by_start(self, start: datetime) -> str:
         """
         Returns the slug for a market given its slot start datetime.
         """
-        return f"btc-updown-15m-{int(start.timestamp())}"
+        return f"{self.asset}-updown-{self.slot_label}-{int(start.timestamp())}"
 
     def get_current_market_slug(self) -> str:
         """
@@ -62,53 +82,56 @@ class MarketFinder:
 
     def get_market_id_by_slug(self, slug: str) -> str:
         """
-        Returns the conditionId for a market given its slug.
+        Returns the conditionId for a market given its slug, from the Gamma client's cache if it is there.
+        """
+        market = self.gamma.market(slug)
+        if market is None:
+            raise ValueError("No market found in response")
+        return market["conditionId"]
+
+    def get_market_ids_by_slugs(self, slugs: List[str]) -> Dict[str, str]:
         """
-        url = f"{self.base_url}/markets?slug={slug}"
-        response = requests.get(url)
-        data = json.loads(response.text)
-        # Response is an array with one object, extract conditionId from it
-        if data and len(data) > 0:
-            return data[0]["conditionId"]
-        raise ValueError("No market found in response")
+        Returns the conditionIds of the markets listed for any of the slugs, looked up together.
+        """
+        return {slug: market["conditionId"] for slug, market in self.gamma.markets(slugs).items()}
+
+    def get_upcoming_market_ids(self, start: datetime, count: int) -> Dict[str, str]:
+        """
+        Looks up the markets of count slots from the one starting at start in one bulk
+        request, so each of them is cached before it opens.
+
+        Returns:
+            A dict mapping the slug of each market already listed to its conditionId
+        """
+        starts = [start + timedelta(minutes=self.slot_minutes * i) for i in range(count)]
+        return self.get_market_ids_by_slugs([self.get_market_slug_by_start(slot_start) for slot_start in starts])
+
+    def get_market_id_by_start(self, start: datetime) -> str:
+        return self.get_market_id_by_slug(self.get_market_slug_by_start(start))
 
     def get_current_market_id(self) -> str:
         return self.get_market_id_by_slug(self.get_current_market_slug())
 
     def get_prev_market_slug(self) -> str:
         """
-        Returns the slug of the previous market (15 minutes before current slot).
+        Returns the slug of the previous market (one slot before current slot).
         """
-        prev_slot_start = self.get_current_slot_start() - timedelta(minutes=15)
-        return f"btc-updown-15m-{int(prev_slot_start.timestamp())}"
+        return self.get_market_slug_by_start(self.get_prev_slot_start(self.get_current_slot_start()))
 
     def get_next_market_slug(self) -> str:
         """
-        Returns the slug of the next market (15 minutes after current slot).
+        Returns the slug of the next market (one slot after current slot).
         """
-        next_slot_start = self.get_current_slot_start() + timedelta(minutes=15)
-        return f"btc-updown-15m-{int(next_slot_start.timestamp())}"
+        return self.get_market_slug_by_start(self.get_next_slot_start(self.get_current_slot_start()))
 
     def get_prev_market_id(self) -> str:
         """
         Returns the conditionId of the previous market.
         """
-        url = f"{self.base_url}/markets?slug={self.get_prev_market_slug()}"
-        response = requests.get(url)
-        data = json.loads(response.text)
-        # Response is an array with one object, extract conditionId from it
-        if data and len(data) > 0:
-            return data[0]["conditionId"]
-        raise ValueError("No market found in response")
+        return self.get_market_id_by_slug(self.get_prev_market_slug())
 
     def get_next_market_id(self) -> str:
         """
         Returns the conditionId of the next market.
         """
-        url = f"{self.base_url}/markets?slug={self.get_next_market_slug()}"
-        response = requests.get(url)
-        data = json.loads(response.text)
-        # Response is an array with one object, extract conditionId from it
-        if data and len(data) > 0:
-            return data[0]["conditionId"]
-        raise ValueError("No market found in response")
\ No newline at end of file
+        return self.get_market_id_by_slug(self.get_next_market_slug())
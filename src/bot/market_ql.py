@@ -1,72 +1,82 @@
 """MarketQL makes GraphQL requests to query market data."""
 
+import threading
+
 import requests
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+from bot.metrics import metrics
+from bot.rate_limit import RateLimited, limits
 
 
 class MarketQL:
     """Makes GraphQL requests to query Polymarket data."""
-    
+
+    PAGE_SIZE = 500
+    MAX_CACHED = 10000
+    TIMEOUT = 10
+
     def __init__(self, url: str):
         """
         Initialize MarketQL with the GraphQL endpoint URL.
-        
+
         Args:
             url: The GraphQL endpoint URL
         """
         self.url = url
-    
+        # One keep-alive connection pool for every query
+        self.session = requests.Session()
+        # A resolved condition never changes, so its result is kept: condition_id -> winning_index
+        self.resolved_cache: Dict[str, Optional[int]] = {}
+        self.cache_lock = threading.Lock()
+
     def resolved(self, condition_id: str) -> Tuple[bool, Optional[int]]:
         """
         Check if a condition is resolved by querying payoutNumerators.
-        
+
         Args:
             condition_id: The condition ID to query (hex string)
-            
+
         Returns:
             A tuple of (is_resolved, winning_index):
             - is_resolved: True if payoutNumerators is not empty, False otherwise
             - winning_index: The index of the payout numerator whose value equals payoutDenominator if resolved, None otherwise
         """
-        # Format the query with the condition_id inline
-        query = f'''{{
-  condition(id:"{condition_id}"){{
+        with self.cache_lock:
+            if condition_id in self.resolved_cache:
+                return (True, self.resolved_cache[condition_id])
+
+        query = """query($id: ID!) {
+  condition(id: $id) {
     id
     positionIds
     payoutNumerators
     payoutDenominator
-  }}
-}}'''
-        
+  }
+}"""
+
         payload = {
-            "query": query
+            "query": query,
+            "variables": {"id": condition_id},
         }
-        
+
         try:
-            response = requests.post(self.url, json=payload)
+            with limits.call("subgraph"), metrics.timer("graphql", query="condition"):
+                response = self.session.post(self.url, json=payload, timeout=self.TIMEOUT)
             response.raise_for_status()
             data: Dict[str, Any] = response.json()
-            
+
             # Check if we have data and a condition
-            if "data" in data and "condition" in data["data"]:
-                condition = data["data"]["condition"]
-                payout_numerators = condition.get("payoutNumerators", [])
-                payout_denominator = str(condition.get("payoutDenominator", "0"))
-                
-                # Check if resolved (payoutNumerators is not empty)
-                if len(payout_numerators) > 0:
-                    # Find the index whose value equals payoutDenominator (winning outcome)
-                    for idx, numerator in enumerate(payout_numerators):
-                        # Handle both string and numeric values
-                        if str(numerator) == payout_denominator:
-                            return (True, idx)
-                    # If we have numerators but none matches the denominator, still return resolved but no winning index
-                    return (True, None)
-                
-                return (False, None)
-            
+            if "data" in data and data["data"].get("condition"):
+                result = self.winning_index(data["data"]["condition"])
+                self._remember(condition_id, result)
+                return result
+
+            return (False, None)
+
+        except RateLimited as e:
+            print(f"Skipped GraphQL request: {e}")
             return (False, None)
-            
         except requests.exceptions.RequestException as e:
             print(f"Error making GraphQL request: {e}")
             return (False, None)
@@ -74,3 +84,85 @@ class MarketQL:
             print(f"Error parsing GraphQL response: {e}")
             return (False, None)
 
+    @staticmethod
+    def winning_index(condition: Dict[str, Any]) -> Tuple[bool, Optional[int]]:
+        """
+        Returns (is_resolved, winning_index) for a condition object of the subgraph.
+        """
+        payout_numerators = condition.get("payoutNumerators") or []
+        payout_denominator = str(condition.get("payoutDenominator", "0"))
+        # Check if resolved (payoutNumerators is not empty)
+        if len(payout_numerators) == 0:
+            return (False, None)
+        # Find the index whose value equals payoutDenominator (winning outcome)
+        for idx, numerator in enumerate(payout_numerators):
+            # Handle both string and numeric values
+            if str(numerator) == payout_denominator:
+                return (True, idx)
+        # If we have numerators but none matches the denominator, still return resolved but no winning index
+        return (True, None)
+
+    def resolved_many(self, condition_ids: List[str]) -> Dict[str, Tuple[bool, Optional[int]]]:
+        """
+        Check many conditions with as few queries as possible.
+
+        Conditions already known to be resolved are answered from the cache, the rest
+        are sent in id_in queries of up to PAGE_SIZE ids each.
+
+        Args:
+            condition_ids: The condition IDs to query (hex strings)
+
+        Returns:
+            A dict mapping each requested condition ID to (is_resolved, winning_index).
+            Conditions the subgraph does not know yet are reported unresolved.
+        """
+        results = {}
+        # The subgraph stores ids lower case
+        requested: Dict[str, str] = {}
+        with self.cache_lock:
+            for condition_id in condition_ids:
+                if condition_id in self.resolved_cache:
+                    results[condition_id] = (True, self.resolved_cache[condition_id])
+                else:
+                    results[condition_id] = (False, None)
+                    requested[condition_id.lower()] = condition_id
+
+        ids = list(requested)
+        for page_start in range(0, len(ids), self.PAGE_SIZE):
+            for condition in self._query_conditions(ids[page_start:page_start + self.PAGE_SIZE]):
+                condition_id = requested.get(condition["id"].lower())
+                if condition_id is not None:
+                    results[condition_id] = self.winning_index(condition)
+                    self._remember(condition_id, results[condition_id])
+        return results
+
+    def _query_conditions(self, ids: List[str]) -> List[Dict[str, Any]]:
+        query = """query($ids: [ID!], $first: Int!) {
+  conditions(where: {id_in: $ids}, first: $first) {
+    id
+    payoutNumerators
+    payoutDenominator
+  }
+}"""
+        payload = {"query": query, "variables": {"ids": ids, "first": len(ids)}}
+        try:
+            with limits.call("subgraph"), metrics.timer("graphql", query="conditions"):
+                response = self.session.post(self.url, json=payload, timeout=self.TIMEOUT)
+            response.raise_for_status()
+            data: Dict[str, Any] = response.json()
+            return (data.get("data") or {}).get("conditions") or []
+        except RateLimited as e:
+            print(f"Skipped GraphQL request: {e}")
+        except requests.exceptions.RequestException as e:
+            print(f"Error making GraphQL request: {e}")
+        except (KeyError, ValueError) as e:
+            print(f"Error parsing GraphQL response: {e}")
+        return []
+
+    def _remember(self, condition_id: str, result: Tuple[bool, Optional[int]]) -> None:
+        if not result[0]:
+            return
+        with self.cache_lock:
+            if len(self.resolved_cache) >= self.MAX_CACHED:
+                self.resolved_cache.pop(next(iter(self.resolved_cache)))
+            self.resolved_cache[condition_id] = result[1]
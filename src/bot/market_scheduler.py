@@ -0,0 +1,273 @@
+"""Runs the pair-cost strategy on many up/down markets from one event loop."""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+import os
+import time
+from typing import TYPE_CHECKING, Optional
+
+from bot.async_engine import AsyncMarket, AsyncTradeStrategy, run_slot
+from bot.book_recorder import BookRecorder
+from bot.config import Config
+from bot.market import Market
+from bot.gamma_client import GammaClient
+from bot.market_finder import MarketFinder
+from bot.order_tracker import OrderTracker
+from bot.pnl import PnL
+from bot.prefetch import MarketPrefetcher
+from bot.settlement import SettlementWorker
+from bot.sharding import ShardReporter
+from bot.slot_clock import SlotClock
+from bot.state_store import SlotPosition, StateStore
+
+if TYPE_CHECKING:
+    from bot.account_manager import AccountManager
+    from bot.clob_session import ClobSession
+
+
+@dataclass(frozen=True)
+class MarketSpec:
+    asset: str
+    slot_minutes: int
+
+    @property
+    def name(self) -> str:
+        return MarketFinder('', self.asset, self.slot_minutes).name
+
+    @classmethod
+    def parse_list(cls, text: str) -> list["MarketSpec"]:
+        """
+        Parses a list like "btc:15,eth:15,sol:60" of asset:slot_minutes entries.
+        """
+        specs = []
+        for item in text.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            asset, _, minutes = item.partition(":")
+            specs.append(cls(asset.strip().lower(), int(minutes or 15)))
+        return specs
+
+
+class MarketStats:
+    """Tick latency and throughput of one market across slots."""
+
+    MAX_SAMPLES = 10000
+
+    def __init__(self, name: str):
+        self.name = name
+        self.slots = 0
+        self.ticks = 0
+        self.orders = 0
+        self.trading_seconds = 0.0
+        self.first_order_delays = deque(maxlen=self.MAX_SAMPLES)
+        self.latencies = deque(maxlen=self.MAX_SAMPLES)
+
+    def add_slot(self, strategy: AsyncTradeStrategy, start: datetime, trading_seconds: float) -> None:
+        self.slots += 1
+        if strategy.first_order_time is not None:
+            self.first_order_delays.append(strategy.first_order_time - start.timestamp())
+        self.ticks += strategy.ticks
+        self.orders += len(strategy.tick_latencies)
+        self.latencies.extend(strategy.tick_latencies)
+        self.trading_seconds += trading_seconds
+
+    def report(self) -> str:
+        rate = self.ticks / self.trading_seconds if self.trading_seconds else 0.0
+        line = f"{self.name}: {self.slots} slots, {self.ticks} ticks ({rate:.2f}/s), {self.orders} order ticks"
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            line += f", tick to order p50 {p50 * 1000:.1f} ms p99 {p99 * 1000:.1f} ms"
+        if self.first_order_delays:
+            delays = sorted(self.first_order_delays)
+            line += f", slot open to first order p50 {delays[len(delays) // 2]:.3f}s"
+        return line
+
+
+class MarketScheduler:
+    """
+    Starts one AsyncTradeStrategy per market and slot as a task on a single event loop.
+
+    All markets share one ClobSession, one optional MarketStream, one AccountManager,
+    one SettlementWorker, one SlotClock and one GammaClient.
+    Blocking client calls run on a bounded executor, so the number of threads does
+    not grow with the number of markets. With STATE_DIR set every market keeps its
+    positions in a StateStore of its own under STATE_DIR/<market name>.
+    """
+
+    BALANCE_CHECK_INTERVAL = 60
+    STATS_INTERVAL = 300
+    MAX_WORKERS = 32
+
+    def __init__(self, config: Config, specs: list[MarketSpec], account: "AccountManager",
+                 settlement: SettlementWorker, session: "ClobSession", stream=None,
+                 recorder: Optional[BookRecorder] = None, tracker: Optional[OrderTracker] = None,
+                 reporter: Optional[ShardReporter] = None):
+        self.config = config
+        self.specs = specs
+        self.account = account
+        self.settlement = settlement
+        self.session = session
+        self.stream = stream
+        self.recorder = recorder
+        self.tracker = tracker
+        # Receives the positions when this scheduler runs as a shard
+        self.reporter = reporter
+        self.stats = {spec.name: MarketStats(spec.name) for spec in specs}
+        self.pnl = {spec.name: PnL(f"[{spec.name}] ") for spec in specs}
+        self.stores = {}
+        if config.state_dir:
+            self.stores = {spec.name: StateStore(os.path.join(config.state_dir, spec.name)) for spec in specs}
+        self.funded = False
+        self.tasks: set[asyncio.Task] = set()
+        self.clock = SlotClock()
+        self.gamma = GammaClient(config.gamma_url)
+
+    async def run(self) -> None:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.MAX_WORKERS))
+        try:
+            await self.check_funds()
+            await asyncio.gather(self.watch_funds(), self.report_stats(), *[self.run_market(spec) for spec in self.specs])
+        finally:
+            for store in self.stores.values():
+                store.close()
+
+    async def check_funds(self) -> None:
+        balance, balance_usdc = await asyncio.gather(
+            asyncio.to_thread(self.account.balance),
+            asyncio.to_thread(self.account.usdc_balance),
+        )
+        print(f"Current balance: {balance} POL, {balance_usdc} USDC")
+        self.funded = balance >= 0.01 and balance_usdc >= self.config.min_usdc_balance * len(self.specs)
+        if not self.funded:
+            print("Not enough funds")
+            return
+        required = 2 * self.config.min_usdc_balance * len(self.specs)
+        await asyncio.to_thread(self.account.ensure_usdc_allowances, required,
+                                [self.config.fee_module_address, self.config.ctf_exchange_address])
+
+    async def watch_funds(self) -> None:
+        while True:
+            await asyncio.sleep(self.BALANCE_CHECK_INTERVAL)
+            try:
+                await self.check_funds()
+            except Exception as e:
+                print(f"Error checking funds: {e}")
+
+    async def report_stats(self) -> None:
+        while True:
+            await asyncio.sleep(self.STATS_INTERVAL)
+            print(self.report())
+
+    async def run_market(self, spec: MarketSpec) -> None:
+        finder = MarketFinder(self.config.gamma_url, spec.asset, spec.slot_minutes, self.clock, self.gamma)
+        prefetcher = MarketPrefetcher(finder, self.session)
+        stats = self.stats[spec.name]
+        pnl = self.pnl[spec.name]
+        store = self.stores.get(spec.name)
+        resumed = None
+        if store is not None:
+            resumed = store.resume(pnl, int(finder.get_current_slot_start().timestamp()))
+            for condition_id in list(pnl.pending):
+                self.settlement.add(condition_id, lambda condition_id, winnig_idx:
+                                    self.settle(pnl, store, condition_id, winnig_idx))
+            print(f"[{spec.name}] Restored state: profit {pnl.profit} USDC, {len(pnl.pending)} slots to settle"
+                  + (f", resuming {resumed.condition_id}" if resumed is not None else ""))
+        while True:
+            start = finder.get_current_slot_start()
+            try:
+                await self.trade_market_slot(spec, finder, prefetcher, start, stats, pnl, store, resumed)
+            except Exception as e:
+                print(f"[{spec.name}] Error trading slot {start}: {e}")
+            resumed = None
+            delay = finder.slot_end(start) - self.clock.now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def trade_market_slot(self, spec: MarketSpec, finder: MarketFinder, prefetcher: MarketPrefetcher,
+                                start: datetime, stats: MarketStats, pnl: PnL, store: Optional[StateStore] = None,
+                                resumed: Optional[SlotPosition] = None) -> None:
+        market_id = await asyncio.to_thread(finder.get_current_market_id)
+        self.spawn(prefetcher.prefetch_until_open(finder.get_next_slot_start(start)))
+        if not self.funded:
+            return
+
+        market = AsyncMarket(await asyncio.to_thread(
+            Market, self.session, market_id, self.config.dry_mode, stream=self.stream, tracker=self.tracker,
+        ))
+        if self.recorder is not None:
+            market.market.start_recording(self.recorder, spec.name, int(start.timestamp()))
+        strategy = AsyncTradeStrategy(market, self.config.order_size, self.config.max_init_combined_price,
+                                      self.config.pair_difference_threshold)
+        market.market.add_fill_listener(strategy.reconcile)
+        market.market.add_book_listener(strategy.on_book)
+        if store is not None:
+            store.track(market_id, int(start.timestamp()), strategy, resumed)
+        reporter = self.reporter
+        if reporter is not None:
+            reporter.slot_opened(market_id, int(start.timestamp()))
+            for leg, size, cost in (("up", strategy.up_amount, strategy.up_spent),
+                                    ("down", strategy.down_amount, strategy.down_spent)):
+                if size:
+                    reporter.fill(market_id, leg, size, cost)
+            strategy.position_listeners.append(
+                lambda leg, size, cost: reporter.fill(market_id, leg, size, cost))
+        trading_start = time.monotonic()
+        trading_seconds = None
+        try:
+            await run_slot(strategy, finder, start, self.config.init_interval, self.config.trade_interval,
+                           self.config.take_profit_threshold, self.config.adaptive_poll)
+            trading_seconds = time.monotonic() - trading_start
+            await market.record_until(finder.get_next_slot_start(start).timestamp(), self.config.trade_interval)
+            if self.tracker is not None:
+                await asyncio.to_thread(self.tracker.wait, market_id, self.config.fill_confirm_timeout)
+        finally:
+            if trading_seconds is None:
+                trading_seconds = time.monotonic() - trading_start
+            strategy.apply_fill_updates()
+            try:
+                market.close()
+            finally:
+                # Whatever was bought is booked and redeemed, also when trading stopped on an error
+                self.close_slot(market_id, strategy, start, trading_seconds, stats, pnl, store)
+
+    def close_slot(self, market_id: str, strategy: AsyncTradeStrategy, start: datetime, trading_seconds: float,
+                   stats: MarketStats, pnl: PnL, store: Optional[StateStore] = None) -> None:
+        stats.add_slot(strategy, start, trading_seconds)
+        pnl.close_slot(market_id, strategy)
+        if store is not None:
+            store.slot_closed(market_id, strategy)
+        if self.reporter is not None:
+            self.reporter.slot_closed(market_id, strategy)
+        self.account.on_spent(strategy.spent())
+        if strategy.spent() > 0:
+            self.settlement.add(market_id, lambda condition_id, winnig_idx:
+                                self.settle(pnl, store, condition_id, winnig_idx))
+
+    def settle(self, pnl: PnL, store: Optional[StateStore], condition_id: str, winnig_idx: Optional[int]) -> None:
+        payout = pnl.settle(condition_id, winnig_idx)
+        if store is not None:
+            store.settled(condition_id, payout)
+        if self.reporter is not None:
+            self.reporter.settled(condition_id, payout)
+        self.account.on_redeemed(payout)
+
+    def spawn(self, coro) -> None:
+        """
+        Run a background task, keeping a reference until it finishes.
+        """
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def report(self) -> str:
+        lines = [stats.report() for stats in self.stats.values()]
+        ticks = sum(stats.ticks for stats in self.stats.values())
+        seconds = max((stats.trading_seconds for stats in self.stats.values()), default=0.0)
+        lines.append(f"total: {ticks} ticks ({ticks / seconds if seconds else 0.0:.2f}/s) across {len(self.stats)} markets")
+        return "\n".join(lines)
@@ -0,0 +1,308 @@
+"""MarketStream keeps CLOB order books in memory from the market websocket channel."""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from bot.market import OrderBook
+
+if TYPE_CHECKING:
+    from py_clob_client.clob_types import OrderBookSummary
+
+
+class MarketStream:
+    """
+    Subscribes to the CLOB market channel for a set of tokens and keeps their books
+    in sync from the initial snapshot plus price_change deltas.
+
+    A token is served from memory only while it is synced. Whenever a gap is detected
+    (sequence jump, out of order timestamp, delta before snapshot or a reconnect) the
+    token is marked stale and resynced from the REST order book.
+
+    Tokens added or removed while connected are subscribed or unsubscribed on the open
+    connection, so the books of the other tokens stay synced.
+    """
+
+    PING_INTERVAL = 10
+
+    def __init__(self, url: str, token_ids: list[str], resync: Callable[[str], "OrderBookSummary"]):
+        """
+        Initialize MarketStream.
+
+        Args:
+            url: The CLOB market channel websocket URL
+            token_ids: Token ids to subscribe to
+            resync: Callable returning the REST order book for a token id
+        """
+        self.url = url
+        self.token_ids = list(token_ids)
+        self.resync = resync
+        self.books: Dict[str, OrderBook] = {token_id: OrderBook() for token_id in self.token_ids}
+        self.synced: Dict[str, bool] = {token_id: False for token_id in self.token_ids}
+        self.last_seq: Dict[str, Optional[int]] = {token_id: None for token_id in self.token_ids}
+        self.last_ts: Dict[str, int] = {token_id: 0 for token_id in self.token_ids}
+        self.version = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        # Wakes the stream thread while it waits for a first token
+        self._tokens_changed = threading.Event()
+        # (operation, token ids) to send on the open connection, guarded by _subscription_lock
+        self._pending: deque = deque()
+        self._subscription_lock = threading.Lock()
+        self._listeners: list[Callable[[], None]] = []
+        self._book_listeners: list[Callable[[str, OrderBook], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def add_tokens(self, token_ids: list[str]) -> None:
+        """
+        Subscribe to more tokens. Only the new tokens are stale until their snapshots arrive.
+        """
+        new_ids = [token_id for token_id in token_ids if token_id not in self.books]
+        if not new_ids:
+            return
+        for token_id in new_ids:
+            self.books[token_id] = OrderBook()
+            self.synced[token_id] = False
+            self.last_seq[token_id] = None
+            self.last_ts[token_id] = 0
+        with self._subscription_lock:
+            self.token_ids = self.token_ids + new_ids
+            self._pending.append(("subscribe", new_ids))
+        self._tokens_changed.set()
+
+    def remove_tokens(self, token_ids: list[str]) -> None:
+        """
+        Unsubscribe from tokens and drop their books.
+        """
+        removed = [token_id for token_id in token_ids if token_id in self.books]
+        if not removed:
+            return
+        with self._subscription_lock:
+            self.token_ids = [token_id for token_id in self.token_ids if token_id not in removed]
+            self._pending.append(("unsubscribe", removed))
+        for token_id in removed:
+            self.books.pop(token_id, None)
+            self.synced.pop(token_id, None)
+            self.last_seq.pop(token_id, None)
+            self.last_ts.pop(token_id, None)
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Register a callback run on the stream thread after every book change.
+        """
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        self._listeners = [item for item in self._listeners if item is not listener]
+
+    def add_book_listener(self, listener: Callable[[str, OrderBook], None]) -> None:
+        """
+        Register a callback run on the stream thread with (token_id, book) for every changed book.
+        """
+        self._book_listeners = self._book_listeners + [listener]
+
+    def remove_book_listener(self, listener: Callable[[str, OrderBook], None]) -> None:
+        self._book_listeners = [item for item in self._book_listeners if item is not listener]
+
+    def is_synced(self, token_id: str) -> bool:
+        return self.synced.get(token_id, False)
+
+    def book(self, token_id: str) -> OrderBook:
+        return self.books[token_id]
+
+    def best_ask(self, token_id: str) -> Tuple[float, float]:
+        return self.books[token_id].best_ask()
+
+    def best_bid(self, token_id: str) -> Tuple[float, float]:
+        return self.books[token_id].best_bid()
+
+    def wait_for_update(self, version: int, timeout: float) -> int:
+        """
+        Block until any book changes after the given version or the timeout expires.
+
+        Returns:
+            The current book version
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version or self._stop.is_set(), timeout)
+            return self.version
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._tokens_changed.clear()
+            if not self.token_ids:
+                self._tokens_changed.wait(1)
+                continue
+            try:
+                with connect(self.url, open_timeout=10) as ws:
+                    # The initial subscription covers every change made before it
+                    with self._subscription_lock:
+                        token_ids = self.token_ids
+                        self._pending.clear()
+                    ws.send(json.dumps({"assets_ids": token_ids, "type": "market"}))
+                    self._listen(ws)
+            except (ConnectionClosed, OSError, TimeoutError) as e:
+                print(f"Market stream disconnected: {e}")
+            except Exception as e:
+                print(f"Market stream failed: {e}")
+            # Anything may have been missed while disconnected, the new subscription resends snapshots
+            for token_id in self.token_ids:
+                self._mark_stale(token_id)
+            if not self._stop.is_set():
+                time.sleep(1)
+
+    def _listen(self, ws) -> None:
+        last_ping = time.monotonic()
+        while not self._stop.is_set():
+            self._send_pending(ws)
+            if time.monotonic() - last_ping >= self.PING_INTERVAL:
+                ws.send("PING")
+                last_ping = time.monotonic()
+            try:
+                raw = ws.recv(timeout=1)
+            except TimeoutError:
+                continue
+            if raw == "PONG":
+                continue
+            self._handle_frame(raw)
+
+    def _send_pending(self, ws) -> None:
+        with self._subscription_lock:
+            while self._pending:
+                operation, token_ids = self._pending.popleft()
+                ws.send(json.dumps({"assets_ids": token_ids, "operation": operation}))
+
+    def _handle_frame(self, raw: str) -> None:
+        """
+        Apply every message of a frame. A malformed message is skipped and its tokens
+        resynced, since it may have carried a delta.
+        """
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            print(f"Skipped market stream frame: {raw[:200]!r}")
+            return
+        for msg in data if isinstance(data, list) else [data]:
+            try:
+                self.handle_message(msg)
+            except Exception as e:
+                print(f"Skipped market stream message: {e}")
+                for token_id in self._message_tokens(msg):
+                    self._mark_stale(token_id)
+
+    def _message_tokens(self, msg) -> list[str]:
+        if not isinstance(msg, dict):
+            return []
+        token_ids = [msg.get("asset_id")]
+        changes = msg.get("price_changes")
+        if isinstance(changes, list):
+            token_ids += [change.get("asset_id") for change in changes if isinstance(change, dict)]
+        return [token_id for token_id in dict.fromkeys(token_ids) if token_id in self.books]
+
+    def handle_message(self, msg: dict) -> None:
+        event_type = msg.get("event_type")
+        if event_type == "book":
+            book = self.books.get(msg.get("asset_id"))
+            if book is None:
+                return
+            token_id = msg["asset_id"]
+            book.reset(
+                [(level["price"], level["size"]) for level in msg.get("bids", [])],
+                [(level["price"], level["size"]) for level in msg.get("asks", [])],
+            )
+            self.synced[token_id] = True
+            self.last_seq[token_id] = self._seq(msg)
+            self.last_ts[token_id] = int(msg.get("timestamp", 0))
+            self._notify([token_id])
+        elif event_type == "tick_size_change":
+            token_id = msg.get("asset_id")
+            if token_id in self.books:
+                self.books[token_id].tick_size = msg.get("new_tick_size")
+                self._notify([token_id])
+        elif event_type == "price_change":
+            # The sequence number and timestamp belong to the message, so a gap is checked
+            # once per token before any of its changes is applied
+            changes: Dict[str, list] = {}
+            for change in msg.get("price_changes", []):
+                token_id = change.get("asset_id")
+                if token_id in self.books:
+                    changes.setdefault(token_id, []).append(change)
+            for token_id, token_changes in changes.items():
+                if self._is_gap(token_id, msg):
+                    self._resync(token_id)
+                    continue
+                book = self.books.get(token_id)
+                if book is None:
+                    continue
+                for change in token_changes:
+                    book.apply_delta(change["side"], float(change["price"]), float(change["size"]))
+            if changes:
+                self._notify(list(changes))
+
+    @staticmethod
+    def _seq(msg: dict) -> Optional[int]:
+        seq = msg.get("seq", msg.get("sequence"))
+        return int(seq) if seq is not None else None
+
+    def _is_gap(self, token_id: str, msg: dict) -> bool:
+        if not self.synced.get(token_id):
+            return True
+        seq = self._seq(msg)
+        if seq is not None:
+            last = self.last_seq.get(token_id)
+            self.last_seq[token_id] = seq
+            if last is not None and seq != last + 1:
+                return True
+        ts = int(msg.get("timestamp", 0))
+        last_ts = self.last_ts.get(token_id, 0)
+        if ts and ts < last_ts:
+            return True
+        self.last_ts[token_id] = max(ts, last_ts)
+        return False
+
+    def _mark_stale(self, token_id: str) -> None:
+        if token_id not in self.books:
+            return
+        self.synced[token_id] = False
+        self.last_seq[token_id] = None
+
+    def _resync(self, token_id: str) -> None:
+        self._mark_stale(token_id)
+        try:
+            order_book = self.resync(token_id)
+        except Exception as e:
+            print(f"Error resyncing order book for {token_id}: {e}")
+            return
+        # The token may have been removed while its book was read
+        if token_id not in self.books:
+            return
+        self.books[token_id] = OrderBook.from_summary(order_book)
+        self.synced[token_id] = True
+        self.last_ts[token_id] = int(order_book.timestamp or 0)
+
+    def _notify(self, token_ids: list[str]) -> None:
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener()
+        for listener in self._book_listeners:
+            for token_id in token_ids:
+                book = self.books.get(token_id)
+                if book is not None and self.synced.get(token_id):
+                    listener(token_id, book)
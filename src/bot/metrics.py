@@ -0,0 +1,279 @@
+"""Metrics collects latency histograms and counters of the trading loop and exports them."""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Bucket upper bounds in seconds, from a cached book read to a slow RPC call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# gauge name -> label value -> value
+GaugeValues = Dict[str, Dict[str, float]]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # The last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q quantile, the maximum for the overflow bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Counters and latency histograms keyed by name and labels.
+
+    Disabled until enable() is called: timer() then hands out one shared no-op context
+    manager and inc(), observe() and event() return at once, so instrumented code pays
+    for little more than a flag check. Once enabled the metrics can be scraped in
+    Prometheus text format over HTTP, and a background thread appends events and a
+    JSON line with every metric to a log file every LOG_INTERVAL seconds. Gauges are
+    read from their sources whenever the metrics are exported.
+    """
+
+    PREFIX = "polybot_"
+    LOG_INTERVAL = 10.0
+
+    def __init__(self):
+        self.enabled = False
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.log_path: Optional[str] = None
+        # (label, source) of the gauges
+        self.gauge_sources: List[Tuple[str, Callable[[], GaugeValues]]] = []
+        self._events: List[str] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def enable(self, port: Optional[int] = None, log_path: Optional[str] = None) -> None:
+        """
+        Start collecting, serving /metrics on port and logging to log_path when given.
+        """
+        self.enabled = True
+        if port:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("", port), Handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Metrics on http://localhost:{port}/metrics")
+        if log_path:
+            self.log_path = log_path
+            self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        self._flush()
+
+    def timer(self, name: str, **labels: str):
+        """
+        Context manager recording the seconds its block took into the name histogram.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, tuple(labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        if self.enabled:
+            self._observe(name, tuple(labels.items()), seconds)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def add_gauges(self, label: str, source: Callable[[], GaugeValues]) -> None:
+        """
+        Export the values source() returns as gauges, labeled with label set to the keys of each gauge.
+        """
+        self.gauge_sources.append((label, source))
+
+    def gauges(self) -> Dict[Tuple[str, Labels], float]:
+        values = {}
+        for label, source in self.gauge_sources:
+            for name, by_label in source().items():
+                for label_value, value in by_label.items():
+                    values[(name, ((label, label_value),))] = value
+        return values
+
+    def event(self, name: str, **fields) -> None:
+        """
+        Queue a structured event for the JSON log, e.g. an order fill or rejection.
+        """
+        if not self.enabled or self.log_path is None:
+            return
+        line = json.dumps({"ts": time.time(), "event": name, **fields}, default=str)
+        with self._lock:
+            self._events.append(line)
+
+    def snapshot(self) -> dict:
+        """
+        Every counter and gauge and a summary of every histogram, keyed by name{labels}.
+        """
+        gauges = self.gauges()
+        with self._lock:
+            return {
+                "ts": time.time(),
+                "counters": {self._key(name, labels): value for (name, labels), value in self.counters.items()},
+                "gauges": {self._key(name, labels): value for (name, labels), value in gauges.items()},
+                "timers": {
+                    self._key(name, labels): {
+                        "count": hist.count,
+                        "mean": hist.sum / hist.count if hist.count else 0.0,
+                        "p50": hist.quantile(0.5),
+                        "p90": hist.quantile(0.9),
+                        "p99": hist.quantile(0.99),
+                        "max": hist.max,
+                    }
+                    for (name, labels), hist in self.histograms.items()
+                },
+            }
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition of the counters (as <name>_total), gauges (as <name>)
+        and histograms (as <name>_seconds).
+        """
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.gauges().items()):
+            metric = f"{self.PREFIX}{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{self._labels(labels)} {value:g}")
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{self.PREFIX}{name}_total"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{self._labels(labels)} {value:g}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                metric = f"{self.PREFIX}{name}_seconds"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{self._labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{metric}_bucket{self._labels(labels + (('le', '+Inf'),))} {hist.count}")
+                lines.append(f"{metric}_sum{self._labels(labels)} {hist.sum:.6f}")
+                lines.append(f"{metric}_count{self._labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def _observe(self, name: str, labels: Labels, seconds: float) -> None:
+        key = (name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.LOG_INTERVAL):
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.log_path is None:
+            return
+        with self._lock:
+            events, self._events = self._events, []
+        lines = events + [json.dumps({"event": "metrics", **self.snapshot()})]
+        try:
+            with open(self.log_path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Error writing metrics log: {e}")
+
+    @staticmethod
+    def _key(name: str, labels: Labels) -> str:
+        if not labels:
+            return name
+        return name + "{" + ",".join(f"{key}={value}" for key, value in labels) + "}"
+
+    @staticmethod
+    def _labels(labels: Labels) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Shared by every module, so instrumentation does not have to be passed around
+metrics = Metrics()
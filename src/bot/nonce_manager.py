@@ -0,0 +1,204 @@
+"""NonceManager hands out account nonces locally and confirms transactions in the background."""
+
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from bot.fee_oracle import FeeOracle
+
+
+@dataclass
+class PendingTx:
+    nonce: int
+    tx: dict
+    description: str
+    on_confirmed: Optional[Callable[[bool], None]] = None
+    txids: List[str] = field(default_factory=list)
+    sent_at: float = 0.0
+    status: Optional[bool] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class NonceManager:
+    """
+    Tracks the account nonce locally so several transactions can be sent back to back
+    without a get_transaction_count round-trip each.
+
+    A background thread polls receipts of pending transactions. A transaction not mined
+    after REPLACE_AFTER seconds is replaced with the same nonce and fees escalated by
+    the fee oracle (or just bumped by FEE_BUMP without one). If a
+    nonce below the pending ones was never mined (e.g. a send failed after the nonce was
+    handed out), a zero value self-transfer fills the gap so later transactions can go
+    through; it is tracked like any other transaction, so it is replaced too if it gets
+    stuck. When the node rejects a nonce as too low, the local counter is resynced.
+    """
+
+    POLL_INTERVAL = 1.0
+    REPLACE_AFTER = 30.0
+    FEE_BUMP = 1.125
+
+    def __init__(self, web3: Web3, addr: str, pk: str, chain_id: int, fees: Optional[FeeOracle] = None):
+        self.web3 = web3
+        self.addr = addr
+        self.pk = pk
+        self.chain_id = chain_id
+        self.fees = fees
+        self.next_nonce: Optional[int] = None
+        self.pending: Dict[int, PendingTx] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self, tx: dict, description: str, on_confirmed: Optional[Callable[[bool], None]] = None) -> PendingTx:
+        """
+        Assign the next nonce to tx, sign and send it without waiting for the receipt.
+
+        Raises:
+            The node error if the transaction could not be sent
+        """
+        with self._lock:
+            if self.next_nonce is None:
+                self.resync()
+            ptx = PendingTx(self.next_nonce, dict(tx), description, on_confirmed)
+            try:
+                self._broadcast(ptx)
+            except Exception as e:
+                if "nonce too low" not in str(e).lower():
+                    raise
+                # Someone else used our nonce, pick up the chain state and try once more
+                self.resync()
+                ptx.nonce = self.next_nonce
+                self._broadcast(ptx)
+            self.next_nonce += 1
+            self.pending[ptx.nonce] = ptx
+        self._ensure_watcher()
+        self._wake.set()
+        return ptx
+
+    def resync(self) -> None:
+        with self._lock:
+            chain_nonce = self.web3.eth.get_transaction_count(self.addr, "pending")
+            local_nonce = max(self.pending) + 1 if self.pending else 0
+            self.next_nonce = max(chain_nonce, local_nonce)
+
+    def wait(self, ptx: PendingTx, timeout: float) -> bool:
+        ptx.done.wait(timeout)
+        return bool(ptx.status)
+
+    def wait_all(self, timeout: float, txs: Optional[List[PendingTx]] = None) -> bool:
+        """
+        Wait for txs, or every pending transaction, sharing one timeout.
+        Returns True if all of them were confirmed successfully.
+        """
+        deadline = time.monotonic() + timeout
+        if txs is None:
+            with self._lock:
+                txs = list(self.pending.values())
+        return all([self.wait(ptx, max(0.0, deadline - time.monotonic())) for ptx in txs])
+
+    def _broadcast(self, ptx: PendingTx) -> None:
+        ptx.tx["nonce"] = ptx.nonce
+        signed = self.web3.eth.account.sign_transaction(ptx.tx, self.pk)
+        txid = self.web3.to_hex(self.web3.eth.send_raw_transaction(signed.raw_transaction))
+        ptx.txids.append(txid)
+        ptx.sent_at = time.monotonic()
+
+    def _ensure_watcher(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._watch, name="nonce-manager", daemon=True)
+            self._thread.start()
+
+    def _watch(self) -> None:
+        while True:
+            with self._lock:
+                pending = sorted(self.pending.values(), key=lambda item: item.nonce)
+            if not pending:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                self._check(pending)
+            except Exception as e:
+                print(f"Error checking pending transactions: {e}")
+            time.sleep(self.POLL_INTERVAL)
+
+    def _check(self, pending: List[PendingTx]) -> None:
+        mined_nonce = self.web3.eth.get_transaction_count(self.addr, "latest")
+        for ptx in pending:
+            receipt = self._receipt(ptx)
+            if receipt is not None:
+                self._finish(ptx, receipt.status == 1)
+            elif ptx.nonce < mined_nonce:
+                # The nonce was used by a transaction we did not track
+                print(f"{ptx.description}: nonce {ptx.nonce} was used by another transaction")
+                self._finish(ptx, False)
+            elif time.monotonic() - ptx.sent_at > self.REPLACE_AFTER:
+                self._replace(ptx)
+        # Transactions mined while the receipts were read moved the nonce on, they leave no gap
+        mined_nonce = self.web3.eth.get_transaction_count(self.addr, "latest")
+        with self._lock:
+            lowest = min(self.pending, default=None)
+        if lowest is not None and lowest > mined_nonce:
+            for nonce in range(mined_nonce, lowest):
+                self._fill_gap(nonce, pending[0].tx)
+
+    def _receipt(self, ptx: PendingTx):
+        for txid in reversed(ptx.txids):
+            try:
+                return self.web3.eth.get_transaction_receipt(txid)
+            except TransactionNotFound:
+                continue
+        return None
+
+    def _replace(self, ptx: PendingTx) -> None:
+        if self.fees is None:
+            ptx.tx["maxFeePerGas"] = math.ceil(ptx.tx["maxFeePerGas"] * self.FEE_BUMP)
+            ptx.tx["maxPriorityFeePerGas"] = math.ceil(ptx.tx["maxPriorityFeePerGas"] * self.FEE_BUMP)
+        elif not self.fees.bump(ptx.tx):
+            ptx.sent_at = time.monotonic()
+            print(f"{ptx.description}: nonce {ptx.nonce} is stuck at the fee cap")
+            return
+        try:
+            self._broadcast(ptx)
+            print(f"{ptx.description}: replaced nonce {ptx.nonce} with higher fees {ptx.txids[-1]}")
+        except Exception as e:
+            # Still wait for the earlier broadcast, a later check retries the replacement
+            ptx.sent_at = time.monotonic()
+            print(f"{ptx.description}: replacement of nonce {ptx.nonce} failed: {e}")
+
+    def _fill_gap(self, nonce: int, fees_from: dict) -> None:
+        tx = {
+            "from": self.addr,
+            "to": self.addr,
+            "value": 0,
+            "gas": 21000,
+            "chainId": self.chain_id,
+            "maxFeePerGas": fees_from["maxFeePerGas"],
+            "maxPriorityFeePerGas": fees_from["maxPriorityFeePerGas"],
+        }
+        ptx = PendingTx(nonce, tx, f"Nonce gap {nonce}")
+        try:
+            self._broadcast(ptx)
+        except Exception as e:
+            print(f"Error filling nonce gap {nonce}: {e}")
+            return
+        with self._lock:
+            self.pending.setdefault(nonce, ptx)
+        print(f"Filled nonce gap {nonce}: {ptx.txids[-1]}")
+
+    def _finish(self, ptx: PendingTx, status: bool) -> None:
+        with self._lock:
+            self.pending.pop(ptx.nonce, None)
+        ptx.status = status
+        ptx.done.set()
+        print(f"{ptx.description} {'confirmed' if status else 'failed'}: {ptx.txids[-1]}")
+        if ptx.on_confirmed is not None:
+            try:
+                ptx.on_confirmed(status)
+            except Exception as e:
+                print(f"Error in confirmation callback of {ptx.description}: {e}")
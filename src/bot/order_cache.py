@@ -0,0 +1,167 @@
+"""PresignedOrders keeps FOK buy orders signed ahead of time for the prices we are likely to hit."""
+
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from py_clob_client.client import ClobClient
+from py_clob_client.clob_types import OrderArgs, PartialCreateOrderOptions
+from py_clob_client.order_builder.constants import BUY
+
+
+class PresignedOrders:
+    """
+    Signs BUY orders of a fixed size on a grid of prices around each token's best ask.
+
+    EIP-712 signing runs on one background thread for all tokens, so at trigger time an
+    order only has to be looked up and posted. Each signed order is used at most once and
+    the grid is refilled as the best ask moves. Orders are re-signed when the tick size
+    changes or when they get older than MAX_AGE.
+    """
+
+    LEVELS_BELOW = 2
+    LEVELS_ABOVE = 5
+    MAX_AGE = 600
+
+    def __init__(self, client: ClobClient, order_options: Dict[str, PartialCreateOrderOptions], size: float, nonce: int = 0):
+        """
+        Initialize PresignedOrders.
+
+        Args:
+            client: The CLOB client used for signing
+            order_options: token_id -> tick size and neg risk, shared with the session
+            size: Order size in shares
+            nonce: Exchange nonce put into every order
+        """
+        self.client = client
+        self.order_options = order_options
+        self.size = size
+        self.nonce = nonce
+        # (token_id, price) -> (signed order, signed at)
+        self.orders: Dict[Tuple[str, float], Tuple[Any, float]] = {}
+        self.centers: Dict[str, float] = {}
+        self.tick_sizes: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: set = set()
+        self._thread = threading.Thread(target=self._run, name="order-signer", daemon=True)
+        self._thread.start()
+
+    def track(self, token_id: str, best_ask: float, tick_size: Optional[str] = None) -> None:
+        """
+        Re-center the grid of a token on its current best ask and queue the missing orders.
+        """
+        if tick_size is not None:
+            known = self.tick_sizes.get(token_id)
+            if known is None:
+                self.tick_sizes[token_id] = tick_size
+            elif known != tick_size:
+                self.set_tick_size(token_id, tick_size)
+        if not best_ask or self.centers.get(token_id) == best_ask or token_id not in self.order_options:
+            return
+        self.centers[token_id] = best_ask
+        tick = float(self.order_options[token_id].tick_size)
+        low = best_ask - (self.LEVELS_BELOW + 0.5) * tick
+        high = best_ask + (self.LEVELS_ABOVE + 0.5) * tick
+        # Orders that drifted out of the grid would only be re-signed for nothing
+        with self._lock:
+            for key in [key for key in self.orders if key[0] == token_id and not low <= key[1] <= high]:
+                del self.orders[key]
+        for level in range(-self.LEVELS_BELOW, self.LEVELS_ABOVE + 1):
+            price = self._round(best_ask + level * tick, tick)
+            if tick <= price <= 1 - tick:
+                self._request(token_id, price)
+
+    def untrack(self, token_id: str) -> None:
+        self.centers.pop(token_id, None)
+        with self._lock:
+            for key in [key for key in self.orders if key[0] == token_id]:
+                del self.orders[key]
+
+    def take(self, token_id: str, price: float, size: float) -> Optional[Any]:
+        """
+        Returns a signed order for exactly this token, limit price and size, or None.
+        The order is removed from the cache and signed again in the background.
+        """
+        if size != self.size or token_id not in self.order_options:
+            self.misses += 1
+            return None
+        price = self._round(price, float(self.order_options[token_id].tick_size))
+        with self._lock:
+            entry = self.orders.pop((token_id, price), None)
+        if entry is None or time.monotonic() - entry[1] > self.MAX_AGE:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._request(token_id, price)
+        return entry[0]
+
+    def set_tick_size(self, token_id: str, tick_size: str) -> None:
+        """
+        Drop the token's orders and sign them again with the new tick size.
+        """
+        self.tick_sizes[token_id] = tick_size
+        options = self.order_options.get(token_id)
+        self.order_options[token_id] = PartialCreateOrderOptions(
+            tick_size=tick_size, neg_risk=options.neg_risk if options else None,
+        )
+        center = self.centers.pop(token_id, None)
+        with self._lock:
+            for key in [key for key in self.orders if key[0] == token_id]:
+                del self.orders[key]
+        if center:
+            self.track(token_id, center)
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    @staticmethod
+    def _round(price: float, tick: float) -> float:
+        return round(round(price / tick) * tick, 6)
+
+    def _request(self, token_id: str, price: float) -> None:
+        key = (token_id, price)
+        with self._lock:
+            if key in self._pending or key in self.orders:
+                return
+            self._pending.add(key)
+        self._queue.put(key)
+
+    def _refresh_stale(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, entry in self.orders.items() if now - entry[1] > self.MAX_AGE]
+            for key in stale:
+                del self.orders[key]
+        for token_id, price in stale:
+            self._request(token_id, price)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                key = self._queue.get(timeout=self.MAX_AGE / 10)
+            except queue.Empty:
+                self._refresh_stale()
+                continue
+            if key is None:
+                return
+            token_id, price = key
+            options = self.order_options.get(token_id)
+            try:
+                if token_id in self.centers and options is not None:
+                    order = self.client.create_order(
+                        OrderArgs(token_id=token_id, price=price, size=self.size, side=BUY, nonce=self.nonce),
+                        options,
+                    )
+                    with self._lock:
+                        # Options are replaced on a tick size change, so an order signed with old ones is dropped
+                        if self.order_options.get(token_id) is options:
+                            self.orders[key] = (order, time.monotonic())
+            except Exception as e:
+                print(f"Error presigning order {token_id} at {price}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
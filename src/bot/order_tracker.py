@@ -0,0 +1,283 @@
+"""OrderTracker confirms the fills of our orders from the CLOB user channel and trade history."""
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from bot.metrics import metrics
+
+
+@dataclass
+class TrackedOrder:
+    order_id: str
+    condition_id: str
+    token_id: str
+    # "up" or "down"
+    leg: str
+    price: float
+    size: float
+    order_type: str
+    placed_at: float
+    # What the strategy booked when the order was accepted, replaced by the confirmed fills once there are any
+    booked_size: float = 0.0
+    booked_cost: float = 0.0
+    filled: float = 0.0
+    cost: float = 0.0
+    confirmed: bool = False
+    canceled: bool = False
+    on_update: Optional[Callable[["TrackedOrder", float, float], None]] = None
+    # (trade id, size, cost) of the fills applied so far
+    trades: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+
+    @property
+    def resting(self) -> bool:
+        return self.order_type in ("GTC", "GTD")
+
+    @property
+    def done(self) -> bool:
+        """
+        Nothing more will change: a taker order has a confirmed fill, a resting one is filled or canceled.
+        """
+        if self.resting:
+            return self.canceled or self.filled >= self.size - 1e-9
+        return self.confirmed or self.canceled
+
+    def position(self) -> Tuple[float, float]:
+        """
+        (shares, cost) this order contributes to its leg.
+        """
+        if self.confirmed:
+            return self.filled, self.cost
+        return self.booked_size, self.booked_cost
+
+
+class OrderTracker:
+    """
+    Follows our orders until their fills are confirmed.
+
+    Trades come from the authenticated user channel. Orders not confirmed within
+    STREAM_GRACE seconds, and every order while the channel is down, are looked up in
+    the REST trade history every POLL_INTERVAL seconds instead. A trade is applied once
+    per order whatever the source and status, and reverted if it later fails on chain.
+
+    Whenever the confirmed position of an order changes its on_update callback gets the
+    (shares, cost) difference to what was counted for it before, so a strategy that
+    booked the requested amount up front ends up with the amounts actually filled.
+    """
+
+    PING_INTERVAL = 10
+    POLL_INTERVAL = 2.0
+    STREAM_GRACE = 5.0
+    # Confirmed or canceled orders are forgotten after this many seconds
+    RETENTION = 3600
+
+    def __init__(self, client: Any, url: Optional[str] = None):
+        """
+        Initialize OrderTracker.
+
+        Args:
+            client: The authenticated CLOB client, used for API credentials and trade history
+            url: The CLOB user channel websocket URL, trade history only if None
+        """
+        self.client = client
+        self.url = url
+        self.orders: Dict[str, TrackedOrder] = {}
+        self.connected = False
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self.url:
+            self._threads.append(threading.Thread(target=self._run_stream, name="user-stream", daemon=True))
+        self._threads.append(threading.Thread(target=self._run_poll, name="trade-poll", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def track(self, order_id: str, condition_id: str, token_id: str, leg: str, price: float, size: float,
+              order_type: str, booked: Tuple[float, float] = (0.0, 0.0),
+              on_update: Optional[Callable[[TrackedOrder, float, float], None]] = None) -> TrackedOrder:
+        """
+        Start following an accepted order. booked is the (shares, cost) already counted for it.
+        """
+        order = TrackedOrder(order_id, condition_id, token_id, leg, price, size, str(order_type), time.time(),
+                             booked[0], booked[1], on_update=on_update)
+        with self._lock:
+            self.orders[order_id] = order
+        return order
+
+    def on_canceled(self, order_id: str) -> None:
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is not None:
+                order.canceled = True
+                self._cond.notify_all()
+
+    def open_orders(self, condition_id: str) -> List[TrackedOrder]:
+        with self._lock:
+            return [order for order in self.orders.values() if order.condition_id == condition_id and not order.done]
+
+    def wait(self, condition_id: str, timeout: float) -> bool:
+        """
+        Wait until every order of a condition is done, e.g. before the slot is booked,
+        checking the trade history for its unconfirmed orders every POLL_INTERVAL.
+        """
+        # perf_counter, so a simulated clock cannot stall the timeout
+        deadline = time.perf_counter() + timeout
+        while True:
+            with self._cond:
+                if self._done(condition_id):
+                    return True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self.poll(condition_id)
+            with self._cond:
+                self._cond.wait_for(lambda: self._done(condition_id), min(self.POLL_INTERVAL, remaining))
+
+    def _done(self, condition_id: str) -> bool:
+        return all(order.done for order in self.orders.values() if order.condition_id == condition_id)
+
+    def handle_message(self, msg: dict) -> None:
+        event_type = msg.get("event_type")
+        if event_type == "trade":
+            self.apply_trade(msg)
+        elif event_type == "order" and msg.get("type") == "CANCELLATION":
+            self.on_canceled(msg.get("id"))
+
+    def apply_trade(self, trade: dict) -> None:
+        """
+        Apply a trade from the user channel or the trade history to the orders of ours it filled.
+        """
+        trade_id = trade.get("id")
+        failed = trade.get("status") == "FAILED"
+        fills = []
+        taker_order_id = trade.get("taker_order_id")
+        if taker_order_id in self.orders:
+            size = float(trade.get("size", 0))
+            fills.append((taker_order_id, size, size * float(trade.get("price", 0))))
+        for maker in trade.get("maker_orders") or []:
+            if maker.get("order_id") in self.orders:
+                size = float(maker.get("matched_amount", 0))
+                fills.append((maker["order_id"], size, size * float(maker.get("price", 0))))
+        updates = []
+        with self._lock:
+            for order_id, size, cost in fills:
+                order = self.orders.get(order_id)
+                if order is None:
+                    continue
+                applied = order.trades.get(trade_id)
+                if failed and applied is not None:
+                    del order.trades[trade_id]
+                    size, cost = -applied[0], -applied[1]
+                elif failed or applied is not None:
+                    continue
+                else:
+                    order.trades[trade_id] = (size, cost)
+                before = order.position()
+                order.filled += size
+                order.cost += cost
+                order.confirmed = True
+                after = order.position()
+                updates.append((order, after[0] - before[0], after[1] - before[1]))
+                metrics.event("confirmed_fill", order=order_id, leg=order.leg, size=size, cost=cost,
+                              status=trade.get("status"))
+            self._cond.notify_all()
+        for order, size, cost in updates:
+            if order.on_update is not None and (size or cost):
+                order.on_update(order, size, cost)
+
+    def poll(self, condition_id: Optional[str] = None) -> None:
+        """
+        Look up in the trade history the orders the user channel did not confirm in
+        time, or every unconfirmed order of condition_id when it is given.
+        """
+        now = time.time()
+        with self._lock:
+            for order_id in [order_id for order_id, order in self.orders.items()
+                             if order.done and now - order.placed_at > self.RETENTION]:
+                del self.orders[order_id]
+            stale = [order for order in self.orders.values() if not order.done and (
+                order.condition_id == condition_id if condition_id is not None
+                else not self.connected or now - order.placed_at > self.STREAM_GRACE)]
+        since: Dict[str, float] = {}
+        for order in stale:
+            since[order.condition_id] = min(since.get(order.condition_id, order.placed_at), order.placed_at)
+        if not since:
+            return
+        # The client is loaded by then, this only keeps the module light to import
+        from py_clob_client.clob_types import TradeParams
+
+        for condition_id, placed_at in since.items():
+            try:
+                with metrics.timer("trade_history"):
+                    trades = self.client.get_trades(TradeParams(market=condition_id, after=int(placed_at) - 60))
+            except Exception as e:
+                print(f"Error fetching trades of {condition_id}: {e}")
+                continue
+            for trade in trades:
+                self.apply_trade(trade)
+
+    def _run_poll(self) -> None:
+        while not self._stop.wait(self.POLL_INTERVAL):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Trade poll error: {e}")
+
+    def _run_stream(self) -> None:
+        creds = self.client.creds
+        subscription = {
+            "auth": {"apiKey": creds.api_key, "secret": creds.api_secret, "passphrase": creds.api_passphrase},
+            "type": "user",
+        }
+        while not self._stop.is_set():
+            try:
+                with connect(self.url, open_timeout=10) as ws:
+                    ws.send(json.dumps(subscription))
+                    self.connected = True
+                    self._listen(ws)
+            except (ConnectionClosed, OSError, TimeoutError) as e:
+                print(f"User stream disconnected: {e}")
+            except Exception as e:
+                print(f"User stream failed: {e}")
+            # The trade history covers the gap
+            self.connected = False
+            if not self._stop.is_set():
+                time.sleep(1)
+
+    def _listen(self, ws) -> None:
+        last_ping = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_ping >= self.PING_INTERVAL:
+                ws.send("PING")
+                last_ping = time.monotonic()
+            try:
+                raw = ws.recv(timeout=1)
+            except TimeoutError:
+                continue
+            if raw == "PONG":
+                continue
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                print(f"Skipped user stream frame: {raw[:200]!r}")
+                continue
+            for msg in data if isinstance(data, list) else [data]:
+                # A bad message is left to the trade history, which covers unconfirmed orders
+                try:
+                    self.handle_message(msg)
+                except Exception as e:
+                    print(f"Skipped user stream message: {e}")
@@ -0,0 +1,64 @@
+"""Profit and loss bookkeeping across slots."""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+from bot.trade_strategy import TradeStrategy
+
+
+class PnL:
+    """
+    Tracks realized profit over slots.
+
+    A slot's spend is booked when its trading ends and its payout when its condition
+    resolves, so slots may settle in any order.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.profit = 0.0
+        self.max_spent = 0.0
+        self.min_profit = 0.0
+        self.max_profit = 0.0
+        # condition_id -> (up_amount, down_amount) waiting for resolution
+        self.pending: Dict[str, Tuple[float, float]] = {}
+        # Settlements are booked from the settlement thread
+        self.lock = threading.Lock()
+
+    def close_slot(self, condition_id: str, strategy: TradeStrategy) -> None:
+        with self.lock:
+            self._close_slot(condition_id, strategy)
+
+    def settle(self, condition_id: str, winnig_idx: Optional[int]) -> float:
+        """
+        Book the payout of a resolved condition and return it.
+        """
+        with self.lock:
+            return self._settle(condition_id, winnig_idx)
+
+    def _close_slot(self, condition_id: str, strategy: TradeStrategy) -> None:
+        spent = strategy.spent()
+        if spent > self.max_spent:
+            self.max_spent = spent
+        self.profit -= spent
+        print(f"{self.name}Spent: {spent} USDC (Max Spent: {self.max_spent})")
+        print(f"{self.name}Profit for Up: {strategy.up_amount}")
+        print(f"{self.name}Profit for Down: {strategy.down_amount}")
+        if strategy.up_amount or strategy.down_amount:
+            self.pending[condition_id] = (strategy.up_amount, strategy.down_amount)
+
+    def _settle(self, condition_id: str, winnig_idx: Optional[int]) -> float:
+        up_amount, down_amount = self.pending.pop(condition_id, (0.0, 0.0))
+        if winnig_idx == 0:
+            print(f"{self.name}UP wins {condition_id}")
+            payout = up_amount
+        else:
+            print(f"{self.name}DOWN wins {condition_id}")
+            payout = down_amount
+        self.profit += payout
+        if self.profit > self.max_profit:
+            self.max_profit = self.profit
+        if self.profit < self.min_profit:
+            self.min_profit = self.profit
+        print(f"{self.name}Profit: {self.profit} USDC (Max Profit: {self.max_profit}, Min Profit: {self.min_profit})")
+        return payout
@@ -0,0 +1,70 @@
+"""MarketPrefetcher resolves and warms up the next slot's market during the current slot."""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+from bot.market_finder import MarketFinder
+
+if TYPE_CHECKING:
+    from bot.clob_session import ClobSession
+
+
+class MarketPrefetcher:
+    """
+    Looks up the next slot's conditionId, market metadata, tick sizes and order options
+    ahead of time, so at the boundary the finder and session answer from their caches.
+    The conditionIds of LOOKAHEAD slots are fetched in one bulk request, so later
+    slots already listed need no request of their own.
+    """
+
+    RETRY_INTERVAL = 15
+    LOOKAHEAD = 4
+
+    def __init__(self, finder: MarketFinder, session: "ClobSession"):
+        self.finder = finder
+        self.session = session
+        self._thread: Optional[threading.Thread] = None
+
+    def prefetch(self, start: datetime) -> Optional[str]:
+        """
+        One attempt to warm up the market of the slot starting at start.
+
+        Returns:
+            The conditionId, or None if the market is not available yet
+        """
+        slug = self.finder.get_market_slug_by_start(start)
+        try:
+            condition_id = self.finder.get_upcoming_market_ids(start, self.LOOKAHEAD).get(slug)
+            if condition_id is None:
+                raise ValueError("No market found in response")
+            self.session.prepare_market(condition_id)
+        except Exception as e:
+            print(f"Prefetch of {slug} failed: {e}")
+            return None
+        print(f"Prefetched {slug}: {condition_id}")
+        return condition_id
+
+    def prefetch_in_background(self, start: datetime) -> None:
+        """
+        Keep retrying the prefetch on a background thread until it succeeds or the slot opens.
+        """
+        self._thread = threading.Thread(target=self._run, args=(start,), name="market-prefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self, start: datetime) -> None:
+        while self.finder.clock.now() < start.timestamp():
+            if self.prefetch(start) is not None:
+                return
+            time.sleep(self.RETRY_INTERVAL)
+
+    async def prefetch_until_open(self, start: datetime) -> None:
+        """
+        Asyncio version of prefetch_in_background.
+        """
+        while self.finder.clock.now() < start.timestamp():
+            if await asyncio.to_thread(self.prefetch, start) is not None:
+                return
+            await asyncio.sleep(self.RETRY_INTERVAL)
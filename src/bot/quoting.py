@@ -0,0 +1,88 @@
+"""RestingQuotes keeps limit bids resting on both legs at prices that lower the pair cost."""
+
+import math
+from typing import Dict, Optional
+
+from bot.market import Market, OrderBook
+from bot.order_tracker import TrackedOrder
+from bot.trade_strategy import TradeStrategy
+
+
+class RestingQuotes:
+    """
+    One resting BUY of the strategy's order size per leg, next to its FOK orders.
+
+    A leg is quoted one tick below its average price, since any fill there lowers the
+    average pair cost just as should_buy_* requires, and never above max_pair_cost
+    minus the other leg's average or at the best ask, so it always rests. Each update
+    cancels and replaces quotes whose price moved by a tick, that were filled or that
+    the pair difference threshold no longer allows; a quote whose cancel failed stays
+    tracked and its cancel is retried on the next update before anything replaces it.
+    Fills reach the strategy through the market's fill listeners.
+    """
+
+    def __init__(self, strategy: TradeStrategy, market: Market, max_pair_cost: float = 1.0, expiration: int = 0):
+        """
+        Initialize RestingQuotes.
+
+        Args:
+            strategy: The strategy whose position is quoted
+            market: The market to quote, it needs an order tracker
+            max_pair_cost: Highest combined price a quote may lock in
+            expiration: Unix time the quotes expire at as GTD orders, GTC if 0
+        """
+        self.strategy = strategy
+        self.market = market
+        self.max_pair_cost = max_pair_cost
+        self.expiration = expiration
+        self.orders: Dict[str, TrackedOrder] = {}
+
+    def target_price(self, leg: str, book: OrderBook) -> Optional[float]:
+        """
+        Price to quote the "up" or "down" leg at, None if it should not be quoted.
+        """
+        strategy = self.strategy
+        if leg == "up":
+            amount, spent, other_amount, other_spent = (strategy.up_amount, strategy.up_spent,
+                                                        strategy.down_amount, strategy.down_spent)
+        else:
+            amount, spent, other_amount, other_spent = (strategy.down_amount, strategy.down_spent,
+                                                         strategy.up_amount, strategy.up_spent)
+        if amount <= 0 or other_amount <= 0 or amount >= strategy.pair_difference_threshold * other_amount:
+            return None
+        tick = float(book.tick_size or "0.01")
+        price = min(spent / amount, self.max_pair_cost - other_spent / other_amount)
+        best_ask = book.best_ask()[0]
+        if best_ask:
+            price = min(price, best_ask)
+        # Strictly below, on the tick grid
+        price = (math.ceil(round(price / tick, 6)) - 1) * tick
+        if price < tick:
+            return None
+        return round(price, 6)
+
+    def update(self, up_book: OrderBook, down_book: OrderBook) -> None:
+        """
+        Requote both legs against the books the strategy traded on this tick.
+        """
+        if not self.strategy.up_inited or not self.strategy.down_inited:
+            return
+        for leg, book in (("up", up_book), ("down", down_book)):
+            price = self.target_price(leg, book)
+            order = self.orders.get(leg)
+            if order is not None:
+                tick = float(book.tick_size or "0.01")
+                if not order.done and price is not None and abs(order.price - price) < tick / 2:
+                    continue
+                if not order.done and not self.market.cancel_order(order.order_id):
+                    # Still resting as far as we know, a second quote could fill on top of it
+                    continue
+                del self.orders[leg]
+            if price is not None:
+                order = self.market.place_limit_buy(leg, price, self.strategy.order_size, self.expiration)
+                if order is not None:
+                    self.orders[leg] = order
+
+    def cancel_all(self) -> None:
+        self.orders = {leg: order for leg, order in self.orders.items()
+                       if not order.done and not self.market.cancel_order(order.order_id)}
@@ -0,0 +1,316 @@
+"""Rate limits, circuit breakers and adaptive poll intervals for the upstream APIs."""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from bot.metrics import metrics
+
+
+class RateLimited(Exception):
+    """A call was not made because its endpoint's budget is spent or its circuit is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"{endpoint} is rate limited, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """
+    HTTP status on an error of any of the clients or on its response (requests, web3,
+    PolyApiException), None if it got no response.
+    """
+    for source in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "status"):
+            status = getattr(source, attribute, None)
+            if isinstance(status, int):
+                return status
+    return None
+
+
+def is_throttled(error: BaseException) -> bool:
+    """
+    Whether an error of any of the clients means the server throttled us: a 429 status
+    or a rate limit message.
+    """
+    if status_code(error) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "too many requests" in message or "rate limit" in message
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether an error counts against the endpoint's health: throttling, a 5xx or no
+    response at all. Any other status, e.g. a 400 for an order that could not be
+    filled, means the server answered.
+    """
+    if is_throttled(error):
+        return True
+    status = status_code(error)
+    return status is None or status >= 500
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds from the Retry-After header of a throttled response, None if it has none.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Upstream:
+    """
+    Budget and health of one endpoint.
+
+    Calls take a token from a bucket refilled at rate per second up to burst, waiting
+    up to MAX_WAIT for one. A 429 opens the circuit at once for the Retry-After time or
+    the current backoff, FAILURES other failures in a row (5xx or no response) open it
+    for the backoff; the backoff doubles each time the circuit opens, from MIN_BACKOFF
+    up to MAX_BACKOFF. An error response the server gave on purpose, like a 400, counts
+    as a success. While open, calls fail fast with RateLimited. Once the time is up the
+    first call to get a token is let through as the probe (half open): success closes
+    the circuit and resets the backoff, failure opens it again.
+
+    The latency of successful calls feeds an EWMA, and throttle_factor doubles with each
+    429 and halves every THROTTLE_DECAY seconds without one, for AdaptivePoll to read.
+    """
+
+    MAX_WAIT = 2.0
+    FAILURES = 5
+    MIN_BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+    ALPHA = 0.2
+    MAX_THROTTLE_FACTOR = 16.0
+    THROTTLE_DECAY = 30.0
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = self.MIN_BACKOFF
+        self.open_until = 0.0
+        self.latency = 0.0
+        self.throttle_factor = 1.0
+        self.throttled = 0
+        self.refused = 0
+        self._refilled = time.monotonic()
+        self._throttled_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self) -> None:
+        """
+        Take a token for one call, sleeping until one is available.
+
+        Raises:
+            RateLimited: if the circuit is open, a probe is already under way or no
+            token is due within MAX_WAIT
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.state != self.CLOSED and (now < self.open_until or self._probing):
+                    self.refused += 1
+                    raise RateLimited(self.name, max(0.0, self.open_until - now))
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    # The probe is whichever call gets a token first once the circuit may close
+                    if self.state != self.CLOSED:
+                        self.state = self.HALF_OPEN
+                        self._probing = True
+                    return
+                wait = (1 - self.tokens) / self.rate
+                if wait > self.MAX_WAIT:
+                    self.refused += 1
+                    raise RateLimited(self.name, wait)
+            time.sleep(wait)
+
+    def on_success(self, seconds: float) -> None:
+        with self._lock:
+            self.latency = seconds if not self.latency else self.latency + self.ALPHA * (seconds - self.latency)
+            self.failures = 0
+            if self.state != self.CLOSED:
+                print(f"{self.name}: circuit closed")
+                self.state = self.CLOSED
+                self.backoff = self.MIN_BACKOFF
+            self._probing = False
+
+    def on_failure(self, error: BaseException) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._probing = False
+            if is_throttled(error):
+                self.throttled += 1
+                self.throttle_factor = min(self.MAX_THROTTLE_FACTOR, self.current_throttle_factor(now) * 2)
+                self._throttled_at = now
+                metrics.inc("throttled", endpoint=self.name)
+                self._open(now, retry_after(error))
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.FAILURES:
+                self._open(now, None)
+
+    def _open(self, now: float, seconds: Optional[float]) -> None:
+        seconds = seconds if seconds is not None else self.backoff
+        self.state = self.OPEN
+        self.open_until = now + seconds
+        self.backoff = min(self.MAX_BACKOFF, self.backoff * 2)
+        self.failures = 0
+        metrics.inc("circuit_opened", endpoint=self.name)
+        metrics.event("circuit_open", endpoint=self.name, seconds=seconds)
+        print(f"{self.name}: circuit open for {seconds:.1f}s")
+
+    def current_throttle_factor(self, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time.monotonic()
+        halvings = int((now - self._throttled_at) / self.THROTTLE_DECAY)
+        return max(1.0, self.throttle_factor / 2 ** min(halvings, 16))
+
+    def retry_in(self) -> float:
+        """
+        Seconds until the circuit lets calls through again, 0 while closed.
+        """
+        return max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+
+    def call(self) -> "_Call":
+        """
+        Context manager around one call: takes a token, then books the outcome of its block.
+        """
+        return _Call(self)
+
+
+class _Call:
+    __slots__ = ("upstream", "start")
+
+    def __init__(self, upstream: Upstream):
+        self.upstream = upstream
+
+    def __enter__(self) -> "_Call":
+        self.upstream.acquire()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is None or not is_upstream_failure(exc):
+            self.upstream.on_success(time.perf_counter() - self.start)
+        else:
+            self.upstream.on_failure(exc)
+        return False
+
+
+class AdaptivePoll:
+    """
+    Interval of a polling loop over one endpoint.
+
+    Each poll that found the data unchanged stretches the interval by IDLE_STEP, up to
+    MAX_IDLE_FACTOR times the base interval, and a change brings it back to the base.
+    On top of that it is scaled by the endpoint's throttle factor, kept at least
+    LATENCY_FACTOR times the endpoint's latency, and never shorter than the time until
+    its circuit closes.
+    """
+
+    IDLE_STEP = 1.15
+    MAX_IDLE_FACTOR = 4.0
+    LATENCY_FACTOR = 4.0
+
+    def __init__(self, upstream: Upstream):
+        self.upstream = upstream
+        self.idle_factor = 1.0
+
+    def observe(self, changed: bool) -> None:
+        if changed:
+            self.idle_factor = 1.0
+        else:
+            self.idle_factor = min(self.MAX_IDLE_FACTOR, self.idle_factor * self.IDLE_STEP)
+
+    def interval(self, base: float) -> float:
+        upstream = self.upstream
+        return max(base * self.idle_factor * upstream.current_throttle_factor(),
+                   upstream.latency * self.LATENCY_FACTOR, upstream.retry_in())
+
+
+class RateLimits:
+    """
+    The Upstream of every endpoint, created on first use from DEFAULTS and shared by
+    all clients, with their state exported as metrics gauges.
+    """
+
+    # endpoint -> (calls per second, burst)
+    DEFAULTS = {
+        "clob_book": (50.0, 100.0),
+        "clob_order": (20.0, 40.0),
+        "clob_market": (10.0, 20.0),
+        "gamma": (10.0, 20.0),
+        "subgraph": (5.0, 10.0),
+        "rpc": (20.0, 40.0),
+    }
+    # Budget of endpoints not in DEFAULTS
+    FALLBACK = (10.0, 20.0)
+
+    def __init__(self):
+        self.limits = dict(self.DEFAULTS)
+        self.upstreams: Dict[str, Upstream] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, spec: Optional[str]) -> None:
+        """
+        Override budgets from a "name=rate/burst,..." list, e.g. RATE_LIMITS="clob_book=20/40,rpc=5/10".
+        """
+        for item in (spec or "").split(","):
+            if not item.strip():
+                continue
+            name, budget = item.split("=")
+            rate, _, burst = budget.partition("/")
+            self.limits[name.strip()] = (float(rate), float(burst or rate))
+        with self._lock:
+            self.upstreams.clear()
+
+    def upstream(self, name: str) -> Upstream:
+        with self._lock:
+            upstream = self.upstreams.get(name)
+            if upstream is None:
+                upstream = self.upstreams[name] = Upstream(name, *self.limits.get(name, self.FALLBACK))
+            return upstream
+
+    def call(self, name: str) -> _Call:
+        return self.upstream(name).call()
+
+    def gauges(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            upstreams = list(self.upstreams.values())
+        now = time.monotonic()
+        gauges: Dict[str, Dict[str, float]] = {}
+        for upstream in upstreams:
+            with upstream._lock:
+                upstream._refill(now)
+                values = {
+                    "upstream_tokens": upstream.tokens,
+                    "upstream_circuit_state": upstream.state,
+                    "upstream_retry_in_seconds": upstream.retry_in(),
+                    "upstream_latency_seconds": upstream.latency,
+                    "upstream_throttle_factor": upstream.current_throttle_factor(now),
+                    "upstream_throttled": upstream.throttled,
+                    "upstream_refused": upstream.refused,
+                }
+            for name, value in values.items():
+                gauges.setdefault(name, {})[upstream.name] = float(value)
+        return gauges
+
+
+# Shared by every client, so budgets cover all calls to an endpoint
+limits = RateLimits()
+metrics.add_gauges("endpoint", limits.gauges)
@@ -0,0 +1,112 @@
+"""SettlementWorker resolves and redeems finished markets off the trading path."""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from bot.market_ql import MarketQL
+
+if TYPE_CHECKING:
+    from bot.account_manager import AccountManager
+
+
+@dataclass
+class PendingSettlement:
+    condition_id: str
+    on_settled: Callable[[str, Optional[int]], None]
+    next_check: float = 0.0
+    interval: float = 0.0
+    resolved: bool = False
+    winnig_idx: Optional[int] = None
+    redeeming: bool = False
+
+
+class SettlementWorker:
+    """
+    Tracks conditions waiting for resolution on a background thread.
+
+    All due conditions are checked with one batched query. Unresolved ones back off
+    exponentially. Resolved ones are redeemed back to back through the account's nonce
+    manager and their on_settled callback gets the winning index once the redemption
+    is confirmed.
+    """
+
+    MIN_INTERVAL = 1.0
+    MAX_INTERVAL = 60.0
+
+    def __init__(self, account: "AccountManager", resolver: MarketQL):
+        self.account = account
+        self.resolver = resolver
+        self.pending: Dict[str, PendingSettlement] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, condition_id: str, on_settled: Callable[[str, Optional[int]], None]) -> None:
+        with self._lock:
+            if condition_id not in self.pending:
+                self.pending[condition_id] = PendingSettlement(condition_id, on_settled, time.monotonic())
+        self._wake.set()
+
+    def wake(self) -> None:
+        """
+        Check the due conditions now, e.g. after a simulated clock jumped ahead.
+        """
+        self._wake.set()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="settlement", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._process_due()
+            except Exception as e:
+                print(f"Settlement error: {e}")
+            with self._lock:
+                next_check = min((item.next_check for item in self.pending.values() if not item.redeeming), default=None)
+            timeout = None if next_check is None else max(0.0, next_check - time.monotonic())
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _process_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [item for item in self.pending.values() if item.next_check <= now and not item.redeeming]
+        if not due:
+            return
+        unresolved = [item.condition_id for item in due if not item.resolved]
+        results = self.resolver.resolved_many(unresolved) if unresolved else {}
+        for item in due:
+            if not item.resolved:
+                item.resolved, item.winnig_idx = results.get(item.condition_id, (False, None))
+            if item.resolved:
+                item.redeeming = True
+                if self.account.redeem_market(item.condition_id, lambda ok, item=item: self._redeemed(item, ok)):
+                    continue
+                item.redeeming = False
+            self._back_off(item)
+
+    def _redeemed(self, item: PendingSettlement, ok: bool) -> None:
+        if ok:
+            with self._lock:
+                self.pending.pop(item.condition_id, None)
+            item.on_settled(item.condition_id, item.winnig_idx)
+            return
+        item.redeeming = False
+        self._back_off(item)
+        self._wake.set()
+
+    def _back_off(self, item: PendingSettlement) -> None:
+        item.interval = min(self.MAX_INTERVAL, max(self.MIN_INTERVAL, item.interval * 2))
+        item.next_check = time.monotonic() + item.interval
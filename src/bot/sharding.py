@@ -0,0 +1,183 @@
+"""Runs the bot as shards, one worker process per wallet, and consolidates their exposure."""
+
+import multiprocessing
+import queue
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bot.trade_strategy import TradeStrategy
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    pk: str
+    # "asset:slot_minutes" entries of the markets this shard trades, as in MARKETS
+    markets: str
+
+
+def assign_shards(pks: List[str], markets: List[str]) -> List[Shard]:
+    """
+    Deal markets round robin to one shard per wallet. Wallets beyond the number of
+    markets would have nothing to trade and get no shard.
+    """
+    count = min(len(pks), len(markets))
+    return [Shard(i, pks[i], ",".join(markets[i::count])) for i in range(count)]
+
+
+class ShardReporter:
+    """
+    Sends a worker's position events to the coordinator. It has the recording methods
+    of StateStore, so the trading loops report to either the same way.
+    """
+
+    def __init__(self, channel: Any, shard: int):
+        """
+        Initialize ShardReporter.
+
+        Args:
+            channel: A multiprocessing queue read by the coordinator
+            shard: Index of the worker's shard
+        """
+        self.channel = channel
+        self.shard = shard
+
+    def record(self, kind: str, **fields) -> None:
+        self.channel.put((self.shard, {"type": kind, "time": time.time(), **fields}))
+
+    def slot_opened(self, condition_id: str, start: int) -> None:
+        self.record("slot_open", condition_id=condition_id, start=start)
+
+    def fill(self, condition_id: str, leg: str, size: float, cost: float) -> None:
+        self.record("fill", condition_id=condition_id, leg=leg, size=size, cost=cost)
+
+    def slot_closed(self, condition_id: str, strategy: TradeStrategy) -> None:
+        self.record("slot_close", condition_id=condition_id, spent=strategy.spent(),
+                    up_amount=strategy.up_amount, down_amount=strategy.down_amount)
+
+    def settled(self, condition_id: str, payout: float) -> None:
+        self.record("settled", condition_id=condition_id, payout=payout)
+
+
+@dataclass
+class ShardExposure:
+    # condition_id -> [up_amount, up_spent, down_amount, down_spent] of the slots being traded
+    open: Dict[str, List[float]] = field(default_factory=dict)
+    # condition_id -> (up_amount, down_amount, spent) of closed slots waiting for resolution
+    pending: Dict[str, Tuple[float, float, float]] = field(default_factory=dict)
+    profit: float = 0.0
+    slots: int = 0
+    last_event: float = 0.0
+    exit_code: Optional[int] = None
+
+    def spent(self) -> float:
+        return (sum(position[1] + position[3] for position in self.open.values())
+                + sum(spent for _, _, spent in self.pending.values()))
+
+    def max_loss(self) -> float:
+        """
+        What is lost if every open and unresolved slot pays out its smaller leg only.
+        """
+        open_loss = sum(position[1] + position[3] - min(position[0], position[2]) for position in self.open.values())
+        pending_loss = sum(spent - min(up_amount, down_amount) for up_amount, down_amount, spent in self.pending.values())
+        return open_loss + pending_loss
+
+
+class ExposureView:
+    """
+    Positions, unresolved slots and booked profit of every shard, built from the
+    events their ShardReporters send.
+    """
+
+    def __init__(self, shards: List[Shard]):
+        self.shards = {shard.index: ShardExposure() for shard in shards}
+
+    def apply(self, shard: int, event: dict) -> None:
+        exposure = self.shards[shard]
+        exposure.last_event = event["time"]
+        kind = event["type"]
+        condition_id = event["condition_id"]
+        if kind == "slot_open":
+            exposure.open[condition_id] = [0.0, 0.0, 0.0, 0.0]
+        elif kind == "fill":
+            position = exposure.open.setdefault(condition_id, [0.0, 0.0, 0.0, 0.0])
+            offset = 0 if event["leg"] == "up" else 2
+            position[offset] += event["size"]
+            position[offset + 1] += event["cost"]
+        elif kind == "slot_close":
+            exposure.open.pop(condition_id, None)
+            exposure.slots += 1
+            exposure.profit -= event["spent"]
+            if event["up_amount"] or event["down_amount"]:
+                exposure.pending[condition_id] = (event["up_amount"], event["down_amount"], event["spent"])
+        elif kind == "settled":
+            exposure.pending.pop(condition_id, None)
+            exposure.profit += event["payout"]
+
+    def total(self) -> Dict[str, float]:
+        shards = self.shards.values()
+        return {
+            "open_slots": sum(len(exposure.open) for exposure in shards),
+            "pending_slots": sum(len(exposure.pending) for exposure in shards),
+            "spent": sum(exposure.spent() for exposure in shards),
+            "max_loss": sum(exposure.max_loss() for exposure in shards),
+            "profit": sum(exposure.profit for exposure in shards),
+        }
+
+    def report(self) -> str:
+        lines = []
+        for index, exposure in sorted(self.shards.items()):
+            state = "running" if exposure.exit_code is None else f"exited {exposure.exit_code}"
+            lines.append(f"shard {index} ({state}): {exposure.slots} slots, {len(exposure.open)} open, "
+                         f"{len(exposure.pending)} unresolved, at risk {exposure.spent():.2f} USDC "
+                         f"(max loss {exposure.max_loss():.2f}), profit {exposure.profit:.4f} USDC")
+        total = self.total()
+        lines.append(f"all shards: {total['open_slots']} open, {total['pending_slots']} unresolved, "
+                     f"at risk {total['spent']:.2f} USDC (max loss {total['max_loss']:.2f}), "
+                     f"profit {total['profit']:.4f} USDC")
+        return "\n".join(lines)
+
+
+def run_shards(shards: List[Shard], worker: Callable[[Shard, ShardReporter], None],
+               report_interval: float = 60.0) -> ExposureView:
+    """
+    Start worker(shard, reporter) in a process of its own for every shard and keep the
+    exposure view current from their events until all of them exit.
+
+    Workers are spawned rather than forked, so each builds its own wallet, CLOB session,
+    nonce manager and threads; worker has to be a module level function.
+    """
+    context = multiprocessing.get_context("spawn")
+    channel = context.Queue()
+    view = ExposureView(shards)
+    processes = {}
+    for shard in shards:
+        process = context.Process(target=worker, args=(shard, ShardReporter(channel, shard.index)),
+                                  name=f"shard-{shard.index}", daemon=True)
+        process.start()
+        processes[shard.index] = process
+    next_report = time.monotonic() + report_interval
+    try:
+        while True:
+            try:
+                shard, event = channel.get(timeout=0.5)
+                view.apply(shard, event)
+            except queue.Empty:
+                # Only an idle channel shows that exited workers have nothing left to send
+                for index, process in processes.items():
+                    if process.exitcode is not None and view.shards[index].exit_code is None:
+                        view.shards[index].exit_code = process.exitcode
+                        print(f"Shard {index} exited with code {process.exitcode}")
+                if all(exposure.exit_code is not None for exposure in view.shards.values()):
+                    break
+            if time.monotonic() >= next_report:
+                print(view.report())
+                next_report = time.monotonic() + report_interval
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=5)
+    print(view.report())
+    return view
@@ -0,0 +1,212 @@
+"""PairSignals keeps the pair-cost signals of one up/down market current, one event at a time."""
+
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+
+from bot.market import OrderBook
+
+
+class PairSignals:
+    """
+    Running position and book statistics of an up/down pair.
+
+    Position fills and book updates each adjust the state in constant time: averages,
+    pair cost and hedge ratio are recomputed from running sums, mid and spread feed
+    EWMAs, and the rolling minimum of the combined best ask over window seconds is
+    kept in a monotonic deque. The depth-weighted cost of buying order_size on a leg
+    walks only the ask levels that size reaches. Policies read the results as plain
+    attributes.
+    """
+
+    def __init__(self, order_size: float, alpha: float = 0.1, window: float = 60.0):
+        """
+        Initialize PairSignals.
+
+        Args:
+            order_size: Shares per order, the size marginal costs are priced for
+            alpha: Weight of the newest value in the EWMAs
+            window: Seconds covered by the rolling minimum of the combined ask
+        """
+        self.order_size = order_size
+        self.alpha = alpha
+        self.window = window
+        # Position
+        self.up_amount = 0.0
+        self.up_spent = 0.0
+        self.down_amount = 0.0
+        self.down_spent = 0.0
+        self.up_avg = 0.0
+        self.down_avg = 0.0
+        self.pair_cost = 0.0
+        # Pair cost when the current tick started, the bar both legs of the tick are judged against
+        self.tick_pair_cost = 0.0
+        # UP shares per DOWN share, inf while only UP is held
+        self.hedge_ratio = 0.0
+        # Books, 0 while a leg has no asks
+        self.up_ask = 0.0
+        self.down_ask = 0.0
+        self.up_mid = 0.0
+        self.down_mid = 0.0
+        self.up_spread = 0.0
+        self.down_spread = 0.0
+        self.combined_ask = 0.0
+        self.combined_ask_ewma = 0.0
+        self.combined_ask_min = 0.0
+        self.spread_ewma = 0.0
+        # (vwap, worst price) of buying order_size of each leg, (0, 0) if the asks cannot fill it
+        self.up_price = 0.0
+        self.up_limit = 0.0
+        self.down_price = 0.0
+        self.down_limit = 0.0
+        # Average pair cost after buying order_size of a leg at its vwap
+        self.up_marginal_cost = 0.0
+        self.down_marginal_cost = 0.0
+        self.updates = 0
+        # (time, combined ask) candidates for the rolling minimum, increasing in both
+        self._min_window: deque = deque()
+
+    def set_position(self, up_spent: float, down_spent: float, up_amount: float, down_amount: float) -> None:
+        self.up_spent, self.down_spent = up_spent, down_spent
+        self.up_amount, self.down_amount = up_amount, down_amount
+        self._position_changed()
+        self.start_tick()
+
+    def start_tick(self) -> None:
+        """
+        Fix the pair cost a tick's buys have to beat, before any fill of the tick moves it.
+        """
+        self.tick_pair_cost = self.pair_cost
+
+    def add_fill(self, leg: str, size: float, cost: float) -> None:
+        """
+        Add size shares bought for cost to the "up" or "down" leg, negative values take them back.
+        """
+        if leg == "up":
+            self.up_amount += size
+            self.up_spent += cost
+        else:
+            self.down_amount += size
+            self.down_spent += cost
+        self._position_changed()
+
+    def _position_changed(self) -> None:
+        self.up_avg = self.up_spent / self.up_amount if self.up_amount > 1e-9 else 0.0
+        self.down_avg = self.down_spent / self.down_amount if self.down_amount > 1e-9 else 0.0
+        self.pair_cost = self.up_avg + self.down_avg
+        if self.down_amount > 1e-9:
+            self.hedge_ratio = self.up_amount / self.down_amount
+        else:
+            self.hedge_ratio = math.inf if self.up_amount > 1e-9 else 0.0
+        self._update_marginal_costs()
+
+    def quote(self, leg: str, price: float, limit: float) -> None:
+        """
+        Set the (vwap, worst price) of buying order_size of a leg, as priced by Market.up_fill or down_fill.
+        """
+        if leg == "up":
+            self.up_price, self.up_limit = price, limit
+            self._update_up_marginal_cost()
+        else:
+            self.down_price, self.down_limit = price, limit
+            self._update_down_marginal_cost()
+
+    def _update_marginal_costs(self) -> None:
+        self._update_up_marginal_cost()
+        self._update_down_marginal_cost()
+
+    def _update_up_marginal_cost(self) -> None:
+        if self.up_limit:
+            size = self.order_size
+            self.up_marginal_cost = (self.up_spent + self.up_price * size) / (self.up_amount + size) + self.down_avg
+        else:
+            self.up_marginal_cost = 0.0
+
+    def _update_down_marginal_cost(self) -> None:
+        if self.down_limit:
+            size = self.order_size
+            self.down_marginal_cost = self.up_avg + (self.down_spent + self.down_price * size) / (self.down_amount + size)
+        else:
+            self.down_marginal_cost = 0.0
+
+    def on_book(self, leg: str, book: OrderBook, ts: float) -> None:
+        """
+        Update the statistics after the "up" or "down" book changed at unix time ts.
+        """
+        asks = book.ask_prices
+        bids = book.bid_prices
+        ask = asks[0] if asks else 0.0
+        bid = bids[-1] if bids else 0.0
+        spread = ask - bid if ask and bid else 0.0
+        if leg == "up":
+            self.up_ask, self.up_spread = ask, spread
+            self.up_mid = (ask + bid) / 2 if ask and bid else ask or bid
+            self.up_price, self.up_limit = book.buy_vwap(self.order_size)
+            self._update_up_marginal_cost()
+        else:
+            self.down_ask, self.down_spread = ask, spread
+            self.down_mid = (ask + bid) / 2 if ask and bid else ask or bid
+            self.down_price, self.down_limit = book.buy_vwap(self.order_size)
+            self._update_down_marginal_cost()
+        self.updates += 1
+
+        alpha = self.alpha
+        spread = self.up_spread + self.down_spread
+        self.spread_ewma += alpha * (spread - self.spread_ewma)
+        if not self.up_ask or not self.down_ask:
+            self.combined_ask = 0.0
+            return
+        combined = self.up_ask + self.down_ask
+        self.combined_ask = combined
+        if self.combined_ask_ewma:
+            self.combined_ask_ewma += alpha * (combined - self.combined_ask_ewma)
+        else:
+            self.combined_ask_ewma = combined
+        window = self._min_window
+        while window and window[-1][1] >= combined:
+            window.pop()
+        window.append((ts, combined))
+        horizon = ts - self.window
+        while window[0][0] < horizon:
+            window.popleft()
+        self.combined_ask_min = window[0][1]
+
+
+class SignalPolicy(ABC):
+    """
+    Decides from PairSignals whether to buy a leg. TradeStrategy takes one to replace
+    its pair-cost rules; subclasses only read the signals, so a decision costs a few
+    comparisons however often the books change.
+    """
+
+    @abstractmethod
+    def buy_up(self, signals: PairSignals) -> bool:
+        ...
+
+    @abstractmethod
+    def buy_down(self, signals: PairSignals) -> bool:
+        ...
+
+
+class PairCostPolicy(SignalPolicy):
+    """
+    The rules of TradeStrategy: buy a leg if that brings the average pair cost below the
+    one the tick started with and the leg does not outweigh the other one by
+    pair_difference_threshold.
+
+    UP is judged first, and adding shares at the vwap lowers the pair cost exactly when
+    the vwap is below the leg's average price. DOWN is judged after UP's fill of the
+    same tick, so its marginal cost includes the new UP average and is compared with
+    the pair cost from before the tick.
+    """
+
+    def __init__(self, pair_difference_threshold: float):
+        self.pair_difference_threshold = pair_difference_threshold
+
+    def buy_up(self, signals: PairSignals) -> bool:
+        return (bool(signals.up_limit) and signals.up_price < signals.up_avg
+                and signals.up_amount < self.pair_difference_threshold * signals.down_amount)
+
+    def buy_down(self, signals: PairSignals) -> bool:
+        return (bool(signals.down_limit) and signals.down_marginal_cost < signals.tick_pair_cost
+                and signals.down_amount < self.pair_difference_threshold * signals.up_amount)
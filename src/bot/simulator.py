@@ -0,0 +1,589 @@
+"""
+Simulated CLOB exchange, chain account and clock for running the bot offline.
+
+SimExchange matches orders against recorded or synthetic books, SimClobClient,
+SimAccount, SimResolver and SimFinder stand in for ClobClient, AccountManager,
+MarketQL and MarketFinder on top of it, and SimClock replaces wall time so slots
+pass as fast as the bot can trade them.
+"""
+
+import hashlib
+import itertools
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from py_clob_client.clob_types import OrderBookSummary, OrderSummary, OrderType
+from py_clob_client.order_builder.constants import BUY
+
+from bot.backtest import RecordedSlot
+from bot.book_recorder import BookSnapshot, load_index
+from bot.market_finder import MarketFinder
+
+_real_sleep = time.sleep
+
+
+class SimClock:
+    """
+    Virtual wall clock.
+
+    The thread that installs the clock drives it: its sleeps advance virtual time at
+    once (or speed times faster than real time if speed is set). Sleeps of other
+    threads block until the driver has moved virtual time past their deadline. A
+    clock that is not installed is advanced by any thread.
+    """
+
+    def __init__(self, start: float, speed: float = 0.0):
+        self.now = start
+        self.speed = speed
+        self._origin = start
+        self._cond = threading.Condition()
+        self._driver: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now - self._origin
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Call listener every time the driver advances the clock, to wake threads that
+        wait on real time with timeouts computed from virtual time.
+        """
+        self._listeners.append(listener)
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        if self._driver is not None and threading.current_thread() is not self._driver:
+            deadline = self.now + seconds
+            with self._cond:
+                self._cond.wait_for(lambda: self.now >= deadline)
+            return
+        if self.speed:
+            _real_sleep(seconds / self.speed)
+        with self._cond:
+            self.now += seconds
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def run_until(self, done: Callable[[], bool], timeout: float, step: float = 1.0, pause: float = 0.01) -> bool:
+        """
+        Advance the clock by step at a time, giving other threads pause seconds of real
+        time after each step, until done() holds or timeout virtual seconds passed.
+        """
+        deadline = self.now + timeout
+        while not done():
+            if self.now >= deadline:
+                return False
+            self.sleep(step)
+            _real_sleep(pause)
+        return True
+
+    @contextmanager
+    def install(self) -> Iterator["SimClock"]:
+        """
+        Route time.time, time.monotonic, time.sleep and datetime.now of the bot modules to this clock.
+        """
+        clock = self
+
+        class SimDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.time(), tz)
+
+        saved = (time.time, time.monotonic, time.sleep)
+        modules = [module for name, module in list(sys.modules.items())
+                   if name.startswith("bot.") and getattr(module, "datetime", None) is datetime]
+        self._driver = threading.current_thread()
+        time.time, time.monotonic, time.sleep = self.time, self.monotonic, self.sleep
+        for module in modules:
+            module.datetime = SimDatetime
+        try:
+            yield self
+        finally:
+            time.time, time.monotonic, time.sleep = saved
+            for module in modules:
+                module.datetime = datetime
+            self._driver = None
+
+
+@dataclass
+class SimSlot:
+    start: int
+    condition_id: str
+    up_token: str
+    down_token: str
+    snapshots: List[BookSnapshot]
+    # 0 if UP won, 1 if DOWN won
+    winner: int
+
+
+def synthetic_slots(first_start: int, count: int, slot_seconds: int = 900, seed: int = 0,
+                    leg_noise: float = 0.02) -> List[SimSlot]:
+    """
+    Slots whose UP price follows a random walk, with DOWN mirroring it and eight ask
+    and bid levels around each mid. Each leg's mid gets its own gaussian noise of
+    leg_noise per snapshot, so the combined ask now and then dips below 1 like on the
+    real books. The side above 0.5 at the end wins.
+    """
+    rng = random.Random(seed)
+    slots = []
+    for slot_idx in range(count):
+        start = first_start + slot_idx * slot_seconds
+        snapshots = []
+        mid = 0.5
+        ts = start - 1.0
+        while ts < start + slot_seconds:
+            ts += rng.expovariate(1 / 0.7)
+            mid = min(0.97, max(0.03, mid + rng.gauss(0, 0.02)))
+            for token, price in ((0, mid), (1, 1 - mid)):
+                price += rng.gauss(0, leg_noise)
+                spread = rng.choice([0.01, 0.02, 0.03])
+                bids = [(round(price - spread - i * 0.01, 2), round(rng.uniform(1, 30), 2)) for i in range(8)]
+                asks = [(round(price + spread + i * 0.01, 2), round(rng.uniform(1, 30), 2)) for i in range(8)]
+                snapshots.append(BookSnapshot(
+                    ts, token, [level for level in bids if level[0] > 0], [level for level in asks if level[0] < 1],
+                ))
+        condition_id = "0x" + hashlib.sha256(f"sim-{seed}-{start}".encode()).hexdigest()
+        token_base = int(condition_id[2:18], 16)
+        slots.append(SimSlot(start, condition_id, str(token_base * 2), str(token_base * 2 + 1), snapshots,
+                             0 if mid >= 0.5 else 1))
+    return slots
+
+
+def replay_slots(market_dir: str) -> List[SimSlot]:
+    """
+    Slots recorded by BookRecorder, with winners inferred from their last books.
+    """
+    slots = []
+    for start, entry in sorted(load_index(market_dir).items()):
+        recorded = RecordedSlot.load(market_dir, entry)
+        slots.append(SimSlot(start, entry["condition_id"], entry["up_token"], entry["down_token"],
+                             recorded.snapshots, recorded.winner))
+    return slots
+
+
+@dataclass
+class SimOrder:
+    token_id: str
+    side: str
+    price: float
+    # Market BUY orders are sized in dollars, limit orders in shares
+    amount: float = 0.0
+    size: float = 0.0
+    expiration: int = 0
+
+
+@dataclass
+class RestingOrder:
+    order_id: str
+    token_id: str
+    price: float
+    size: float
+    queue_ahead: float
+    filled: float = 0.0
+    expiration: int = 0
+
+
+@dataclass
+class SimFill:
+    ts: float
+    order_id: str
+    token_id: str
+    price: float
+    size: float
+
+
+@dataclass
+class _TokenState:
+    slot: SimSlot
+    snapshots: List[BookSnapshot]
+    position: int = -1
+    # price -> size we took out of the current snapshot
+    consumed: Dict[float, float] = field(default_factory=dict)
+
+
+class SimExchange:
+    """
+    Matches orders against the books of a list of slots at SimClock time.
+
+    Orders reach the book after a sampled latency. Taker fills remove liquidity
+    from the current snapshot until the next snapshot of that token replaces it.
+    A resting BUY order starts behind the size already bid at its price; that queue
+    shrinks as the level shrinks in later snapshots, and the order fills when the
+    level shrinks past it or asks cross its price. USDC and outcome token balances
+    are tracked, and a slot resolves resolution_delay seconds after it ends.
+    """
+
+    TICK_SIZE = "0.01"
+    FOK_ERROR = "order couldn't be fully filled. FOK orders are fully filled or killed."
+
+    def __init__(self, slots: List[SimSlot], clock: SimClock, slot_seconds: int = 900, usdc: float = 1000.0,
+                 latency: float = 0.05, latency_jitter: float = 0.05, resolution_delay: float = 60.0, seed: int = 0):
+        self.slots = {slot.start: slot for slot in slots}
+        self.clock = clock
+        self.slot_seconds = slot_seconds
+        self.usdc = usdc
+        self.reserved = 0.0
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.resolution_delay = resolution_delay
+        self.address = "0x" + "51" * 20
+        self.positions: Dict[str, float] = {}
+        self.orders: Dict[str, RestingOrder] = {}
+        self.fills: List[SimFill] = []
+        self.submitted = 0
+        self.rejected = 0
+        self.redeemed: Dict[str, float] = {}
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._by_condition = {slot.condition_id: slot for slot in slots}
+        self._tokens: Dict[str, _TokenState] = {}
+        for slot in slots:
+            for token, token_id in enumerate((slot.up_token, slot.down_token)):
+                self._tokens[token_id] = _TokenState(slot, [s for s in slot.snapshots if s.token == token])
+
+    def condition_id_at(self, start: int) -> Optional[str]:
+        slot = self.slots.get(start)
+        return slot.condition_id if slot else None
+
+    def market_info(self, condition_id: str) -> dict:
+        slot = self._by_condition[condition_id]
+        return {
+            "condition_id": condition_id,
+            "minimum_tick_size": float(self.TICK_SIZE),
+            "neg_risk": False,
+            "tokens": [
+                {"token_id": slot.up_token, "outcome": "Up"},
+                {"token_id": slot.down_token, "outcome": "Down"},
+            ],
+        }
+
+    def levels(self, token_id: str) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        """
+        Current (bids, asks) of a token, best first, net of our own fills.
+        """
+        with self._lock:
+            state = self._advance(token_id)
+            if state.position < 0:
+                return [], []
+            snapshot = state.snapshots[state.position]
+            asks = [(price, size - state.consumed.get(price, 0.0)) for price, size in snapshot.asks]
+            return list(snapshot.bids), [(price, size) for price, size in asks if size > 1e-9]
+
+    def summary(self, token_id: str) -> OrderBookSummary:
+        bids, asks = self.levels(token_id)
+        # REST books list both sides worst first
+        return OrderBookSummary(
+            market=self._tokens[token_id].slot.condition_id,
+            asset_id=token_id,
+            timestamp=str(int(self.clock.time() * 1000)),
+            bids=[OrderSummary(str(price), str(size)) for price, size in reversed(bids)],
+            asks=[OrderSummary(str(price), str(size)) for price, size in reversed(asks)],
+            neg_risk=False,
+            tick_size=self.TICK_SIZE,
+        )
+
+    def submit(self, order: SimOrder, order_type: str) -> dict:
+        """
+        Deliver an order after the network latency and match it, returning a post_order style response.
+        """
+        self.clock.sleep(self.latency + self._rng.uniform(0, self.latency_jitter))
+        with self._lock:
+            self.submitted += 1
+            if order.side != BUY or order.token_id not in self._tokens:
+                return self._reject("only BUY orders on known tokens are simulated")
+            _, asks = self.levels(order.token_id)
+            takes, shares, cost = self._match(asks, order)
+            wanted = order.size or order.amount / max(order.price, 1e-9)
+            complete = shares >= wanted - 1e-9 if order.size else cost >= order.amount - 1e-9
+            if order_type == OrderType.FOK and not complete:
+                return self._reject(self.FOK_ERROR)
+            resting = 0.0 if complete or order_type in (OrderType.FOK, OrderType.FAK) else wanted - shares
+            if cost + resting * order.price > self.usdc - self.reserved + 1e-9:
+                return self._reject("not enough balance / allowance")
+            order_id = f"0xsim{next(self._ids):08x}"
+            state = self._tokens[order.token_id]
+            for price, size in takes:
+                state.consumed[price] = state.consumed.get(price, 0.0) + size
+                self._fill(order_id, order.token_id, price, size)
+            if resting > 0:
+                bids, _ = self.levels(order.token_id)
+                queue_ahead = sum(size for price, size in bids if abs(price - order.price) < 1e-9)
+                self.orders[order_id] = RestingOrder(order_id, order.token_id, order.price, resting, queue_ahead,
+                                                     expiration=order.expiration)
+                self.reserved += resting * order.price
+            return {
+                "success": True,
+                "orderID": order_id,
+                "status": "live" if resting > 0 else "matched",
+                "makingAmount": str(round(cost, 6)),
+                "takingAmount": str(round(shares, 6)),
+                "errorMsg": "",
+            }
+
+    def cancel(self, order_id: str) -> bool:
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is None:
+                return False
+            self.reserved -= (order.size - order.filled) * order.price
+            return True
+
+    def open_orders(self) -> List[RestingOrder]:
+        with self._lock:
+            for token_id in {order.token_id for order in self.orders.values()}:
+                self._advance(token_id)
+            return list(self.orders.values())
+
+    def resolution(self, condition_id: str) -> Tuple[bool, Optional[int]]:
+        slot = self._by_condition.get(condition_id)
+        if slot is None or self.clock.time() < slot.start + self.slot_seconds + self.resolution_delay:
+            return False, None
+        return True, slot.winner
+
+    def redeem(self, condition_id: str) -> Optional[float]:
+        """
+        Pay out the winning tokens of a resolved condition, None if it is not resolved yet.
+        """
+        resolved, winner = self.resolution(condition_id)
+        if not resolved:
+            return None
+        slot = self._by_condition[condition_id]
+        with self._lock:
+            up, down = self.positions.pop(slot.up_token, 0.0), self.positions.pop(slot.down_token, 0.0)
+            payout = up if winner == 0 else down
+            self.usdc += payout
+            self.redeemed[condition_id] = payout
+            return payout
+
+    def equity(self) -> float:
+        """
+        USDC plus outcome tokens valued at 1 for resolved winners and at the best bid otherwise.
+        """
+        with self._lock:
+            value = self.usdc
+            for token_id, size in self.positions.items():
+                slot = self._tokens[token_id].slot
+                resolved, winner = self.resolution(slot.condition_id)
+                if resolved:
+                    value += size if (token_id == slot.up_token) == (winner == 0) else 0.0
+                else:
+                    bids, _ = self.levels(token_id)
+                    value += size * (bids[0][0] if bids else 0.0)
+            return value
+
+    def report(self) -> str:
+        return (
+            f"{self.submitted} orders, {self.rejected} rejected, {len(self.fills)} fills, "
+            f"{len(self.redeemed)} redeemed, USDC {self.usdc:.2f}, equity {self.equity():.2f}"
+        )
+
+    def _match(self, asks: List[Tuple[float, float]], order: SimOrder) -> Tuple[List[Tuple[float, float]], float, float]:
+        takes = []
+        shares = cost = 0.0
+        for price, size in asks:
+            if price > order.price + 1e-9:
+                break
+            if order.size:
+                take = min(size, order.size - shares)
+            else:
+                take = min(size, (order.amount - cost) / price)
+            if take <= 1e-9:
+                break
+            takes.append((price, take))
+            shares += take
+            cost += take * price
+        return takes, shares, cost
+
+    def _fill(self, order_id: str, token_id: str, price: float, size: float, ts: Optional[float] = None) -> None:
+        self.usdc -= price * size
+        self.positions[token_id] = self.positions.get(token_id, 0.0) + size
+        self.fills.append(SimFill(self.clock.time() if ts is None else ts, order_id, token_id, price, size))
+
+    def _reject(self, error: str) -> dict:
+        self.rejected += 1
+        return {"success": False, "error": error, "errorMsg": error}
+
+    def _advance(self, token_id: str) -> _TokenState:
+        state = self._tokens[token_id]
+        now = self.clock.time()
+        while state.position + 1 < len(state.snapshots) and state.snapshots[state.position + 1].ts <= now:
+            previous = state.snapshots[state.position] if state.position >= 0 else None
+            state.position += 1
+            state.consumed.clear()
+            self._update_resting(token_id, previous, state.snapshots[state.position])
+        return state
+
+    def _update_resting(self, token_id: str, previous: Optional[BookSnapshot], snapshot: BookSnapshot) -> None:
+        for order in [order for order in self.orders.values() if order.token_id == token_id]:
+            if order.expiration and snapshot.ts >= order.expiration:
+                self.cancel(order.order_id)
+                continue
+            remaining = order.size - order.filled
+            if snapshot.asks and snapshot.asks[0][0] <= order.price + 1e-9:
+                traded = remaining
+            else:
+                before = self._size_at(previous.bids if previous else [], order.price)
+                traded = max(0.0, before - self._size_at(snapshot.bids, order.price))
+                ahead = min(order.queue_ahead, traded)
+                order.queue_ahead -= ahead
+                traded = min(remaining, traded - ahead)
+            if traded > 1e-9:
+                order.filled += traded
+                self.reserved -= traded * order.price
+                self._fill(order.order_id, token_id, order.price, traded, snapshot.ts)
+            if order.size - order.filled <= 1e-9:
+                del self.orders[order.order_id]
+
+    @staticmethod
+    def _size_at(levels: List[Tuple[float, float]], price: float) -> float:
+        return sum(size for level_price, size in levels if abs(level_price - price) < 1e-9)
+
+
+class SimClobClient:
+    """The subset of ClobClient the bot uses, served by a SimExchange."""
+
+    def __init__(self, exchange: SimExchange):
+        self.exchange = exchange
+
+    def get_address(self) -> str:
+        return self.exchange.address
+
+    def get_ok(self) -> str:
+        return "OK"
+
+    def get_server_time(self) -> int:
+        return int(self.exchange.clock.time())
+
+    def get_market(self, condition_id: str) -> dict:
+        return self.exchange.market_info(condition_id)
+
+    def get_order_book(self, token_id: str) -> OrderBookSummary:
+        return self.exchange.summary(token_id)
+
+    def get_tick_size(self, token_id: str) -> str:
+        return self.exchange.TICK_SIZE
+
+    def get_neg_risk(self, token_id: str) -> bool:
+        return False
+
+    def get_fee_rate_bps(self, token_id: str) -> int:
+        return 0
+
+    def create_market_order(self, order_args, options=None) -> SimOrder:
+        return SimOrder(order_args.token_id, order_args.side, order_args.price, amount=order_args.amount)
+
+    def create_order(self, order_args, options=None) -> SimOrder:
+        return SimOrder(order_args.token_id, order_args.side, order_args.price, size=order_args.size,
+                        expiration=order_args.expiration)
+
+    def post_order(self, order: SimOrder, orderType: str = OrderType.GTC) -> dict:
+        return self.exchange.submit(order, orderType)
+
+    def cancel(self, order_id: str) -> dict:
+        if self.exchange.cancel(order_id):
+            return {"canceled": [order_id], "not_canceled": {}}
+        return {"canceled": [], "not_canceled": {order_id: "order not found"}}
+
+    def get_orders(self, params=None) -> List[dict]:
+        return [
+            {"id": order.order_id, "asset_id": order.token_id, "price": str(order.price), "side": BUY,
+             "original_size": str(order.size), "size_matched": str(order.filled), "status": "LIVE"}
+            for order in self.exchange.open_orders()
+        ]
+
+    def get_trades(self, params=None) -> List[dict]:
+        return [
+            {"id": f"{fill.order_id}-{idx}", "taker_order_id": fill.order_id, "asset_id": fill.token_id,
+             "price": str(fill.price), "size": str(fill.size), "side": BUY, "match_time": str(int(fill.ts))}
+            for idx, fill in enumerate(self.exchange.fills)
+        ]
+
+
+class SimAccount:
+    """
+    Stand-in for AccountManager on the simulated chain: balances come from the
+    exchange, approvals always succeed and every transaction costs GAS_COST POL.
+    """
+
+    GAS_COST = 0.01
+
+    def __init__(self, exchange: SimExchange, pol: float = 10.0):
+        self.exchange = exchange
+        self.addr = exchange.address
+        self.dry_mode = False
+        self.pol = pol
+
+    def balance(self) -> float:
+        return self.pol
+
+    def usdc_balance(self) -> float:
+        return self.exchange.usdc
+
+    def on_spent(self, amount: float) -> None:
+        pass
+
+    def on_redeemed(self, amount: float) -> None:
+        pass
+
+    def redeem_market(self, condition_id: str, on_confirmed: Optional[Callable[[bool], None]] = None) -> bool:
+        self.pol -= self.GAS_COST
+        ok = self.exchange.redeem(condition_id) is not None
+        if on_confirmed is not None:
+            on_confirmed(ok)
+            return True
+        return ok
+
+    def ensure_usdc_allowance(self, required_amount: float, addr: str) -> bool:
+        return True
+
+    def ensure_usdc_allowances(self, required_amount: float, addrs: List[str]) -> bool:
+        return True
+
+    def ensure_ctf_allowance(self, addr: str) -> bool:
+        return True
+
+    def ensure_ctf_allowances(self, addrs: List[str]) -> bool:
+        return True
+
+
+class SimResolver:
+    """Stand-in for MarketQL answering from the exchange's resolutions."""
+
+    def __init__(self, exchange: SimExchange):
+        self.exchange = exchange
+
+    def resolved(self, condition_id: str) -> Tuple[bool, Optional[int]]:
+        return self.exchange.resolution(condition_id)
+
+    def resolved_many(self, condition_ids: List[str]) -> Dict[str, Tuple[bool, Optional[int]]]:
+        return {condition_id: self.exchange.resolution(condition_id) for condition_id in condition_ids}
+
+
+class SimFinder(MarketFinder):
+    """MarketFinder looking up slot markets in the exchange instead of the Gamma API."""
+
+    def __init__(self, exchange: SimExchange, asset: str = "btc", slot_minutes: int = 15):
+        super().__init__("", asset, slot_minutes)
+        self.exchange = exchange
+
+    def get_market_id_by_slug(self, slug: str) -> str:
+        condition_id = self.exchange.condition_id_at(int(slug.rsplit("-", 1)[1]))
+        if condition_id is None:
+            raise ValueError("No market found in response")
+        return condition_id
+
+    def get_market_ids_by_slugs(self, slugs: List[str]) -> Dict[str, str]:
+        condition_ids = {slug: self.exchange.condition_id_at(int(slug.rsplit("-", 1)[1])) for slug in slugs}
+        return {slug: condition_id for slug, condition_id in condition_ids.items() if condition_id is not None}
@@ -0,0 +1,215 @@
+"""SlotClock keeps slot timing on the monotonic clock, calibrated against the exchange's time."""
+
+import asyncio
+import inspect
+import math
+import time
+from typing import Any, Callable, Optional
+
+
+class SlotClock:
+    """
+    Wall clock time derived from time.monotonic, so sleeps and tick grids cannot drift
+    or jump with the system clock.
+
+    The monotonic clock is anchored to time.time once, and calibrate() corrects the
+    anchor by the offset to the server's clock when the local one is provably off.
+    Every slot deadline and tick is computed from now(), which is one addition.
+    """
+
+    # Longest single sleep, so a recalibration during a long wait is picked up
+    MAX_SLEEP = 30.0
+
+    def __init__(self):
+        self.offset = 0.0
+        self._anchor = time.time() - time.monotonic()
+
+    def now(self) -> float:
+        """
+        Unix time in seconds, on the server's clock once calibrated.
+        """
+        return time.monotonic() + self._anchor + self.offset
+
+    def calibrate(self, server_time: Callable[[], Any], samples: int = 5) -> float:
+        """
+        Estimate the offset of the server's clock to ours.
+
+        The server answers in whole seconds, so each sample only bounds the offset: a
+        reply s read between local times t0 and t1 means s - t1 < offset < s + 1 - t0.
+        Samples are spread over a second to narrow the intersection of these bounds.
+        The local clock is kept if it lies within them, otherwise the nearest bound
+        is used.
+
+        Args:
+            server_time: Returns the server's unix time, e.g. ClobClient.get_server_time
+            samples: How many requests to make
+
+        Returns:
+            The offset in seconds added to local time from now on
+        """
+        self._anchor = time.time() - time.monotonic()
+        low, high = -math.inf, math.inf
+        for i in range(samples):
+            if i:
+                time.sleep(1.0 / samples)
+            t0 = self._local()
+            try:
+                server = float(server_time())
+            except Exception as e:
+                print(f"Error reading server time: {e}")
+                continue
+            t1 = self._local()
+            low = max(low, server - t1)
+            high = min(high, server + 1 - t0)
+        if low > high or math.isinf(low):
+            # Contradicting or no answers, trust the local clock
+            self.offset = 0.0
+        else:
+            self.offset = min(max(0.0, low), high)
+        return self.offset
+
+    def _local(self) -> float:
+        return time.monotonic() + self._anchor
+
+    def sleep_until(self, deadline: float) -> None:
+        """
+        Sleep until now() reaches deadline, waking early only to recheck the remaining time.
+        """
+        while True:
+            remaining = deadline - self.now()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, self.MAX_SLEEP))
+
+    def wait_until(self, deadline: float, warmup: Optional[Callable[[], Any]] = None, lead: float = 0.0) -> Any:
+        """
+        Sleep until deadline, running warmup lead seconds before it, e.g. to check
+        balances and load the market before a slot opens instead of after.
+
+        Returns:
+            What warmup returned, None without one
+        """
+        result = None
+        if warmup is not None:
+            self.sleep_until(deadline - lead)
+            result = warmup()
+        self.sleep_until(deadline)
+        return result
+
+    def ticks(self, end: float, interval: float, wait: Optional[Callable[[float], Any]] = None,
+              guard: float = 0.0, pace: Optional[Callable[[float], float]] = None) -> "TickSchedule":
+        """
+        A TickSchedule of ticks every interval seconds until end, see TickSchedule.
+        """
+        return TickSchedule(self, end, interval, wait, guard, pace)
+
+
+class TickSchedule:
+    """
+    Iterates over ticks on a fixed grid of interval seconds starting at the first tick.
+
+    Ticks are due at first + k * interval whatever the ticks before them took, so the
+    cadence does not drift; after a tick that overran, the next one runs at once and
+    the grid points it missed are skipped. The schedule stops before a tick whose
+    expected duration would take it past end, the expectation being the longest recent
+    tick, decayed by DECAY per tick. The time between two iterations is the tick's
+    duration.
+
+    wait(timeout) replaces time.sleep between ticks, e.g. Market.wait_for_update, and
+    may return early to start the next tick ahead of the grid. Iterating with async for
+    awaits wait, which has to be a coroutine function then, or asyncio.sleep.
+
+    pace(interval), e.g. AdaptivePoll.interval, maps the interval to the spacing of the
+    next tick, so a loop can poll less often while its endpoint is slow or throttled.
+    """
+
+    DECAY = 0.9
+
+    def __init__(self, clock: SlotClock, end: float, interval: float,
+                 wait: Optional[Callable[[float], Any]] = None, guard: float = 0.0,
+                 pace: Optional[Callable[[float], float]] = None):
+        """
+        Initialize TickSchedule.
+
+        Args:
+            clock: The clock to schedule on
+            end: Unix time no tick may run past, usually the slot end
+            interval: Seconds between ticks, fractions are fine
+            wait: Waits up to its argument in seconds between ticks, time.sleep if None
+            guard: Seconds kept free before end on top of the expected tick duration
+            pace: Returns the spacing of the next tick given interval, interval itself if None
+        """
+        self.clock = clock
+        self.end = end
+        self.interval = interval
+        self.wait = wait
+        self.guard = guard
+        self.pace = pace
+        self.count = 0
+        # Longest recent tick duration
+        self.expected = 0.0
+        # Grid point of the last tick that ran on schedule
+        self._due: Optional[float] = None
+        self._started: Optional[float] = None
+
+    def _finish_tick(self, now: float) -> None:
+        if self._started is not None:
+            self.expected = max(now - self._started, self.expected * self.DECAY)
+            self._started = None
+
+    def _next_due(self, now: float) -> float:
+        if self._due is None:
+            return now
+        interval = self.interval if self.pace is None else self.pace(self.interval)
+        due = self._due + interval
+        if due <= now:
+            # Overran, skip the missed grid points instead of catching up with a burst
+            due += math.floor((now - due) / interval) * interval
+        return due
+
+    def _start_tick(self, due: float) -> int:
+        now = self.clock.now()
+        if now >= due:
+            self._due = due
+        # A tick woken early by wait leaves the grid as it is
+        self.count += 1
+        self._started = now
+        return self.count
+
+    def _fits(self, at: float) -> bool:
+        return at + self.expected + self.guard < self.end
+
+    def __iter__(self) -> "TickSchedule":
+        return self
+
+    def __next__(self) -> int:
+        now = self.clock.now()
+        self._finish_tick(now)
+        due = self._next_due(now)
+        if not self._fits(max(due, now)):
+            raise StopIteration
+        if due > now:
+            if self.wait is None:
+                self.clock.sleep_until(due)
+            else:
+                self.wait(due - now)
+        if not self._fits(self.clock.now()):
+            raise StopIteration
+        return self._start_tick(due)
+
+    def __aiter__(self) -> "TickSchedule":
+        return self
+
+    async def __anext__(self) -> int:
+        now = self.clock.now()
+        self._finish_tick(now)
+        due = self._next_due(now)
+        if not self._fits(max(due, now)):
+            raise StopAsyncIteration
+        if due > now:
+            waited = (self.wait or asyncio.sleep)(due - now)
+            if inspect.isawaitable(waited):
+                await waited
+        if not self._fits(self.clock.now()):
+            raise StopAsyncIteration
+        return self._start_tick(due)
@@ -0,0 +1,232 @@
+"""StateStore persists the session's positions and PnL so a restarted bot picks up where it stopped."""
+
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bot.pnl import PnL
+from bot.trade_strategy import TradeStrategy
+
+
+@dataclass
+class SlotPosition:
+    condition_id: str
+    start: int
+    up_spent: float = 0.0
+    down_spent: float = 0.0
+    up_amount: float = 0.0
+    down_amount: float = 0.0
+
+
+@dataclass
+class SessionState:
+    # Sequence number of the last event applied
+    seq: int = 0
+    profit: float = 0.0
+    max_spent: float = 0.0
+    min_profit: float = 0.0
+    max_profit: float = 0.0
+    # condition_id -> (up_amount, down_amount) of closed slots waiting for resolution
+    pending: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    # The slot being traded, None between slots
+    slot: Optional[SlotPosition] = None
+
+    def apply(self, event: dict) -> None:
+        """
+        Apply one journal event. Restarts replay the journal through here as well.
+        """
+        self.seq = event["seq"]
+        kind = event["type"]
+        if kind == "slot_open":
+            self.slot = SlotPosition(event["condition_id"], event["start"])
+        elif kind == "fill":
+            if self.slot is None or self.slot.condition_id != event["condition_id"]:
+                return
+            if event["leg"] == "up":
+                self.slot.up_amount += event["size"]
+                self.slot.up_spent += event["cost"]
+            else:
+                self.slot.down_amount += event["size"]
+                self.slot.down_spent += event["cost"]
+        elif kind == "slot_close":
+            if self.slot is not None and self.slot.condition_id == event["condition_id"]:
+                self.slot = None
+            self.profit -= event["spent"]
+            self.max_spent = max(self.max_spent, event["spent"])
+            if event["up_amount"] or event["down_amount"]:
+                self.pending[event["condition_id"]] = (event["up_amount"], event["down_amount"])
+        elif kind == "settled":
+            self.pending.pop(event["condition_id"], None)
+            self.profit += event["payout"]
+            self.max_profit = max(self.max_profit, self.profit)
+            self.min_profit = min(self.min_profit, self.profit)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionState":
+        slot = data.pop("slot", None)
+        state = cls(**data)
+        state.pending = {condition_id: tuple(amounts) for condition_id, amounts in state.pending.items()}
+        state.slot = SlotPosition(**slot) if slot else None
+        return state
+
+
+class StateStore:
+    """
+    Keeps the session state in directory/snapshot.json plus the events since then in
+    directory/journal.jsonl.
+
+    Recording an event applies it to the in-memory state at once and queues its
+    journal line; a background thread writes queued lines every FLUSH_INTERVAL
+    seconds, so the trading thread never touches the disk. Every SNAPSHOT_EVERY events
+    and at each slot close the whole state is written to a new snapshot, swapped in
+    atomically, and the journal is emptied. Loading reads the snapshot and replays the
+    journal events newer than it, dropping a line cut short by a crash.
+    """
+
+    FLUSH_INTERVAL = 0.2
+    SNAPSHOT_EVERY = 1000
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.directory / "snapshot.json"
+        self.journal_path = self.directory / "journal.jsonl"
+        self.state = self.load()
+        self._lines: List[str] = []
+        self._since_snapshot = 0
+        self._snapshot_due = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._journal = open(self.journal_path, "a")
+        self._thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+        self._thread.start()
+
+    def load(self) -> SessionState:
+        state = SessionState()
+        try:
+            with open(self.snapshot_path) as f:
+                state = SessionState.from_dict(json.load(f))
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.journal_path, "r+b") as f:
+                good = 0
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Cut off the line a crash left half written, or new lines would be glued to it
+                        f.truncate(good)
+                        break
+                    good += len(line)
+                    if event["seq"] > state.seq:
+                        state.apply(event)
+        except FileNotFoundError:
+            pass
+        return state
+
+    def record(self, kind: str, **fields) -> None:
+        event = {"type": kind, **fields}
+        with self._lock:
+            event["seq"] = self.state.seq + 1
+            self.state.apply(event)
+            self._lines.append(json.dumps(event))
+            self._since_snapshot += 1
+            if kind == "slot_close" or self._since_snapshot >= self.SNAPSHOT_EVERY:
+                self._snapshot_due = True
+                self._wake.set()
+
+    def slot_opened(self, condition_id: str, start: int) -> None:
+        self.record("slot_open", condition_id=condition_id, start=start)
+
+    def fill(self, condition_id: str, leg: str, size: float, cost: float) -> None:
+        self.record("fill", condition_id=condition_id, leg=leg, size=size, cost=cost)
+
+    def slot_closed(self, condition_id: str, strategy: TradeStrategy) -> None:
+        self.record("slot_close", condition_id=condition_id, spent=strategy.spent(),
+                    up_amount=strategy.up_amount, down_amount=strategy.down_amount)
+
+    def settled(self, condition_id: str, payout: float) -> None:
+        self.record("settled", condition_id=condition_id, payout=payout)
+
+    def restore_pnl(self, pnl: PnL) -> None:
+        with self._lock:
+            pnl.profit = self.state.profit
+            pnl.max_spent = self.state.max_spent
+            pnl.min_profit = self.state.min_profit
+            pnl.max_profit = self.state.max_profit
+            pnl.pending = dict(self.state.pending)
+
+    def open_slot(self) -> Optional[SlotPosition]:
+        with self._lock:
+            return self.state.slot
+
+    def resume(self, pnl: PnL, slot_start: int) -> Optional[SlotPosition]:
+        """
+        Restore pnl and return the slot traded before the restart if it is the one
+        starting at slot_start. An earlier slot ended while the bot was down and is
+        booked like any closed slot.
+        """
+        self.restore_pnl(pnl)
+        resumed = self.open_slot()
+        if resumed is not None and resumed.start != slot_start:
+            stale = TradeStrategy(None, 0.0, 0.0, 0.0)
+            stale.restore(resumed.up_spent, resumed.down_spent, resumed.up_amount, resumed.down_amount)
+            pnl.close_slot(resumed.condition_id, stale)
+            self.slot_closed(resumed.condition_id, stale)
+            resumed = None
+        return resumed
+
+    def track(self, condition_id: str, start: int, strategy: TradeStrategy,
+              resumed: Optional[SlotPosition] = None) -> None:
+        """
+        Journal the slot opening and every fill of strategy, taking over the position
+        of resumed if it is this slot.
+        """
+        if resumed is not None and resumed.condition_id == condition_id:
+            strategy.restore(resumed.up_spent, resumed.down_spent, resumed.up_amount, resumed.down_amount)
+            print(f"Resumed position: {strategy.up_amount} UP, {strategy.down_amount} DOWN")
+        else:
+            self.slot_opened(condition_id, start)
+        strategy.position_listeners.append(lambda leg, size, cost: self.fill(condition_id, leg, size, cost))
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._flush()
+        self._journal.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self._flush()
+            except OSError as e:
+                print(f"Error writing state journal: {e}")
+
+    def _flush(self) -> None:
+        with self._lock:
+            lines, self._lines = self._lines, []
+            snapshot = None
+            if self._snapshot_due:
+                snapshot = json.dumps(asdict(self.state))
+                self._snapshot_due = False
+                self._since_snapshot = 0
+        if lines:
+            self._journal.write("\n".join(lines) + "\n")
+            self._journal.flush()
+        if snapshot is not None:
+            tmp_path = self.snapshot_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # Every journal line written so far is covered by the snapshot
+            self._journal.truncate(0)
@@ -1,8 +1,16 @@
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
 from bot import Market
+from bot.market import OrderBook
+from bot.metrics import metrics
+from bot.signals import PairCostPolicy, PairSignals, SignalPolicy
 
 
 class TradeStrategy:
-    def __init__(self, market: Market, order_size: float, max_combined_price: float, pair_difference_threshold:float):
+    def __init__(self, market: Market, order_size: float, max_combined_price: float, pair_difference_threshold:float,
+                 policy: Optional[SignalPolicy] = None):
         self.market = market
         self.order_size = order_size
         self.max_combined_price = max_combined_price
@@ -15,54 +23,166 @@ class TradeStrategy:
         self.down_inited = False
         self.init_up_price = 0
         self.init_down_price = 0
+        self.ticks = 0
+        # Wall clock time of the first fill, to measure slot open to first order
+        self.first_order_time = None
+        # Seconds from reading the books to the order response, one entry per tick that placed orders
+        self.tick_latencies: list[float] = []
+        # (leg, shares, cost) corrections from confirmed fills, queued by the order tracker's thread
+        self.fill_updates: deque = deque()
+        # Called with (leg, shares, cost) for every change of the position, e.g. to journal it
+        self.position_listeners: list[Callable[[str, float, float], None]] = []
+        # Position and prices kept current incrementally, policy decides the buys from them
+        self.signals = PairSignals(order_size)
+        # Last book read of each leg, the books this tick traded on
+        self.books: Dict[str, OrderBook] = {}
+        self.policy = policy if policy is not None else PairCostPolicy(pair_difference_threshold)
 
     def init(self)-> bool:
+        self.apply_fill_updates()
         if self.up_inited and self.down_inited:
             return True
 
-        up_price,  up_size =  self.market.best_up_ask()
-        down_price,  down_size =  self.market.best_down_ask()
-        if not self.up_inited:
-            self.init_up_price = up_price
-        if not self.down_inited:
-            self.init_down_price = down_price
-        if self.init_up_price + self.init_down_price < self.max_combined_price:
-            if up_size > self.order_size and not self.up_inited:
-                if self.market.buy_up(up_price,  self.order_size):
-                    self.up_spent += up_price * self.order_size
-                    self.up_amount += self.order_size
+        tick_start = time.perf_counter()
+        self.ticks += 1
+        # Price the whole order across the book, not just the top level
+        up_price, up_limit = self.market.up_fill(self.order_size)
+        down_price, down_limit = self.market.down_fill(self.order_size)
+        if self.should_init(up_price, up_limit, down_price, down_limit):
+            if not self.up_inited:
+                if self.market.buy_up(up_price, self.order_size, up_limit):
+                    self.on_up_fill(up_price, self.order_size)
                     self.up_inited = True
-            if down_size > self.order_size and not self.down_inited:
-                if self.market.buy_down(down_price,  self.order_size):
-                    self.down_spent += down_price * self.order_size
-                    self.down_amount += self.order_size
+                else:
+                    metrics.inc("missed", leg="up")
+            if not self.down_inited:
+                if self.market.buy_down(down_price, self.order_size, down_limit):
+                    self.on_down_fill(down_price, self.order_size)
                     self.down_inited = True
+                else:
+                    metrics.inc("missed", leg="down")
+            self.on_tick(tick_start)
 
         return self.up_inited and self.down_inited
 
     def trade(self)-> bool:
+        self.apply_fill_updates()
         if not self.up_inited or not self.down_inited:
-            return False
+            # A leg emptied by a fill correction is opened again before trading on
+            return self.init()
         res = False
-        pair_cost = self.up_spent / self.up_amount + self.down_spent / self.down_amount
-        up_price,  up_size =  self.market.best_up_ask()
-        if up_size > self.order_size:
-            new_pair_cost = (self.up_spent + up_price * self.order_size) / (self.up_amount + self.order_size) + self.down_spent / self.down_amount
-            if new_pair_cost < pair_cost and self.up_amount < self.pair_difference_threshold * self.down_amount:
-                if self.market.buy_up(up_price, self.order_size):
-                    self.up_spent += up_price * self.order_size
-                    self.up_amount += self.order_size
-                    res = True
-        down_price,  down_size =  self.market.best_down_ask()
-        if down_size > self.order_size:
-            new_pair_cost = self.up_spent / self.up_amount + (self.down_spent + self.order_size * down_price) / (self.down_amount + self.order_size)
-            if new_pair_cost < pair_cost and self.down_amount < self.pair_difference_threshold * self.up_amount:
-                if self.market.buy_down(down_price, self.order_size):
-                    self.down_spent += down_price * self.order_size
-                    self.down_amount += self.order_size
-                    res = True
+        tick_start = time.perf_counter()
+        self.ticks += 1
+        self.signals.start_tick()
+        up_price, up_limit = self.market.up_fill(self.order_size)
+        if self.should_buy_up(up_price, up_limit):
+            if self.market.buy_up(up_price, self.order_size, up_limit):
+                self.on_up_fill(up_price, self.order_size)
+                res = True
+            else:
+                metrics.inc("missed", leg="up")
+        down_price, down_limit = self.market.down_fill(self.order_size)
+        if self.should_buy_down(down_price, down_limit):
+            if self.market.buy_down(down_price, self.order_size, down_limit):
+                self.on_down_fill(down_price, self.order_size)
+                res = True
+            else:
+                metrics.inc("missed", leg="down")
+        if res:
+            self.on_tick(tick_start)
         return res
 
+    def should_init(self, up_price: float, up_limit: float, down_price: float, down_limit: float) -> bool:
+        """
+        Records the opening prices of legs not bought yet and checks the combined price allows opening.
+        """
+        if not self.up_inited:
+            self.init_up_price = up_price
+        if not self.down_inited:
+            self.init_down_price = down_price
+        priced = (self.up_inited or up_limit) and (self.down_inited or down_limit)
+        return bool(priced) and self.init_up_price + self.init_down_price < self.max_combined_price
+
+    def should_buy_up(self, up_price: float, up_limit: float) -> bool:
+        self.signals.quote("up", up_price, up_limit)
+        return self.policy.buy_up(self.signals)
+
+    def should_buy_down(self, down_price: float, down_limit: float) -> bool:
+        self.signals.quote("down", down_price, down_limit)
+        return self.policy.buy_down(self.signals)
+
+    def on_up_fill(self, price: float, size: float) -> None:
+        if self.first_order_time is None:
+            self.first_order_time = time.time()
+        self.up_spent += price * size
+        self.up_amount += size
+        metrics.inc("fills", leg="up")
+        self._position_changed("up", size, price * size)
+
+    def on_down_fill(self, price: float, size: float) -> None:
+        if self.first_order_time is None:
+            self.first_order_time = time.time()
+        self.down_spent += price * size
+        self.down_amount += size
+        metrics.inc("fills", leg="down")
+        self._position_changed("down", size, price * size)
+
+    def restore(self, up_spent: float, down_spent: float, up_amount: float, down_amount: float) -> None:
+        """
+        Take over the position of a slot traded before a restart. Legs already bought count as opened.
+        """
+        self.up_spent, self.down_spent = up_spent, down_spent
+        self.up_amount, self.down_amount = up_amount, down_amount
+        self.up_inited = up_amount > 0
+        self.down_inited = down_amount > 0
+        self.signals.set_position(up_spent, down_spent, up_amount, down_amount)
+
+    def on_book(self, leg: str, book: OrderBook) -> None:
+        """
+        Keep the book signals current, registered with Market.add_book_listener.
+        """
+        self.books[leg] = book
+        self.signals.on_book(leg, book, time.time())
+
+    def _position_changed(self, leg: str, size: float, cost: float) -> None:
+        self.signals.add_fill(leg, size, cost)
+        for listener in self.position_listeners:
+            listener(leg, size, cost)
+
+    def reconcile(self, leg: str, size: float, cost: float) -> None:
+        """
+        Fill listener of the market: queue a correction of the "up" or "down" leg by the
+        difference between its confirmed fills and what was booked for them.
+        """
+        self.fill_updates.append((leg, size, cost))
+
+    def apply_fill_updates(self) -> None:
+        """
+        Apply the queued corrections on the trading thread. A leg left empty, e.g. after
+        a trade failed on chain, has to be opened again, which trade() does through init().
+        """
+        while self.fill_updates:
+            leg, size, cost = self.fill_updates.popleft()
+            self._position_changed(leg, size, cost)
+            if leg == "up":
+                self.up_amount += size
+                self.up_spent += cost
+                if self.up_amount <= 1e-9:
+                    self.up_inited = False
+            else:
+                self.down_amount += size
+                self.down_spent += cost
+                if self.down_amount <= 1e-9:
+                    self.down_inited = False
+
+    def on_tick(self, tick_start: float) -> None:
+        """
+        Record the latency of a tick that placed orders, tick_start is its perf_counter reading.
+        """
+        latency = time.perf_counter() - tick_start
+        self.tick_latencies.append(latency)
+        metrics.observe("tick", latency)
+
     def current_profit(self)-> float:
         return min(self.up_amount,  self.down_amount) - (self.up_spent + self.down_spent)
 
@@ -76,4 +196,11 @@ class TradeStrategy:
         return self.down_amount - (self.up_spent + self.down_spent)
 
     def average_pair_cost(self)-> float:
-        return self.up_spent / self.up_amount + self.down_spent / self.down_amount
\ No newline at end of file
+        return self.signals.pair_cost
+
+    def latency_report(self) -> str:
+        if not self.tick_latencies:
+            return "no orders placed"
+        latencies = sorted(self.tick_latencies)
+        p50 = latencies[len(latencies) // 2]
+        return f"{len(latencies)} ticks, p50 {p50 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
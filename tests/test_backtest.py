@@ -0,0 +1,26 @@
+"""The vectorized backtest against TradeStrategy replayed slot by slot."""
+
+import random
+
+import pytest
+from backtest_bench import SLOT_SECONDS, make_slot
+
+from bot.backtest import ParameterGrid, evaluate_grid, run_reference
+
+
+@pytest.fixture(scope="module")
+def slots():
+    rng = random.Random(7)
+    return [make_slot(rng, 1_700_000_000 + i * SLOT_SECONDS) for i in range(4)]
+
+
+def test_grid_matches_the_reference_strategy(slots):
+    grid = ParameterGrid([5, 20], [0.98, 1.02], [1.5, 2.5], [0.5, 2.0], [1, 2], [1, 5])
+    result = evaluate_grid(slots, grid, SLOT_SECONDS)
+    traded = 0
+    for slot_idx, slot in enumerate(slots):
+        for param_idx, params in enumerate(result.params):
+            profit, spent = run_reference(slot, params, SLOT_SECONDS)
+            assert (result.profit[slot_idx, param_idx], result.spent[slot_idx, param_idx]) == (profit, spent), params
+            traded += spent > 0
+    assert traded > 0
@@ -0,0 +1,136 @@
+"""MarketStream against the fake CLOB market channel."""
+
+import time
+
+import pytest
+from fake_servers import FakeMarketChannel
+
+from bot.market_stream import MarketStream
+from bot.simulator import SimClock, SimExchange, synthetic_slots
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def slots():
+    return synthetic_slots(1_700_000_100 // 900 * 900, 2, seed=1)
+
+
+@pytest.fixture
+def exchange(slots):
+    return SimExchange(slots, SimClock(slots[0].start + 1), latency=0.0, latency_jitter=0.0)
+
+
+@pytest.fixture
+def channel(exchange):
+    channel = FakeMarketChannel(exchange)
+    channel.start()
+    yield channel
+    channel.stop()
+
+
+@pytest.fixture
+def stream(slots, exchange, channel):
+    slot = slots[0]
+    resyncs = []
+
+    def resync(token_id):
+        resyncs.append(token_id)
+        return exchange.summary(token_id)
+
+    stream = MarketStream(channel.url, [slot.up_token, slot.down_token], resync)
+    stream.resyncs = resyncs
+    stream.start()
+    assert wait_until(lambda: stream.is_synced(slot.up_token) and stream.is_synced(slot.down_token))
+    yield stream
+    stream.stop()
+
+
+def price_change(token_id: str, seq: int, *changes) -> dict:
+    return {
+        "event_type": "price_change",
+        "seq": seq,
+        "price_changes": [{"asset_id": token_id, "side": side, "price": str(price), "size": str(size)}
+                          for side, price, size in changes],
+    }
+
+
+def test_bad_frames_do_not_stop_the_stream(slots, channel, stream):
+    token_id = slots[0].up_token
+    channel.send("INVALID OPERATION")
+    # A change without price and size may have been a delta, so its token is resynced
+    channel.send({"event_type": "price_change", "price_changes": [{"asset_id": token_id, "side": "SELL"}]})
+    channel.send(price_change(token_id, 1, ("SELL", 0.02, 3)))
+    channel.send(price_change(token_id, 2, ("SELL", 0.01, 7)))
+    assert wait_until(lambda: stream.best_ask(token_id) == (0.01, 7))
+    assert stream._thread.is_alive()
+    assert stream.resyncs == [token_id]
+
+
+def test_changes_of_one_message_share_its_sequence_number(slots, channel, stream):
+    token_id = slots[0].up_token
+    channel.send(price_change(token_id, 1, ("SELL", 0.02, 3)))
+    channel.send(price_change(token_id, 2, ("SELL", 0.02, 0), ("SELL", 0.01, 4), ("BUY", 0.005, 9)))
+    assert wait_until(lambda: stream.book(token_id).bid_sizes.get(0.005) == 9)
+    assert stream.best_ask(token_id) == (0.01, 4)
+    assert stream.resyncs == []
+
+
+def test_sequence_gap_resyncs_from_rest(slots, exchange, channel, stream):
+    token_id = slots[0].up_token
+    channel.send(price_change(token_id, 1, ("SELL", 0.02, 3)))
+    assert wait_until(lambda: stream.best_ask(token_id) == (0.02, 3))
+    # seq 2 was lost, the delta of seq 3 is dropped and the book is read from REST
+    channel.send(price_change(token_id, 3, ("SELL", 0.01, 4)))
+    assert wait_until(lambda: stream.resyncs == [token_id])
+    rest = exchange.summary(token_id)
+    assert stream.best_ask(token_id) == (float(rest.asks[-1].price), float(rest.asks[-1].size))
+    assert stream.is_synced(token_id)
+    # The sequence restarts from the next message
+    channel.send(price_change(token_id, 7, ("SELL", 0.01, 5)))
+    assert wait_until(lambda: stream.best_ask(token_id) == (0.01, 5))
+    assert stream.resyncs == [token_id]
+
+
+def test_out_of_order_timestamp_resyncs(slots, channel, stream):
+    token_id = slots[0].down_token
+    snapshot_ts = stream.last_ts[token_id]
+    channel.send({**price_change(token_id, 1, ("SELL", 0.02, 3)), "timestamp": str(snapshot_ts + 2000)})
+    assert wait_until(lambda: stream.best_ask(token_id) == (0.02, 3))
+    channel.send({**price_change(token_id, 2, ("SELL", 0.01, 4)), "timestamp": str(snapshot_ts + 1000)})
+    assert wait_until(lambda: stream.resyncs == [token_id])
+
+
+def test_tokens_are_added_and_removed_on_the_open_connection(slots, channel, stream):
+    old, new = slots
+    channel.send(price_change(old.up_token, 1, ("SELL", 0.02, 3)))
+    assert wait_until(lambda: stream.best_ask(old.up_token) == (0.02, 3))
+    [connection] = channel.subscribers
+
+    stream.add_tokens([new.up_token, new.down_token])
+    assert wait_until(lambda: stream.is_synced(new.up_token) and stream.is_synced(new.down_token))
+    # No reconnect: the delta applied to the book of an old token is still there
+    assert list(channel.subscribers) == [connection]
+    assert channel.subscriptions == 2
+    assert stream.is_synced(old.up_token)
+    assert stream.best_ask(old.up_token) == (0.02, 3)
+    assert stream.resyncs == []
+
+    stream.remove_tokens([old.up_token, old.down_token])
+    assert wait_until(lambda: channel.subscribers[connection] == [new.up_token, new.down_token])
+    assert set(stream.books) == set(stream.synced) == set(stream.last_seq) == set(stream.last_ts) == {
+        new.up_token, new.down_token}
+    assert stream.token_ids == [new.up_token, new.down_token]
+    # Late messages of a removed token are ignored
+    channel.send(price_change(old.up_token, 2, ("SELL", 0.01, 4)))
+    channel.send(price_change(new.up_token, 1, ("SELL", 0.02, 3)))
+    assert wait_until(lambda: stream.best_ask(new.up_token) == (0.02, 3))
+    assert old.up_token not in stream.books
+    assert stream.resyncs == []
@@ -0,0 +1,85 @@
+"""NonceManager receipt, gap and replacement handling against a stub node."""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+from web3.exceptions import TransactionNotFound
+
+from bot.nonce_manager import NonceManager, PendingTx
+from bot.simulator import SimClock
+
+
+class StubEth:
+    def __init__(self, counts):
+        self.counts = list(counts)
+        self.mined = {}
+        self.sent = []
+        self.account = SimpleNamespace(sign_transaction=self.sign)
+
+    def sign(self, tx, pk):
+        return SimpleNamespace(raw_transaction=f"0x{tx['nonce']:x}-{tx['maxFeePerGas']}")
+
+    def send_raw_transaction(self, raw):
+        self.sent.append(raw)
+        return raw
+
+    def get_transaction_count(self, addr, block):
+        return self.counts.pop(0) if len(self.counts) > 1 else self.counts[0]
+
+    def get_transaction_receipt(self, txid):
+        if txid not in self.mined:
+            raise TransactionNotFound(txid)
+        return SimpleNamespace(status=self.mined[txid])
+
+
+def manager(eth):
+    web3 = SimpleNamespace(eth=eth, to_hex=lambda value: value)
+    return NonceManager(web3, "0xabc", "pk", 137)
+
+
+def track(nonces, nonce):
+    ptx = PendingTx(nonce, {"maxFeePerGas": 100, "maxPriorityFeePerGas": 10}, f"tx {nonce}")
+    nonces._broadcast(ptx)
+    nonces.pending[nonce] = ptx
+    return ptx
+
+
+@pytest.fixture
+def clock():
+    clock = SimClock(1_700_000_000)
+    with clock.install():
+        yield clock
+
+
+def test_no_gap_fill_for_a_nonce_mined_during_the_check(clock):
+    # The node reports nonce 4 unmined, then it gets mined before the receipts are read
+    eth = StubEth([4, 5])
+    nonces = manager(eth)
+    first, second = track(nonces, 4), track(nonces, 5)
+    eth.mined[first.txids[-1]] = 1
+    nonces._check([first, second])
+    assert first.status is True
+    assert list(nonces.pending) == [5]
+    assert len(eth.sent) == 2
+
+
+def test_gap_fill_is_tracked_and_replaced(clock):
+    eth = StubEth([3])
+    nonces = manager(eth)
+    later = track(nonces, 4)
+    nonces._check([later])
+    gap = nonces.pending[3]
+    assert len(eth.sent) == 2
+    # Filled once, the next check does not send it again
+    nonces._check(sorted(nonces.pending.values(), key=lambda item: item.nonce))
+    assert len(eth.sent) == 2
+    time.sleep(NonceManager.REPLACE_AFTER + 1)
+    nonces._check(sorted(nonces.pending.values(), key=lambda item: item.nonce))
+    assert len(gap.txids) == 2
+    assert gap.tx["maxFeePerGas"] > 100
+    eth.mined[gap.txids[-1]] = 1
+    eth.counts = [4]
+    nonces._check([gap, later])
+    assert gap.status is True
+    assert list(nonces.pending) == [4]
@@ -0,0 +1,63 @@
+"""Upstream circuit breaker on a SimClock."""
+
+import time
+
+import pytest
+import requests
+
+from bot.rate_limit import RateLimited, Upstream
+from bot.simulator import SimClock
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def fail(upstream: Upstream, error: BaseException, times: int) -> None:
+    for _ in range(times):
+        with pytest.raises(type(error)):
+            with upstream.call():
+                raise error
+
+
+@pytest.fixture
+def clock():
+    clock = SimClock(1_700_000_000)
+    with clock.install():
+        yield clock
+
+
+def test_half_open_probe_may_wait_for_its_token(clock):
+    upstream = Upstream("x", 0.8, 1)
+    fail(upstream, http_error(429), 1)
+    assert upstream.state == Upstream.OPEN
+    time.sleep(upstream.retry_in())
+    # The bucket is still short of a token, the probe waits for it instead of refusing itself
+    started = time.monotonic()
+    upstream.acquire()
+    assert time.monotonic() > started
+    assert upstream.state == Upstream.HALF_OPEN
+    with pytest.raises(RateLimited):
+        upstream.acquire()
+    upstream.on_success(0.01)
+    assert upstream.state == Upstream.CLOSED
+
+
+def test_client_errors_do_not_open_the_circuit(clock):
+    upstream = Upstream("x", 100, 100)
+    fail(upstream, http_error(400), 2 * Upstream.FAILURES)
+    assert upstream.state == Upstream.CLOSED
+    assert upstream.failures == 0
+
+
+@pytest.mark.parametrize("error", [http_error(500), http_error(503), requests.ConnectionError("reset")])
+def test_server_and_transport_errors_open_the_circuit(clock, error):
+    upstream = Upstream("x", 100, 100)
+    fail(upstream, error, Upstream.FAILURES - 1)
+    assert upstream.state == Upstream.CLOSED
+    fail(upstream, error, 1)
+    assert upstream.state == Upstream.OPEN
+    with pytest.raises(RateLimited):
+        upstream.acquire()
@@ -0,0 +1,110 @@
+"""PairCostPolicy on PairSignals against the pair-cost formulas it replaced."""
+
+import random
+
+import pytest
+
+from bot.market import OrderBook
+from bot.signals import PairCostPolicy, PairSignals
+
+SIZE = 5.0
+THRESHOLD = 1.5
+
+
+def book(*asks) -> OrderBook:
+    result = OrderBook()
+    result.reset([], asks)
+    return result
+
+
+def baseline_tick(position: list, up_book: OrderBook, down_book: OrderBook, size: float = SIZE) -> tuple[bool, bool]:
+    """
+    One tick of the original TradeStrategy.trade(): every buy has to lower the pair
+    cost the tick started with, DOWN is judged after UP's fill.
+    """
+    up_spent, down_spent, up_amount, down_amount = position
+    pair_cost = up_spent / up_amount + down_spent / down_amount
+    up_price, up_limit = up_book.buy_vwap(size)
+    buy_up = (bool(up_limit)
+              and (up_spent + up_price * size) / (up_amount + size) + down_spent / down_amount < pair_cost
+              and up_amount < THRESHOLD * down_amount)
+    if buy_up:
+        up_spent += up_price * size
+        up_amount += size
+    down_price, down_limit = down_book.buy_vwap(size)
+    buy_down = (bool(down_limit)
+                and up_spent / up_amount + (down_spent + size * down_price) / (down_amount + size) < pair_cost
+                and down_amount < THRESHOLD * up_amount)
+    if buy_down:
+        down_spent += down_price * size
+        down_amount += size
+    position[:] = [up_spent, down_spent, up_amount, down_amount]
+    return buy_up, buy_down
+
+
+def policy_tick(signals: PairSignals, policy: PairCostPolicy, up_book: OrderBook,
+                down_book: OrderBook) -> tuple[bool, bool]:
+    """
+    The same tick the way TradeStrategy.trade() runs it now.
+    """
+    size = signals.order_size
+    signals.start_tick()
+    up_price, up_limit = up_book.buy_vwap(size)
+    signals.quote("up", up_price, up_limit)
+    buy_up = policy.buy_up(signals)
+    if buy_up:
+        signals.add_fill("up", size, up_price * size)
+    down_price, down_limit = down_book.buy_vwap(size)
+    signals.quote("down", down_price, down_limit)
+    buy_down = policy.buy_down(signals)
+    if buy_down:
+        signals.add_fill("down", size, down_price * size)
+    return buy_up, buy_down
+
+
+def random_book(rng: random.Random) -> OrderBook:
+    if rng.random() < 0.1:
+        # Too thin to fill the order
+        return book((round(rng.uniform(0.05, 0.95), 3), SIZE / 2))
+    return book(*[(round(rng.uniform(0.05, 0.95), 3), round(rng.uniform(1.0, 8.0), 2))
+                  for _ in range(rng.randint(1, 3))])
+
+
+def pair(up_spent: float, down_spent: float, up_amount: float, down_amount: float, size: float = SIZE):
+    position = [up_spent, down_spent, up_amount, down_amount]
+    signals = PairSignals(size)
+    signals.set_position(*position)
+    return position, signals
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_decisions_on_random_books(seed):
+    rng = random.Random(seed)
+    policy = PairCostPolicy(THRESHOLD)
+    position, signals = pair(SIZE * 0.5, SIZE * 0.48, SIZE, SIZE)
+    buys = 0
+    for _ in range(2000):
+        up_book, down_book = random_book(rng), random_book(rng)
+        decisions = baseline_tick(position, up_book, down_book)
+        assert policy_tick(signals, policy, up_book, down_book) == decisions
+        buys += sum(decisions)
+        assert [signals.up_spent, signals.down_spent, signals.up_amount, signals.down_amount] == pytest.approx(position)
+    assert buys > 0
+
+
+@pytest.mark.parametrize("up_price, bought", [(0.599, True), (0.6, False), (0.601, False)])
+def test_up_is_bought_below_its_average_price(up_price, bought):
+    position, signals = pair(6.0, 4.5, 10.0, 10.0)
+    up_book, down_book = book((up_price, 100.0)), book((0.9, 100.0))
+    assert baseline_tick(position, up_book, down_book)[0] is bought
+    assert policy_tick(signals, PairCostPolicy(THRESHOLD), up_book, down_book)[0] is bought
+
+
+def test_down_is_judged_against_the_pair_cost_the_tick_started_with():
+    # UP at 0.4 takes the pair cost from 1.05 to 0.95, DOWN at 0.5 then brings it to 0.975
+    position, signals = pair(6.0, 4.5, 10.0, 10.0, size=10.0)
+    up_book, down_book = book((0.4, 100.0)), book((0.5, 100.0))
+    assert baseline_tick(position, up_book, down_book, size=10.0) == (True, True)
+    assert policy_tick(signals, PairCostPolicy(THRESHOLD), up_book, down_book) == (True, True)
+    # Against the pair cost after UP's fill, DOWN would not have been bought
+    assert (signals.tick_pair_cost, signals.pair_cost) == (pytest.approx(1.05), pytest.approx(0.975))
@@ -0,0 +1,125 @@
+"""StateStore snapshot and journal recovery."""
+
+import json
+
+import pytest
+
+from bot.pnl import PnL
+from bot.state_store import SessionState, StateStore
+from bot.trade_strategy import TradeStrategy
+
+
+def position(up_spent: float, down_spent: float, up_amount: float, down_amount: float) -> TradeStrategy:
+    strategy = TradeStrategy(None, 5.0, 1.0, 1.0)
+    strategy.restore(up_spent, down_spent, up_amount, down_amount)
+    return strategy
+
+
+def write_journal(directory, *events) -> None:
+    with open(directory / "journal.jsonl", "a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def reload(directory) -> SessionState:
+    store = StateStore(str(directory))
+    store.close()
+    return store.state
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_replays_snapshot_and_journal(tmp_path, store):
+    store.slot_opened("a", 900)
+    store.fill("a", "up", 5.0, 2.5)
+    store.fill("a", "down", 5.0, 2.0)
+    store.slot_closed("a", position(2.5, 2.0, 5.0, 5.0))
+    # Write the snapshot the close asked for before more events come in
+    store._flush()
+    store.slot_opened("b", 1800)
+    store.fill("b", "up", 5.0, 2.4)
+    store.settled("a", 5.0)
+    store.close()
+    # The events after the snapshot are only in the journal
+    assert json.loads((tmp_path / "snapshot.json").read_text())["seq"] == 4
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 3
+
+    state = reload(tmp_path)
+    assert state.seq == 7
+    assert state.profit == pytest.approx(0.5)
+    assert state.max_spent == pytest.approx(4.5)
+    assert state.pending == {}
+    assert (state.slot.condition_id, state.slot.up_amount, state.slot.up_spent) == ("b", 5.0, 2.4)
+
+
+def test_truncates_a_torn_last_line(tmp_path):
+    write_journal(tmp_path, {"type": "slot_open", "condition_id": "a", "start": 900, "seq": 1},
+                  {"type": "fill", "condition_id": "a", "leg": "up", "size": 5.0, "cost": 2.5, "seq": 2})
+    intact = (tmp_path / "journal.jsonl").stat().st_size
+    with open(tmp_path / "journal.jsonl", "a") as f:
+        f.write('{"type": "fill", "condition_id": "a", "le')
+
+    store = StateStore(str(tmp_path))
+    assert store.state.seq == 2
+    assert (tmp_path / "journal.jsonl").stat().st_size == intact
+    # New events start on a line of their own
+    store.fill("a", "down", 5.0, 2.0)
+    store.close()
+    state = reload(tmp_path)
+    assert state.seq == 3
+    assert (state.slot.up_amount, state.slot.down_amount) == (5.0, 5.0)
+
+
+def test_skips_events_covered_by_the_snapshot(tmp_path):
+    (tmp_path / "snapshot.json").write_text(json.dumps({
+        "seq": 2, "profit": 0.0, "max_spent": 0.0, "min_profit": 0.0, "max_profit": 0.0, "pending": {},
+        "slot": {"condition_id": "a", "start": 900, "up_spent": 2.5, "down_spent": 0.0,
+                 "up_amount": 5.0, "down_amount": 0.0},
+    }))
+    # A crash between writing the snapshot and emptying the journal leaves its events behind
+    write_journal(tmp_path, {"type": "slot_open", "condition_id": "a", "start": 900, "seq": 1},
+                  {"type": "fill", "condition_id": "a", "leg": "up", "size": 5.0, "cost": 2.5, "seq": 2},
+                  {"type": "fill", "condition_id": "a", "leg": "down", "size": 5.0, "cost": 2.0, "seq": 3})
+
+    state = reload(tmp_path)
+    assert state.seq == 3
+    assert (state.slot.up_amount, state.slot.up_spent) == (5.0, 2.5)
+    assert (state.slot.down_amount, state.slot.down_spent) == (5.0, 2.0)
+
+
+def test_resumes_the_open_slot(tmp_path, store):
+    store.slot_opened("a", 900)
+    store.fill("a", "up", 5.0, 2.5)
+    store.fill("a", "down", 5.0, 2.0)
+    store.close()
+
+    store = StateStore(str(tmp_path))
+    resumed = store.resume(PnL(), 900)
+    assert resumed.condition_id == "a"
+    strategy = TradeStrategy(None, 5.0, 1.0, 1.0)
+    store.track("a", 900, strategy, resumed)
+    assert (strategy.up_amount, strategy.down_amount, strategy.spent()) == (5.0, 5.0, pytest.approx(4.5))
+    # Resuming does not open the slot again, later fills add to it
+    strategy.on_up_fill(0.4, 5.0)
+    assert store.state.seq == 4
+    assert store.open_slot().up_amount == 10.0
+    store.close()
+
+
+def test_books_an_open_slot_that_ended_while_down(tmp_path, store):
+    store.slot_opened("a", 900)
+    store.fill("a", "up", 5.0, 2.5)
+    store.close()
+
+    store = StateStore(str(tmp_path))
+    pnl = PnL()
+    assert store.resume(pnl, 1800) is None
+    assert store.open_slot() is None
+    assert pnl.profit == pytest.approx(-2.5)
+    assert pnl.pending == {"a": (5.0, 0.0)}
+    store.close()